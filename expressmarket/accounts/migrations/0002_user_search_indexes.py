@@ -0,0 +1,18 @@
+from django.db import migrations
+
+from core_ecommerce.pgindexes import trigram_index
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    # Order admin searches by customer username and email (see core_ecommerce/admin.py)
+    operations = [
+        trigram_index('accounts_user_username_trgm', 'accounts_user', 'UPPER("username")'),
+        trigram_index('accounts_user_email_trgm', 'accounts_user', 'UPPER("email")'),
+    ]
@@ -1,3 +1,46 @@
+from django.contrib.auth.tokens import default_token_generator
 from django.test import TestCase
+from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
 
-# Create your tests here.
+from core_ecommerce.testing import QueryBudgetMixin, make_customer
+
+
+class AccountsQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.customer = make_customer()
+        self.customer.set_password('pass12345')
+        self.customer.save()
+
+    def test_anonymous_pages(self):
+        for name in ('accounts:user_type', 'accounts:login', 'accounts:password_reset',
+                     'accounts:password_reset_done', 'accounts:password_reset_complete'):
+            with self.subTest(name=name):
+                self.assertWithinBudget(name, lambda: self.client.get(reverse(name)))
+
+    def test_register(self):
+        self.client.post(reverse('accounts:user_type'), {'user_type': 'customer'})
+        self.assertWithinBudget('accounts:register', lambda: self.client.get(reverse('accounts:register')))
+
+    def test_login_and_logout(self):
+        response = self.assertWithinBudget(
+            'accounts:login',
+            lambda: self.client.post(reverse('accounts:login'), {
+                'username': self.customer.username,
+                'password': 'pass12345',
+            }),
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertWithinBudget('accounts:logout', lambda: self.client.get(reverse('accounts:logout')))
+
+    def test_password_reset(self):
+        self.assertWithinBudget(
+            'accounts:password_reset',
+            lambda: self.client.post(reverse('accounts:password_reset'), {'email': self.customer.email}),
+        )
+        url = reverse('accounts:password_reset_confirm', args=[
+            urlsafe_base64_encode(force_bytes(self.customer.pk)),
+            default_token_generator.make_token(self.customer),
+        ])
+        self.assertWithinBudget('accounts:password_reset_confirm', lambda: self.client.get(url))
@@ -1,21 +1,127 @@
+import re
+
+from django.conf import settings
 from django.contrib import admin
-from .models import Order, OrderItem
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.http import HttpResponseBadRequest
+from django.urls import path
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from accounts.models import User
+from product.models import Product
+from .models import ChangeEvent, EventSubscriber, Order, OrderItem, Task, VendorOrder
+from .exports import parse_export_filters, streaming_export
+
+
+# Order numbers are generated as 10 uppercase letters/digits (see Order.save)
+ORDER_NUMBER_RE = re.compile(r'^[A-Za-z0-9]{10}$')
+
+
+def estimated_row_count(queryset):
+    """
+    Return the planner's row estimate for an unfiltered queryset, or None.
+    Only available on PostgreSQL, where it is read from pg_class statistics.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql' or queryset.query.where:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that skips COUNT(*) on large unfiltered tables"""
+    estimate_threshold = 10000
+
+    @cached_property
+    def count(self):
+        estimate = estimated_row_count(self.object_list)
+        if estimate is not None and estimate >= self.estimate_threshold:
+            return estimate
+        return super().count
+
+
+class ScalableAdminMixin:
+    """
+    Changelist settings for tables that are too large for Django's defaults.
+    Disabled by setting ADMIN_SCALABILITY_MODE = False.
+    """
+    order_number_lookup = 'order_number'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if getattr(settings, 'ADMIN_SCALABILITY_MODE', True):
+            self.paginator = EstimatedCountPaginator
+            self.show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        if not getattr(settings, 'ADMIN_SCALABILITY_MODE', True):
+            return super().get_search_results(request, queryset, search_term)
+
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+
+        # Fast path: an exact order number hits the unique index directly
+        if ORDER_NUMBER_RE.match(search_term):
+            matches = queryset.filter(**{self.order_number_lookup: search_term.upper()})
+            if matches.exists():
+                return matches, False
+
+        search_filter = self.get_search_filter(search_term)
+        if search_filter is None:
+            return super().get_search_results(request, queryset, search_term)
+        # Prefix searches on indexed columns; related tables are searched
+        # through subqueries so no join (or DISTINCT) is needed.
+        return queryset.filter(search_filter), False
+
+    def get_search_filter(self, search_term):
+        """A Q for the search term, or None for Django's search over search_fields"""
+        return None
 
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
-    readonly_fields = ('product', 'quantity', 'price', 'subtotal')
+    fields = ('product', 'quantity', 'price', 'subtotal')
+    readonly_fields = fields
     extra = 0
     can_delete = False
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
+
+
+class VendorOrderInline(admin.TabularInline):
+    model = VendorOrder
+    fields = ('vendor', 'status', 'quantity', 'subtotal', 'updated_at')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('vendor')
+
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = ('order_number', 'customer', 'status', 'total', 'created_at')
     list_filter = ('status', 'created_at')
+    list_select_related = ('customer',)
     search_fields = ('order_number', 'customer__username', 'customer__email', 'email')
-    readonly_fields = ('order_number', 'created_at', 'updated_at')
-    inlines = [OrderItemInline]
+    search_help_text = 'Order number, or the start of a username or email address'
+    raw_id_fields = ('customer',)
+    # The status is rolled up from the vendor orders (see VendorOrder.set_status)
+    readonly_fields = ('order_number', 'status', 'created_at', 'updated_at')
+    inlines = [VendorOrderInline, OrderItemInline]
     fieldsets = (
         ('Order Information', {
             'fields': ('order_number', 'customer', 'status')
@@ -37,10 +143,103 @@ class OrderAdmin(admin.ModelAdmin):
         }),
     )
 
+    export_columns = {
+        'order_number': 'order_number',
+        'order_date': 'created_at',
+        'status': 'status',
+        'customer_id': 'customer_id',
+        'email': 'email',
+        'city': 'city',
+        'country': 'country',
+        'subtotal': 'subtotal',
+        'shipping_cost': 'shipping_cost',
+        'total': 'total',
+    }
+
+    def get_urls(self):
+        urls = [
+            path(
+                'export/',
+                self.admin_site.admin_view(self.export_view),
+                name='core_ecommerce_order_export',
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def export_view(self, request):
+        """Stream orders as CSV or JSON Lines, filtered by ?start, ?end and ?status"""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            filters = parse_export_filters(request.GET)
+        except ValueError as error:
+            return HttpResponseBadRequest(str(error))
+        orders = Order.objects.filter(**filters).order_by('created_at', 'id')
+        return streaming_export(orders, self.export_columns, request.GET.get('format', 'csv'), 'orders')
+
+    def get_search_filter(self, search_term):
+        customers = User.objects.filter(
+            Q(username__istartswith=search_term) | Q(email__istartswith=search_term)
+        ).values('pk')
+        return Q(email__istartswith=search_term) | Q(customer__in=customers)
+
 
 @admin.register(OrderItem)
-class OrderItemAdmin(admin.ModelAdmin):
+class OrderItemAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = ('order', 'product', 'quantity', 'price', 'subtotal')
     list_filter = ('order__status', 'order__created_at')
+    list_select_related = ('order__customer', 'product')
     search_fields = ('order__order_number', 'product__name')
-    readonly_fields = ('order', 'product', 'quantity', 'price', 'subtotal')
+    search_help_text = 'Order number, or the start of a product name'
+    readonly_fields = ('order', 'vendor_order', 'product', 'quantity', 'price', 'subtotal')
+    order_number_lookup = 'order__order_number'
+
+    def get_search_filter(self, search_term):
+        # Archived products are still in old orders
+        products = Product.all_objects.filter(name__istartswith=search_term).values('pk')
+        return Q(product__in=products)
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'priority', 'attempts', 'run_after', 'locked_by')
+    list_filter = ('status', 'name')
+    readonly_fields = (
+        'name', 'args', 'kwargs', 'key', 'priority', 'status', 'attempts', 'max_attempts',
+        'run_after', 'locked_by', 'locked_until', 'last_error', 'created_at', 'updated_at',
+    )
+    actions = ['retry_now']
+
+    @admin.action(description='Retry selected tasks now')
+    def retry_now(self, request, queryset):
+        count = queryset.filter(status=Task.FAILED).update(
+            status=Task.QUEUED, attempts=0, run_after=timezone.now(),
+        )
+        self.message_user(request, f'{count} failed tasks queued again.')
+
+
+@admin.register(EventSubscriber)
+class EventSubscriberAdmin(admin.ModelAdmin):
+    list_display = ('name', 'url', 'is_active', 'last_event_id', 'failures', 'retry_after', 'last_delivered_at')
+    list_filter = ('is_active',)
+    readonly_fields = ('last_event_id', 'locked_by', 'locked_until', 'failures', 'retry_after', 'last_error', 'last_delivered_at', 'created_at')
+    actions = ['retry_now']
+
+    @admin.action(description='Retry selected subscribers now')
+    def retry_now(self, request, queryset):
+        count = queryset.update(retry_after=None)
+        self.message_user(request, f'{count} subscribers will be retried on the next dispatch.')
+
+
+@admin.register(ChangeEvent)
+class ChangeEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'topic', 'object_id', 'created_at')
+    list_filter = ('topic',)
+    search_fields = ('=object_id',)
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,115 @@
+from collections import defaultdict
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core_ecommerce.models import Order, OrderItem, ArchivedOrder, VendorOrder
+
+
+# Only orders that can no longer change are moved to the archive
+ARCHIVABLE_STATUSES = ['delivered', 'cancelled']
+
+
+def archive_cutoff(days=None):
+    """Orders created before the returned datetime are eligible for archival"""
+    if days is None:
+        days = getattr(settings, 'ORDER_ARCHIVE_AFTER_DAYS', 365)
+    return timezone.now() - timedelta(days=days)
+
+
+def month_bounds(moment):
+    """Return (start, end) datetimes of the calendar month containing moment"""
+    start = moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    if start.month == 12:
+        end = start.replace(year=start.year + 1, month=1)
+    else:
+        end = start.replace(month=start.month + 1)
+    return start, end
+
+
+def ensure_archive_partition(moment):
+    """Create the monthly archive partition for moment (PostgreSQL only)"""
+    if connection.vendor != 'postgresql':
+        return
+    start, end = month_bounds(moment.astimezone(dt_timezone.utc))
+    table = ArchivedOrder._meta.db_table
+    partition = f'{table}_y{start.year}m{start.month:02d}'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS "{partition}" PARTITION OF "{table}" '
+            f'FOR VALUES FROM (%s) TO (%s)',
+            [start, end],
+        )
+
+
+def _archive_item(item):
+    return {
+        'product_id': item.product_id,
+        'product_name': item.product.name,
+        'product_slug': item.product.slug,
+        'quantity': item.quantity,
+        'price': str(item.price),
+        'subtotal': str(item.subtotal),
+    }
+
+
+def archive_batch(cutoff, batch_size=1000):
+    """
+    Move up to batch_size archivable orders created before cutoff into
+    ArchivedOrder, in a single transaction. Returns the number moved.
+    """
+    with transaction.atomic():
+        orders = list(
+            Order.objects
+            .filter(status__in=ARCHIVABLE_STATUSES, created_at__lt=cutoff)
+            .order_by('created_at', 'id')
+            .select_for_update(skip_locked=True)[:batch_size]
+        )
+        if not orders:
+            return 0
+
+        order_ids = [order.id for order in orders]
+        items_by_order = defaultdict(list)
+        for item in OrderItem.objects.filter(order_id__in=order_ids).select_related('product').order_by('id'):
+            items_by_order[item.order_id].append(_archive_item(item))
+
+        months = {month_bounds(order.created_at.astimezone(dt_timezone.utc))[0] for order in orders}
+        for month in months:
+            ensure_archive_partition(month)
+
+        ArchivedOrder.objects.bulk_create(
+            [
+                ArchivedOrder(
+                    id=order.id,
+                    customer_id=order.customer_id,
+                    order_number=order.order_number,
+                    status=order.status,
+                    first_name=order.first_name,
+                    last_name=order.last_name,
+                    email=order.email,
+                    phone=order.phone,
+                    shipping_address=order.shipping_address,
+                    billing_address=order.billing_address,
+                    city=order.city,
+                    region=order.region,
+                    postal_code=order.postal_code,
+                    country=order.country,
+                    subtotal=order.subtotal,
+                    shipping_cost=order.shipping_cost,
+                    total=order.total,
+                    items=items_by_order[order.id],
+                    created_at=order.created_at,
+                    updated_at=order.updated_at,
+                )
+                for order in orders
+            ],
+            ignore_conflicts=True,
+        )
+
+        OrderItem.objects.filter(order_id__in=order_ids).delete()
+        VendorOrder.objects.filter(order_id__in=order_ids).delete()
+        Order.objects.filter(id__in=order_ids).delete()
+
+    return len(orders)
@@ -0,0 +1,329 @@
+"""
+End-to-end benchmarks for the hot storefront and dashboard views.
+
+Each view is driven through the Django test client against a seeded
+database. Timings are collected without tracing; peak memory is measured
+in a separate traced request so tracemalloc's overhead doesn't skew them.
+Views are measured with the page cache off, so every request renders;
+the anonymous ones are measured again with it on, as page cache hits.
+"""
+import math
+from contextlib import nullcontext
+import random
+import subprocess
+import time
+import tracemalloc
+
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import caches
+from django.db import connection, reset_queries
+from django.db.models import Count
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from core_ecommerce.models import Cart, Order
+from core_ecommerce.pagecache import page_cache
+from core_ecommerce.views import HomeView
+from product.cards import card_key, local_cards
+from product.fuzzy import TrigramIndex
+from product.models import Category, Product, SearchTerm
+from vendor.models import Vendor
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(samples)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class ViewBenchmark:
+    """A named GET request, made by an optional user with an optional {product_id: quantity} cart"""
+
+    def __init__(self, name, url, user=None, cart=None):
+        self.name = name
+        self.url = url
+        self.user = user
+        self.cart = cart
+
+    def client(self):
+        client = Client()
+        if self.cart:
+            cart, _ = Cart.objects.get_or_create(user=self.user)
+            cart.clear()
+            cart.add_quantities(self.cart)
+        if self.user is not None:
+            # Logging in picks up the user's cart
+            client.force_login(self.user)
+        return client
+
+
+def default_benchmarks(cart_lines=10):
+    """Pick representative (mostly the heaviest) objects from the seeded data"""
+    product = (
+        Product.objects.annotate(review_count=Count('productreview'))
+        .order_by('-review_count', 'id').first()
+    )
+    customer = (
+        User.objects.filter(user_type='customer')
+        .annotate(order_count=Count('orders'))
+        .order_by('-order_count', 'id').first()
+    )
+    vendor = (
+        Vendor.objects.annotate(product_count=Count('product'))
+        .order_by('-product_count', 'id').select_related('user').first()
+    )
+    cart = {
+        product_id: 1
+        for product_id in Product.objects.order_by('id').values_list('id', flat=True)[:cart_lines]
+    }
+
+    return [
+        ViewBenchmark('HomeView', reverse('core_ecommerce:home')),
+        ViewBenchmark('ProductDetailView', reverse('product:product_detail', args=[product.slug])),
+        ViewBenchmark('CartView', reverse('core_ecommerce:cart'), user=customer, cart=cart),
+        ViewBenchmark('CheckoutView', reverse('core_ecommerce:checkout'), user=customer, cart=cart),
+        ViewBenchmark('MyOrdersView', reverse('core_ecommerce:my_orders'), user=customer),
+        ViewBenchmark('VendorDashboardView', reverse('vendor:vendor_dashboard'), user=vendor.user),
+    ]
+
+
+def run_benchmark(benchmark, iterations=20, warmup=2, cached=False):
+    """Measure one view; unless `cached`, with the page cache off so the view itself is timed"""
+    with nullcontext() if cached else override_settings(PAGE_CACHE_TIMEOUT=0):
+        return _run_benchmark(benchmark, iterations, warmup)
+
+
+def _run_benchmark(benchmark, iterations, warmup):
+    client = benchmark.client()
+
+    for _ in range(warmup):
+        client.get(benchmark.url)
+
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        response = client.get(benchmark.url)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    reset_queries()
+    with CaptureQueriesContext(connection) as queries:
+        client.get(benchmark.url)
+    # Read now: the captured list is a view on a log the next request resets
+    query_count = len(queries)
+
+    tracemalloc.start()
+    try:
+        client.get(benchmark.url)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'url': benchmark.url,
+        'status': response.status_code,
+        'p50_ms': round(percentile(timings, 50), 2),
+        'p99_ms': round(percentile(timings, 99), 2),
+        'mean_ms': round(sum(timings) / len(timings), 2),
+        'queries': query_count,
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def run_suite(benchmarks, iterations=20, meta=None):
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'database': connection.vendor,
+            'iterations': iterations,
+            'created_at': timezone.now().isoformat(),
+            'orders': Order.objects.count(),
+            'products': Product.objects.count(),
+        },
+        'views': {},
+    }
+    report['meta'].update(meta or {})
+    for benchmark in benchmarks:
+        report['views'][benchmark.name] = run_benchmark(benchmark, iterations=iterations)
+        if benchmark.user is None and page_cache.timeout > 0:
+            report['views'][f'{benchmark.name} (page cache)'] = run_benchmark(
+                benchmark, iterations=iterations, cached=True,
+            )
+    return report
+
+
+def card_fragment_benchmark(iterations=20):
+    """
+    Time HomeView.get() (12 cards per category, no page cache or conditional
+    GET in front) with an empty card cache and with a warm one.
+    """
+    request = RequestFactory().get(reverse('core_ecommerce:home'))
+    request.user = AnonymousUser()
+    request.session = SessionStore()
+
+    # Only the cards should be cold, so drop their keys rather than clearing the cache
+    card_keys = [card_key(product, 'card') for product in Product.objects.select_related('category', 'vendor__user')]
+
+    def render(cold):
+        if cold:
+            caches['default'].delete_many(card_keys)
+            local_cards.clear()
+        started = time.perf_counter()
+        HomeView().get(request)
+        return (time.perf_counter() - started) * 1000
+
+    render(cold=False)
+    cold = [render(cold=True) for _ in range(iterations)]
+    warm = [render(cold=False) for _ in range(iterations)]
+    cold_ms, warm_ms = percentile(cold, 50), percentile(warm, 50)
+    return {
+        'categories': Category.objects.filter(product__isnull=False).distinct().count(),
+        'cold_p50_ms': round(cold_ms, 2),
+        'warm_p50_ms': round(warm_ms, 2),
+        'saved_ms': round(cold_ms - warm_ms, 2),
+        'saved_pct': round((cold_ms - warm_ms) / cold_ms * 100, 1) if cold_ms else 0.0,
+    }
+
+
+# p99 a spelling correction may take: a small slice of the home page's own latency
+FUZZY_SEARCH_BUDGET_MS = 20
+
+SYLLABLES = [
+    consonant + vowel
+    for consonant in 'bcdfghjklmnprstvwz'
+    for vowel in 'aeiou'
+]
+
+
+def misspell(word, rng):
+    """`word` with one random insertion, deletion, substitution or transposition"""
+    i = rng.randrange(len(word))
+    letter = rng.choice('abcdefghijklmnopqrstuvwxyz')
+    edit = rng.randrange(4)
+    if edit == 0:
+        return word[:i] + letter + word[i:]
+    if edit == 1:
+        return word[:i] + word[i + 1:]
+    if edit == 2:
+        return word[:i] + letter + word[i + 1:]
+    i = min(i, len(word) - 2)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+def fuzzy_search_benchmark(vocabulary=250_000, queries=500, seed=42):
+    """
+    Time "did you mean" lookups in the in-process trigram index against a
+    synthetic vocabulary. Correction cost depends on the number of distinct
+    words in product names, not on the number of products; 250,000 words is
+    a generous vocabulary for a 1M-product catalog. Queries are vocabulary
+    words with one typo each.
+    """
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < vocabulary:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 5))))
+    words = sorted(words)
+    # Zipf-like usage counts, so ties go to the more common word
+    terms = [(word, max(1, int(100_000 / (rank + 1)))) for rank, word in enumerate(rng.sample(words, len(words)))]
+
+    started = time.perf_counter()
+    index = TrigramIndex(terms)
+    build_ms = (time.perf_counter() - started) * 1000
+    tracemalloc.start()
+    TrigramIndex(terms)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    samples = []
+    corrected = 0
+    for word in rng.sample(words, queries):
+        typo = misspell(word, rng)
+        started = time.perf_counter()
+        suggestion = index.closest(typo)
+        samples.append((time.perf_counter() - started) * 1000)
+        corrected += suggestion == word
+    p99 = percentile(samples, 99)
+    return {
+        'vocabulary': vocabulary,
+        'queries': queries,
+        'build_ms': round(build_ms, 1),
+        'index_memory_kb': round(peak / 1024, 1),
+        'p50_ms': round(percentile(samples, 50), 3),
+        'p99_ms': round(p99, 3),
+        'max_ms': round(max(samples), 3),
+        'corrected_pct': round(corrected / queries * 100, 1),
+        'budget_ms': FUZZY_SEARCH_BUDGET_MS,
+        'within_budget': p99 <= FUZZY_SEARCH_BUDGET_MS,
+    }
+
+
+def typo_search_benchmark(iterations=50, seed=42):
+    """
+    Time anonymous home page searches for misspelt words from the seeded
+    catalog's product names, end to end: the search that finds nothing,
+    the correction and the search for the corrected query. Every request
+    uses a different typo, so the page and search caches never answer it.
+    """
+    rng = random.Random(seed)
+    terms = list(
+        SearchTerm.objects.filter(word__regex=r'^[a-z]{5,}$')
+        .order_by('-product_count', 'word').values_list('word', flat=True)[:1000]
+    )
+    if not terms:
+        return None
+    url = reverse('core_ecommerce:home')
+    client = Client()
+    client.get(url, {'q': misspell(terms[0], rng)})
+
+    timings, query_counts, seen = [], [], set()
+    corrected = 0
+    while len(timings) < iterations and len(seen) < 10 * iterations:
+        word = rng.choice(terms)
+        typo = misspell(word, rng)
+        if typo in seen or SearchTerm.objects.filter(word=typo).exists():
+            continue
+        seen.add(typo)
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = client.get(url, {'q': typo})
+            timings.append((time.perf_counter() - started) * 1000)
+        query_counts.append(len(queries))
+        corrected += response.context['suggestion'] == word
+    if not timings:
+        return None
+    return {
+        'url': f'{url}?q=<typo>',
+        'requests': len(timings),
+        'p50_ms': round(percentile(timings, 50), 2),
+        'p99_ms': round(percentile(timings, 99), 2),
+        'mean_queries': round(sum(query_counts) / len(query_counts), 1),
+        'corrected_pct': round(corrected / len(timings) * 100, 1),
+    }
+
+
+def compare_reports(baseline, current):
+    """Yield (view, metric, before, after, change %) for metrics present in both"""
+    for name, result in current['views'].items():
+        before = baseline.get('views', {}).get(name)
+        if not before:
+            continue
+        for metric in ('p50_ms', 'p99_ms', 'queries', 'peak_memory_kb'):
+            old, new = before.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            change = ((new - old) / old * 100) if old else 0.0
+            yield name, metric, old, new, change
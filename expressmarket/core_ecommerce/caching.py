@@ -0,0 +1,368 @@
+"""
+Cache-aside storage for expensive view data.
+
+Values live in two tiers: a small in-process memory tier, kept for a few
+seconds (CACHE_LOCAL_TIMEOUT), in front of the shared Django cache. Each
+stored entry records when it logically expires and how long it took to
+compute. Readers start recomputing a little before expiry, with a
+probability that grows as expiry approaches, so hot keys are refreshed
+before they run out instead of all at once ("XFetch"). Only one caller
+recomputes a key at a time: a per-process lock serialises threads and a
+cache.add() lock in the shared tier serialises workers. Everyone else
+keeps getting the previous value, or waits briefly for the new one when
+there is none.
+
+Keys carry a schema version (bump CACHE_SCHEMA_VERSION when the shape of
+a cached payload changes) and a per-cache generation that clear() bumps,
+so a whole cache can be invalidated without knowing its keys.
+
+A replica may not have a change yet when its cache purge runs, so for
+REPLICA_STICKY_SECONDS after a purge rebuilds read from the primary
+(see rebuild_reads()).
+"""
+import math
+import random
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter, OrderedDict, defaultdict, namedtuple
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.core.cache import caches
+
+from core_ecommerce.routers import primary_reads, replica_configured
+from product.models import Category
+
+
+CACHE_KEY_PREFIX = 'em'
+CACHE_SCHEMA_VERSION = 2
+
+# How often each process adds its metric counters to the shared totals
+METRICS_FLUSH_SECONDS = 10
+
+METRIC_FIELDS = (
+    'local_hits', 'shared_hits', 'misses', 'rebuilds',
+    'early_rebuilds', 'stale_served', 'lock_waits',
+)
+
+Entry = namedtuple('Entry', 'value expires_at delta')
+
+
+class CacheMetrics:
+    """
+    Per-process hit/miss/rebuild counters. They are added to totals kept in
+    the shared cache every METRICS_FLUSH_SECONDS, where `manage.py
+    cache_stats` reads them for all workers together.
+    """
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+        self._lock = threading.Lock()
+        self._counts = defaultdict(Counter)
+        self._last_flush = time.monotonic()
+
+    def incr(self, name, field):
+        with self._lock:
+            self._counts[name][field] += 1
+            due = time.monotonic() - self._last_flush >= METRICS_FLUSH_SECONDS
+        if due:
+            self.flush()
+
+    def snapshot(self):
+        """Counters recorded by this process since the last flush"""
+        with self._lock:
+            return {name: dict(counts) for name, counts in self._counts.items()}
+
+    def flush(self):
+        with self._lock:
+            counts, self._counts = self._counts, defaultdict(Counter)
+            self._last_flush = time.monotonic()
+        shared = caches[self.alias]
+        for name, fields in counts.items():
+            for field, value in fields.items():
+                key = metric_key(name, field)
+                shared.add(key, 0, timeout=None)
+                try:
+                    shared.incr(key, value)
+                except ValueError:
+                    # Evicted between add() and incr()
+                    shared.set(key, value, timeout=None)
+
+    def totals(self, names):
+        """Shared totals for the given cache names, including this process"""
+        self.flush()
+        shared = caches[self.alias]
+        keys = {metric_key(name, field): (name, field) for name in names for field in METRIC_FIELDS}
+        found = shared.get_many(list(keys))
+        totals = {name: dict.fromkeys(METRIC_FIELDS, 0) for name in names}
+        for key, value in found.items():
+            name, field = keys[key]
+            totals[name][field] = value
+        return totals
+
+    def reset(self, names):
+        with self._lock:
+            self._counts.clear()
+        caches[self.alias].delete_many([metric_key(name, field) for name in names for field in METRIC_FIELDS])
+
+
+def metric_key(name, field):
+    return f'{CACHE_KEY_PREFIX}:metrics:{name}:{field}'
+
+
+def purged_key(name):
+    return f'{CACHE_KEY_PREFIX}:purged:{name}'
+
+
+def note_purge(shared, name):
+    """Record that cache `name` was just purged (see rebuild_reads())"""
+    if replica_configured():
+        shared.set(purged_key(name), 1, timeout=getattr(settings, 'REPLICA_STICKY_SECONDS', 10))
+
+
+def rebuild_reads(shared, name):
+    """
+    Context for recomputing an entry of cache `name`: reads go to the
+    primary if the cache was purged within REPLICA_STICKY_SECONDS, when the
+    replica may still hold the data from before the change
+    """
+    if replica_configured() and shared.get(purged_key(name)) is not None:
+        return primary_reads()
+    return nullcontext()
+
+
+metrics = CacheMetrics()
+
+
+class LocalTier:
+    """Small thread-safe LRU whose entries are dropped `timeout` seconds after being stored"""
+
+    def __init__(self, timeout, max_entries=1000):
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, stored_at = item
+            if time.monotonic() - stored_at >= self.timeout:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.timeout <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class CacheAside:
+    """
+    A named cache of computed values:
+
+        payload = product_cache.get(slug, compute=lambda: build_payload(slug))
+
+    `ttl` is how long a value is fresh; it is kept in the shared tier for
+    another `ttl` so it can be served while a replacement is computed.
+    `beta` scales early expiry: 0 disables it, larger values refresh earlier.
+    `local_entries` caps the memory tier, least recently used first out.
+    """
+    lock_stripes = 64
+    poll_interval = 0.05
+
+    def __init__(self, name, ttl, beta=1.0, lock_timeout=10, alias='default', local_timeout=None, local_entries=1000):
+        self.name = name
+        self.ttl = ttl
+        self.beta = beta
+        self.lock_timeout = lock_timeout
+        self.alias = alias
+        if local_timeout is None:
+            local_timeout = getattr(settings, 'CACHE_LOCAL_TIMEOUT', 5)
+        self.local = LocalTier(local_timeout, local_entries)
+        self._locks = [threading.Lock() for _ in range(self.lock_stripes)]
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def _generation_key(self):
+        return f'{CACHE_KEY_PREFIX}:gen:{self.name}'
+
+    def generation(self):
+        """Counter that clear() moves on; it changes whenever every key is invalidated"""
+        key = self._generation_key()
+        generation = self.local.get(key)
+        if generation is None:
+            generation = self.shared.get(key)
+            if generation is None:
+                self.shared.add(key, 1, timeout=None)
+                generation = self.shared.get(key, 1)
+            self.local.set(key, generation)
+        return generation
+
+    def key(self, *parts):
+        suffix = ':'.join(str(part) for part in parts)
+        return f'{CACHE_KEY_PREFIX}:v{CACHE_SCHEMA_VERSION}:{self.name}:g{self.generation()}:{suffix}'
+
+    def _lock_for(self, key):
+        return self._locks[zlib.crc32(key.encode()) % self.lock_stripes]
+
+    def _lookup(self, key):
+        """Return (entry, tier) from the first tier that has the key"""
+        entry = self.local.get(key)
+        if entry is not None:
+            return entry, 'local'
+        entry = self.shared.get(key)
+        if entry is not None:
+            self.local.set(key, entry)
+            return entry, 'shared'
+        return None, None
+
+    def _expires_early(self, entry, now):
+        if now >= entry.expires_at:
+            return True
+        if not self.beta:
+            return False
+        # XFetch: -log(u) is exponentially distributed, so the chance of an
+        # early refresh rises smoothly as expiry nears, scaled by how long
+        # the value takes to compute.
+        return now - entry.delta * self.beta * math.log(1.0 - random.random()) >= entry.expires_at
+
+    def get(self, *parts, compute):
+        key = self.key(*parts)
+        entry, tier = self._lookup(key)
+        if entry is not None and not self._expires_early(entry, time.time()):
+            metrics.incr(self.name, f'{tier}_hits')
+            return entry.value
+        return self._rebuild(key, entry, compute)
+
+    def _rebuild(self, key, stale, compute):
+        key_lock = self._lock_for(key)
+        # With a value to fall back on, never queue behind another thread
+        if not key_lock.acquire(blocking=stale is None):
+            metrics.incr(self.name, 'stale_served')
+            return stale.value
+
+        lock_key = f'{key}:lock'
+        token = None
+        try:
+            # Another thread may have finished a rebuild while we waited
+            entry, _ = self._lookup(key)
+            if (
+                entry is not None
+                and time.time() < entry.expires_at
+                and (stale is None or entry.expires_at > stale.expires_at)
+            ):
+                metrics.incr(self.name, 'shared_hits')
+                return entry.value
+            if stale is None:
+                metrics.incr(self.name, 'misses')
+
+            lock_token = uuid.uuid4().hex
+            if self.shared.add(lock_key, lock_token, timeout=self.lock_timeout):
+                token = lock_token
+            elif stale is not None:
+                # Another worker is rebuilding
+                metrics.incr(self.name, 'stale_served')
+                return stale.value
+            else:
+                metrics.incr(self.name, 'lock_waits')
+                entry = self._wait_for(key, lock_key)
+                if entry is not None:
+                    return entry.value
+
+            if stale is not None:
+                metrics.incr(self.name, 'early_rebuilds')
+            return self._compute_and_store(key, compute)
+        finally:
+            if token is not None and self.shared.get(lock_key) == token:
+                self.shared.delete(lock_key)
+            key_lock.release()
+
+    def _wait_for(self, key, lock_key):
+        """Poll the shared tier until another worker stores `key` or gives up its lock"""
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            entry = self.shared.get(key)
+            if entry is not None:
+                self.local.set(key, entry)
+                return entry
+            if self.shared.get(lock_key) is None:
+                break
+        return None
+
+    def _compute_and_store(self, key, compute):
+        started = time.monotonic()
+        with rebuild_reads(self.shared, self.name):
+            value = compute()
+        delta = time.monotonic() - started
+        metrics.incr(self.name, 'rebuilds')
+
+        entry = Entry(value, time.time() + self.ttl, delta)
+        self.shared.set(key, entry, timeout=self.ttl * 2)
+        self.local.set(key, entry)
+        return value
+
+    def delete(self, *parts):
+        """Drop one key. Other processes may serve it from memory for CACHE_LOCAL_TIMEOUT."""
+        key = self.key(*parts)
+        self.shared.delete(key)
+        self.local.delete(key)
+        note_purge(self.shared, self.name)
+
+    def clear(self):
+        """Invalidate every key in this cache by moving to a new generation"""
+        key = self._generation_key()
+        self.shared.add(key, 1, timeout=None)
+        try:
+            self.shared.incr(key)
+        except ValueError:
+            self.shared.set(key, 2, timeout=None)
+        self.local.clear()
+        note_purge(self.shared, self.name)
+
+
+# Product detail payloads (product, related products, rating stats) by slug
+product_detail_cache = CacheAside('product_detail', ttl=300)
+
+# The full, name-ordered category list
+category_list_cache = CacheAside('category_list', ttl=3600)
+
+# Vendor dashboard totals by vendor id; refreshed by TTL, not on each sale
+vendor_dashboard_cache = CacheAside('vendor_dashboard', ttl=60)
+
+# Product ids matching a normalised search query and category filter (see
+# product/search.py); cleared on every catalog change
+search_cache = CacheAside(
+    'search',
+    ttl=getattr(settings, 'SEARCH_CACHE_TIMEOUT', 300),
+    local_entries=getattr(settings, 'SEARCH_CACHE_LOCAL_ENTRIES', 1000),
+)
+
+def get_categories():
+    """All categories ordered by name"""
+    return category_list_cache.get('all', compute=lambda: list(Category.objects.order_by('name')))
+
+
+ALL_CACHES = (product_detail_cache, category_list_cache, vendor_dashboard_cache, search_cache)
+
@@ -0,0 +1,117 @@
+"""
+Finding the cart that belongs to a request.
+
+The session only holds the cart's id ('cart_id'); lines and cached
+totals live in the Cart/CartLine tables. Carts created before this store
+existed were a {product_id: quantity} dict under session['cart']; they are
+imported the first time the session is seen.
+"""
+from django.db import transaction
+
+from core_ecommerce.models import Cart
+from product.models import Product
+
+
+CART_SESSION_KEY = 'cart_id'
+LEGACY_CART_SESSION_KEY = 'cart'
+
+
+def remember_cart(request, cart):
+    if request.session.get(CART_SESSION_KEY) != cart.pk:
+        request.session[CART_SESSION_KEY] = cart.pk
+
+
+def _owned_by(cart, request):
+    if cart.user_id is None:
+        return True
+    return request.user.is_authenticated and cart.user_id == request.user.pk
+
+
+def _legacy_quantities(request):
+    """Pop a pre-store session cart and return its valid {product_id: quantity}"""
+    legacy = request.session.pop(LEGACY_CART_SESSION_KEY, None) or {}
+    quantities = {int(product_id): int(qty) for product_id, qty in legacy.items()}
+    valid = set(Product.objects.filter(pk__in=quantities).values_list('pk', flat=True))
+    return {product_id: qty for product_id, qty in quantities.items() if product_id in valid}
+
+
+def get_cart(request, create=False):
+    """Return the request's cart, or None if it has none and `create` is False"""
+    cart = None
+    cart_id = request.session.get(CART_SESSION_KEY)
+    if cart_id:
+        cart = Cart.objects.filter(pk=cart_id).first()
+        if cart is not None and not _owned_by(cart, request):
+            cart = None
+    if cart is None and request.user.is_authenticated:
+        cart = Cart.objects.filter(user=request.user).first()
+
+    legacy = _legacy_quantities(request) if LEGACY_CART_SESSION_KEY in request.session else {}
+    if cart is None and (create or legacy):
+        if request.user.is_authenticated:
+            # A concurrent request may be creating the user's cart too;
+            # get_or_create returns that one instead of failing
+            cart, _ = Cart.objects.get_or_create(user=request.user)
+        else:
+            cart = Cart.objects.create()
+    if cart is None:
+        request.session.pop(CART_SESSION_KEY, None)
+        return None
+
+    cart.add_quantities(legacy)
+    remember_cart(request, cart)
+    return cart
+
+
+def get_cart_count(request):
+    """Number of items in the request's cart: one single-column primary key lookup at most"""
+    cart_id = request.session.get(CART_SESSION_KEY)
+    if not cart_id:
+        legacy = request.session.get(LEGACY_CART_SESSION_KEY)
+        return sum(legacy.values()) if legacy else 0
+    count = Cart.objects.filter(pk=cart_id).values_list('item_count', flat=True).first()
+    return count or 0
+
+
+def merge_carts_on_login(request, user):
+    """
+    Move the anonymous cart in `request`'s session into `user`'s cart,
+    adding up quantities of products that are in both, in one transaction.
+    """
+    anonymous_id = request.session.get(CART_SESSION_KEY)
+    legacy = _legacy_quantities(request) if LEGACY_CART_SESSION_KEY in request.session else {}
+
+    if not anonymous_id and not legacy:
+        # Nothing to merge; just point the session at the user's cart
+        cart_id = Cart.objects.filter(user=user).values_list('pk', flat=True).first()
+        if cart_id:
+            request.session[CART_SESSION_KEY] = cart_id
+        return None
+
+    with transaction.atomic():
+        user_cart = Cart.objects.select_for_update().filter(user=user).first()
+        anonymous = None
+        if anonymous_id and (user_cart is None or anonymous_id != user_cart.pk):
+            anonymous = Cart.objects.select_for_update().filter(pk=anonymous_id, user__isnull=True).first()
+
+        if user_cart is None and anonymous is not None:
+            # Nothing to merge with: the anonymous cart becomes the user's
+            anonymous.user = user
+            anonymous.save(update_fields=['user', 'updated_at'])
+            user_cart, anonymous = anonymous, None
+        elif user_cart is None and legacy:
+            user_cart = Cart.objects.create(user=user)
+
+        if user_cart is None:
+            request.session.pop(CART_SESSION_KEY, None)
+            return None
+
+        quantities = dict(legacy)
+        if anonymous is not None:
+            for product_id, quantity in anonymous.lines.values_list('product_id', 'quantity'):
+                quantities[product_id] = quantities.get(product_id, 0) + quantity
+            anonymous.delete()
+        user_cart.add_quantities(quantities)
+
+    remember_cart(request, user_cart)
+    return user_cart
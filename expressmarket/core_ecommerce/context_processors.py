@@ -1,6 +1,6 @@
+from core_ecommerce.cart import get_cart_count
+
+
 def cart_context(request):
     """Context processor to make cart count available in all templates"""
-    cart = request.session.get('cart', {})
-    cart_count = sum(cart.values()) if cart else 0
-    return {'cart_count': cart_count}
-
+    return {'cart_count': get_cart_count(request)}
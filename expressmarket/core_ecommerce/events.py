@@ -0,0 +1,108 @@
+"""
+Change events for partners: products created, updated, repriced,
+archived, restored or deleted, and orders placed or moving status.
+
+Events are rows in ChangeEvent, written by the model signals in the same
+transaction as the change, so nothing is announced that did not happen.
+Delivery is left to the dispatcher (core_ecommerce.webhooks), which runs
+outside the request and waits EVENT_SETTLE_SECONDS before sending an
+event; one whose transaction stays open longer than that after writing
+it can be skipped, so transactions that record events should be short.
+Bulk writes
+(bulk_create, QuerySet.update) send no signals and record no events;
+ProductQuerySet.archive()/unarchive() send their own signal and do.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Min
+from django.utils import timezone
+
+from core_ecommerce.models import ChangeEvent, EventSubscriber
+
+
+TOPICS = (
+    'product.created',
+    'product.updated',
+    'product.price_changed',
+    'product.archived',
+    'product.unarchived',
+    'product.deleted',
+    'order.created',
+    'order.status_changed',
+)
+
+
+def record(topic, object_id, payload):
+    return ChangeEvent.objects.create(topic=topic, object_id=str(object_id), payload=payload)
+
+
+def product_payload(product):
+    return {
+        'id': product.pk,
+        'slug': product.slug,
+        'name': product.name,
+        'price': str(product.price),
+        'category_id': product.category_id,
+        'vendor_id': product.vendor_id,
+        'updated_at': product.updated_at.isoformat() if product.updated_at else None,
+    }
+
+
+def order_payload(order):
+    # No customer details: partners get what the order is, not who placed it
+    return {
+        'order_number': order.order_number,
+        'status': order.status,
+        'total': str(order.total),
+        'created_at': order.created_at.isoformat(),
+    }
+
+
+def product_saved(product, created):
+    if created:
+        topic = 'product.created'
+    elif getattr(product, '_loaded_price', None) not in (None, Decimal(str(product.price))):
+        topic = 'product.price_changed'
+    else:
+        topic = 'product.updated'
+    record(topic, product.pk, product_payload(product))
+    product._loaded_price = Decimal(str(product.price))
+
+
+def products_archived(products, active):
+    topic = 'product.unarchived' if active else 'product.archived'
+    ChangeEvent.objects.bulk_create(
+        ChangeEvent(topic=topic, object_id=str(product.pk), payload=product_payload(product))
+        for product in products
+    )
+
+
+def product_deleted(product):
+    record('product.deleted', product.pk, {'id': product.pk, 'slug': product.slug})
+
+
+def order_saved(order, created):
+    if created:
+        record('order.created', order.order_number, order_payload(order))
+    elif getattr(order, '_loaded_status', None) not in (None, order.status):
+        record('order.status_changed', order.order_number, order_payload(order))
+    order._loaded_status = order.status
+
+
+def prune_events(older_than_days=30, batch_size=5000):
+    """
+    Delete events older than `older_than_days` that every active subscriber
+    has been sent, in batches. Returns the number deleted.
+    """
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    sent = EventSubscriber.objects.filter(is_active=True).aggregate(upto=Min('last_event_id'))['upto']
+    events = ChangeEvent.objects.filter(created_at__lt=cutoff)
+    if sent is not None:
+        events = events.filter(id__lte=sent)
+    deleted = 0
+    while True:
+        ids = list(events.order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += ChangeEvent.objects.filter(id__in=ids).delete()[0]
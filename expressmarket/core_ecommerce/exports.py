@@ -0,0 +1,148 @@
+import csv
+import json
+import zlib
+from datetime import datetime, time, timedelta
+from xml.sax.saxutils import escape
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from core_ecommerce.models import Order
+
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'xml': 'application/xml',
+}
+
+# Rows fetched per round trip; the server-side cursor keeps memory flat
+EXPORT_CHUNK_SIZE = 2000
+
+# Uncompressed bytes collected before each gzip flush, so compressed
+# streams go out in reasonably sized pieces
+GZIP_BUFFER_SIZE = 64 * 1024
+
+
+class Echo:
+    """File-like object whose write() just returns the value, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def _parse_day(params, name):
+    """The date in params[name], None if blank; raises ValueError if it is not a valid YYYY-MM-DD"""
+    value = params.get(name, '') or ''
+    if not value:
+        return None
+    try:
+        day = parse_date(value)
+    except ValueError:
+        # Well formed but not a real date, e.g. 2024-13-45
+        day = None
+    if day is None:
+        raise ValueError(f'{name} is not a valid YYYY-MM-DD date: {value!r}')
+    return day
+
+
+def parse_export_filters(params, prefix=''):
+    """
+    Build queryset filters from ?start=YYYY-MM-DD&end=YYYY-MM-DD&status=...
+    Dates are turned into created_at ranges (not __date lookups) so the
+    created_at indexes can be used. `prefix` is prepended to each lookup,
+    e.g. 'vendor_order__' when filtering order items. Raises ValueError
+    for a date that is not valid.
+    """
+    filters = {}
+
+    start = _parse_day(params, 'start')
+    if start:
+        filters[f'{prefix}created_at__gte'] = timezone.make_aware(datetime.combine(start, time.min))
+
+    end = _parse_day(params, 'end')
+    if end:
+        filters[f'{prefix}created_at__lt'] = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min))
+
+    status = params.get('status', '')
+    if status in dict(Order.STATUS_CHOICES):
+        filters[f'{prefix}status'] = status
+
+    return filters
+
+
+def _csv_lines(columns, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _jsonl_lines(columns, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), default=str) + '\n'
+
+
+def _xml_lines(columns, rows, root, item):
+    yield f'<?xml version="1.0" encoding="utf-8"?>\n<{root}>\n'
+    for row in rows:
+        fields = ''.join(
+            f'<{column}/>' if value is None else f'<{column}>{escape(str(value))}</{column}>'
+            for column, value in zip(columns, row)
+        )
+        yield f'<{item}>{fields}</{item}>\n'
+    yield f'</{root}>\n'
+
+
+def export_lines(columns, rows, export_format, xml_root='rows', xml_item='row'):
+    """
+    Format `rows` (tuples in `columns` order) as an iterator of text lines
+    in one of EXPORT_FORMATS. Column names are used as XML element names.
+    """
+    if export_format == 'jsonl':
+        return _jsonl_lines(columns, rows)
+    if export_format == 'xml':
+        return _xml_lines(columns, rows, xml_root, xml_item)
+    return _csv_lines(columns, rows)
+
+
+def gzip_stream(lines, level=6):
+    """Gzip an iterator of text lines on the fly, yielding compressed bytes"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    buffer, size = [], 0
+    for line in lines:
+        data = line.encode()
+        buffer.append(data)
+        size += len(data)
+        if size >= GZIP_BUFFER_SIZE:
+            chunk = compressor.compress(b''.join(buffer))
+            buffer, size = [], 0
+            if chunk:
+                yield chunk
+    yield compressor.compress(b''.join(buffer)) + compressor.flush()
+
+
+def streaming_response(lines, export_format, filename, compress=False):
+    """A download of `lines`, optionally gzipped as it is sent"""
+    content_type = EXPORT_FORMATS[export_format]
+    filename = f'{filename}.{export_format}'
+    if compress:
+        lines, content_type, filename = gzip_stream(lines), 'application/gzip', f'{filename}.gz'
+    response = StreamingHttpResponse(lines, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def streaming_export(queryset, columns, export_format, filename, compress=False):
+    """
+    Stream a queryset as CSV, JSON Lines or XML. `columns` maps output
+    column names to field lookups. Rows are read as tuples with .iterator()
+    so memory use does not grow with the size of the export.
+    """
+    if export_format not in EXPORT_FORMATS:
+        export_format = 'csv'
+
+    rows = queryset.values_list(*columns.values()).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    lines = export_lines(list(columns), rows, export_format)
+    return streaming_response(lines, export_format, filename, compress)
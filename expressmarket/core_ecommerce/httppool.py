@@ -0,0 +1,72 @@
+"""
+Keep-alive HTTP(S) connections for outgoing requests, reused per origin so
+repeated calls to the same partner skip the TCP and TLS handshakes.
+Standard library only; safe to share between threads.
+"""
+import http.client
+import threading
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+
+# Errors a reused keep-alive connection gives when the server has closed it
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+
+class ConnectionPool:
+    def __init__(self, timeout=10, max_idle_per_origin=4):
+        self.timeout = timeout
+        self.max_idle_per_origin = max_idle_per_origin
+        self._idle = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def _checkout(self, origin):
+        with self._lock:
+            if self._idle[origin]:
+                return self._idle[origin].pop(), True
+        scheme, host, port = origin
+        connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        return connection_class(host, port, timeout=self.timeout), False
+
+    def _checkin(self, origin, connection):
+        with self._lock:
+            if len(self._idle[origin]) < self.max_idle_per_origin:
+                self._idle[origin].append(connection)
+                return
+        connection.close()
+
+    def request(self, method, url, body=None, headers=None):
+        """Send a request and return (status, response body)"""
+        parts = urlsplit(url)
+        origin = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or '/'
+        if parts.query:
+            path = f'{path}?{parts.query}'
+
+        while True:
+            connection, reused = self._checkout(origin)
+            try:
+                connection.request(method, path, body=body, headers=headers or {})
+                response = connection.getresponse()
+                content = response.read()
+            except STALE_CONNECTION_ERRORS:
+                connection.close()
+                if reused:
+                    # Closed by the server while idle: try again on a fresh connection
+                    continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self._checkin(origin, connection)
+            return response.status, content
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, defaultdict(list)
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+
+from core_ecommerce.archive import archive_batch, archive_cutoff
+
+
+class Command(BaseCommand):
+    help = 'Moves delivered and cancelled orders older than a given age into the order archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=getattr(settings, 'ORDER_ARCHIVE_AFTER_DAYS', 365),
+            help='Archive orders older than this many days (default: ORDER_ARCHIVE_AFTER_DAYS)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of orders moved per transaction (default: 1000)',
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            default=None,
+            help='Stop after this many batches (default: run until done)',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = archive_cutoff(options['days'])
+        batch_size = options['batch_size']
+        max_batches = options['max_batches']
+
+        self.stdout.write(f'Archiving orders created before {cutoff:%Y-%m-%d %H:%M}...')
+
+        total = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            moved = archive_batch(cutoff, batch_size)
+            if not moved:
+                break
+            total += moved
+            batches += 1
+            self.stdout.write(f'Archived {total} orders...')
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully archived {total} orders!'))
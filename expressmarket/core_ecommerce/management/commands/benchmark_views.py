@@ -0,0 +1,113 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import (
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+
+from core_ecommerce.benchmarks import (
+    card_fragment_benchmark, compare_reports, default_benchmarks, fuzzy_search_benchmark, run_suite,
+    typo_search_benchmark,
+)
+from product.seeding import MarketplaceSeeder
+
+
+class Command(BaseCommand):
+    help = 'Seeds a scaled test database and reports latency, query counts and memory for the hot views'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=1, help='Dataset multiplier: 1 = 1,000 products and 2,000 orders (default: 1)')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for the dataset (default: 42)')
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per view (default: 20)')
+        parser.add_argument('--cart-lines', type=int, default=10, help='Cart lines for the cart and checkout views (default: 10)')
+        parser.add_argument('--output', default='benchmark.json', help='Where to write the JSON report (default: benchmark.json)')
+        parser.add_argument('--compare', help='A previous JSON report to compare against')
+        parser.add_argument('--vocabulary', type=int, default=250_000, help='Distinct words for the fuzzy search benchmark (default: 250000)')
+        parser.add_argument('--keepdb', action='store_true', help='Keep the seeded test database between runs')
+
+    def handle(self, *args, **options):
+        scale = options['scale']
+
+        # Benchmarks run against a throwaway test database, never the real one,
+        # with DEBUG off as in production (and as the test runner does) and
+        # the query profiler off so its log lines don't skew the timings
+        settings.DEBUG = False
+        settings.QUERY_PROFILER_SAMPLE_RATE = 0
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'])
+        try:
+            if not options['keepdb'] or not self._is_seeded():
+                self.stdout.write(f'Seeding dataset at scale {scale}...')
+                seeder = MarketplaceSeeder(seed=options['seed'])
+                seeder.seed_categories()
+                seeder.seed_vendors(10 * scale)
+                seeder.seed_customers(200 * scale)
+                seeder.seed_products(1000 * scale)
+                seeder.seed_orders(2000 * scale)
+                seeder.seed_reviews()
+
+            report = run_suite(
+                default_benchmarks(cart_lines=options['cart_lines']),
+                iterations=options['iterations'],
+                meta={'scale': scale, 'seed': options['seed']},
+            )
+            report['card_fragments'] = card_fragment_benchmark(iterations=options['iterations'])
+            report['fuzzy_search'] = fuzzy_search_benchmark(vocabulary=options['vocabulary'], seed=options['seed'])
+            report['typo_search'] = typo_search_benchmark(iterations=options['iterations'], seed=options['seed'])
+        finally:
+            teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        self._print_report(report)
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            self._print_comparison(baseline, report)
+
+    def _is_seeded(self):
+        from core_ecommerce.models import Order
+        return Order.objects.exists()
+
+    def _print_report(self, report):
+        self.stdout.write(f"{'View':<32}{'p50 ms':>10}{'p99 ms':>10}{'queries':>9}{'peak KB':>10}")
+        for name, result in report['views'].items():
+            self.stdout.write(
+                f"{name:<32}{result['p50_ms']:>10}{result['p99_ms']:>10}"
+                f"{result['queries']:>9}{result['peak_memory_kb']:>10}"
+            )
+        cards = report.get('card_fragments')
+        if cards:
+            self.stdout.write(
+                f"Home page product cards ({cards['categories']} categories): "
+                f"{cards['cold_p50_ms']} ms uncached, {cards['warm_p50_ms']} ms cached "
+                f"({cards['saved_pct']}% saved)"
+            )
+        fuzzy = report.get('fuzzy_search')
+        if fuzzy:
+            style = self.style.SUCCESS if fuzzy['within_budget'] else self.style.ERROR
+            self.stdout.write(style(
+                f"Fuzzy search ({fuzzy['vocabulary']} words, index built in {fuzzy['build_ms']} ms, "
+                f"{fuzzy['index_memory_kb']} KB): p50 {fuzzy['p50_ms']} ms, p99 {fuzzy['p99_ms']} ms "
+                f"(budget {fuzzy['budget_ms']} ms), {fuzzy['corrected_pct']}% corrected to the intended word"
+            ))
+        typos = report.get('typo_search')
+        if typos:
+            self.stdout.write(
+                f"Home page search with a typo ({typos['requests']} requests): p50 {typos['p50_ms']} ms, "
+                f"p99 {typos['p99_ms']} ms, {typos['mean_queries']} queries, "
+                f"{typos['corrected_pct']}% corrected to the intended word"
+            )
+
+    def _print_comparison(self, baseline, report):
+        self.stdout.write(f"Compared with {baseline['meta'].get('revision') or 'baseline'}:")
+        for name, metric, old, new, change in compare_reports(baseline, report):
+            style = self.style.ERROR if change > 10 else self.style.SUCCESS if change < -10 else str
+            self.stdout.write(style(f'  {name} {metric}: {old} -> {new} ({change:+.1f}%)'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from core_ecommerce.caching import ALL_CACHES, METRIC_FIELDS, metrics
+from core_ecommerce.pagecache import PAGE_CACHE_METRICS
+
+
+class Command(BaseCommand):
+    help = 'Shows hit, miss and rebuild counts for the view data and page caches, summed over all workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Set the counters back to zero after printing them',
+        )
+
+    def handle(self, *args, **options):
+        names = [cache.name for cache in ALL_CACHES] + [PAGE_CACHE_METRICS]
+        totals = metrics.totals(names)
+
+        self.stdout.write(f'{"cache":<18}' + ''.join(f'{field:>15}' for field in METRIC_FIELDS) + f'{"hit ratio":>12}')
+        for name in names:
+            counts = totals[name]
+            hits = counts['local_hits'] + counts['shared_hits'] + counts['stale_served']
+            lookups = hits + counts['misses']
+            ratio = f'{hits / lookups:.1%}' if lookups else '-'
+            self.stdout.write(
+                f'{name:<18}' + ''.join(f'{counts[field]:>15}' for field in METRIC_FIELDS) + f'{ratio:>12}'
+            )
+
+        if options['reset']:
+            metrics.reset(names)
+            self.stdout.write(self.style.SUCCESS('Counters reset.'))
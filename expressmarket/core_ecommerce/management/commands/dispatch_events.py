@@ -0,0 +1,62 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from core_ecommerce.events import prune_events
+from core_ecommerce.webhooks import dispatch, new_pool
+
+
+class Command(BaseCommand):
+    help = 'Sends change events to partner subscribers in batches until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Subscribers delivered to at the same time (default: 4)',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Seconds to wait when every subscriber is up to date (default: 1)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Bring every subscriber up to date once, then exit',
+        )
+        parser.add_argument(
+            '--prune-days',
+            type=int,
+            default=None,
+            help='First delete events older than this many days that every subscriber has been sent',
+        )
+
+    def handle(self, *args, **options):
+        if options['prune_days'] is not None:
+            self.stdout.write(f'Deleted {prune_events(options["prune_days"])} old events.')
+
+        stop = threading.Event()
+        previous = {signum: signal.getsignal(signum) for signum in (signal.SIGINT, signal.SIGTERM)}
+        for signum in previous:
+            signal.signal(signum, lambda signum, frame: stop.set())
+
+        pool = new_pool()
+        sent = 0
+        try:
+            while not stop.is_set():
+                delivered = dispatch(pool, options['workers'])
+                sent += delivered
+                if options['once']:
+                    break
+                if not delivered:
+                    stop.wait(options['poll_interval'])
+        finally:
+            pool.close()
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully sent {sent} events!'))
@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core_ecommerce.models import Cart
+
+
+class Command(BaseCommand):
+    help = 'Deletes anonymous carts that have not been touched for a given number of days'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=30,
+            help='Delete anonymous carts not updated for this many days (default: 30)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of carts deleted per query (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        stale = Cart.objects.filter(user__isnull=True, updated_at__lt=cutoff)
+
+        total = 0
+        while True:
+            ids = list(stale.values_list('pk', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            Cart.objects.filter(pk__in=ids).delete()
+            total += len(ids)
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully deleted {total} anonymous carts!'))
@@ -0,0 +1,117 @@
+import signal
+import threading
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core_ecommerce.taskqueue import load_tasks, work
+
+
+def _pooled_worker(stop, counter, options):
+    try:
+        done = work(stop, **options)
+    finally:
+        # Each pooled worker has its own connections
+        connections.close_all()
+    with counter.get_lock():
+        counter.value += done
+
+
+class Command(BaseCommand):
+    help = 'Runs background task workers on a pool of threads or processes until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=2,
+            help='Number of workers; 1 runs in this thread (default: 2)',
+        )
+        parser.add_argument(
+            '--processes',
+            action='store_true',
+            help='Run each worker in its own process instead of a thread, for CPU-bound tasks',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1,
+            help='Tasks claimed at a time per worker; the lease must cover running them all (default: 1)',
+        )
+        parser.add_argument(
+            '--lease',
+            type=int,
+            default=settings.TASK_LEASE_SECONDS,
+            help='Seconds a claimed task stays with its worker (default: TASK_LEASE_SECONDS)',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=settings.TASK_POLL_INTERVAL,
+            help='Seconds an idle worker waits before looking for tasks again (default: TASK_POLL_INTERVAL)',
+        )
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help='Exit once no tasks are due instead of waiting for more',
+        )
+
+    def handle(self, *args, **options):
+        load_tasks()
+        work_options = {
+            'batch_size': options['batch_size'],
+            'lease': options['lease'],
+            'poll_interval': options['poll_interval'],
+            'burst': options['burst'],
+        }
+        workers = max(options['workers'], 1)
+        kind = 'processes' if options['processes'] else 'threads'
+        self.stdout.write(f'Starting {workers} task worker{"s" if workers > 1 else ""} ({kind})...')
+
+        previous = {signum: signal.getsignal(signum) for signum in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            done = self.run_pool(workers, options['processes'], work_options)
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS(f'Successfully ran {done} tasks!'))
+
+    def run_pool(self, workers, processes, work_options):
+        """Run the workers until they stop; returns the number of tasks run"""
+        if workers == 1 and not processes:
+            stop = threading.Event()
+            self.stop_on_signals(stop)
+            return work(stop, **work_options)
+
+        context = get_context('fork') if processes else None
+        stop = context.Event() if context else threading.Event()
+        counter = (context or get_context()).Value('q', 0)
+        if context:
+            # Children must open their own connections
+            connections.close_all()
+            pool = [
+                context.Process(target=_pooled_worker, args=(stop, counter, work_options))
+                for _ in range(workers)
+            ]
+        else:
+            pool = [
+                threading.Thread(target=_pooled_worker, args=(stop, counter, work_options), name=f'task-worker-{i}')
+                for i in range(workers)
+            ]
+        self.stop_on_signals(stop)
+        for worker in pool:
+            worker.start()
+        while any(worker.is_alive() for worker in pool):
+            for worker in pool:
+                worker.join(timeout=1)
+        return counter.value
+
+    def stop_on_signals(self, stop):
+        """Finish the current task and exit on Ctrl-C or SIGTERM; leases cover anything cut short"""
+        def handler(signum, frame):
+            self.stdout.write('Stopping after the current tasks...')
+            stop.set()
+        signal.signal(signal.SIGINT, handler)
+        signal.signal(signal.SIGTERM, handler)
@@ -0,0 +1,151 @@
+import contextvars
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from core_ecommerce.routers import PIN_COOKIE, RoutingState, replica_configured, routing_state
+
+
+logger = logging.getLogger('core_ecommerce.profiler')
+
+# Collapse "IN (%s, %s, %s)" so IN-lists of any length share one shape
+IN_LIST_RE = re.compile(r'\((?:%s, )+%s\)')
+
+
+def query_shape(sql):
+    """Normalize a parameterized SQL string so repeats of one query compare equal"""
+    return IN_LIST_RE.sub('(%s, ...)', sql)
+
+
+class QueryStats:
+    """execute_wrapper that counts queries, DB time and repeated query shapes"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.shapes[query_shape(sql)] += 1
+
+    def repeated_shapes(self, threshold):
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+class QueryProfilerMiddleware:
+    """
+    Profile a sample of requests: count queries and DB time, flag query
+    shapes repeated QUERY_PROFILER_NPLUSONE_THRESHOLD or more times as
+    suspected N+1s, and report through Server-Timing headers and a JSON
+    log line. Unsampled requests only pay for one random() call.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'QUERY_PROFILER_SAMPLE_RATE', 0.0)
+        self.threshold = getattr(settings, 'QUERY_PROFILER_NPLUSONE_THRESHOLD', 5)
+
+    def __call__(self, request):
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        stats = QueryStats()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+
+        suspects = stats.repeated_shapes(self.threshold)
+        timings = [
+            f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries"',
+            f'app;dur={total * 1000:.1f}',
+        ]
+        if suspects:
+            timings.append(f'nplusone;desc="{len(suspects)} repeated query shapes"')
+        response['Server-Timing'] = ', '.join(timings)
+
+        record = {
+            'path': request.path,
+            'method': request.method,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'db_ms': round(stats.duration * 1000, 1),
+            'queries': stats.count,
+            'nplusone': [{'count': count, 'sql': shape[:300]} for shape, count in suspects],
+        }
+        if suspects:
+            logger.warning(json.dumps(record))
+        else:
+            logger.info(json.dumps(record))
+        return response
+
+
+def in_context(context, iterator):
+    """Iterate `iterator` with each step run inside `context`"""
+    iterator = iter(iterator)
+    while True:
+        try:
+            chunk = context.run(next, iterator)
+        except StopIteration:
+            return
+        yield chunk
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Route reads of `read_from_replica` views to the replica, and pin clients
+    to the primary for a while after any request that wrote.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sticky_seconds = getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+
+    def __call__(self, request):
+        if not replica_configured():
+            return self.get_response(request)
+
+        state = RoutingState()
+        token = routing_state.set(state)
+        try:
+            response = self.get_response(request)
+            if response.streaming and not response.is_async:
+                # The body is read after this returns; keep routing it the same way
+                response.streaming_content = in_context(contextvars.copy_context(), response.streaming_content)
+        finally:
+            routing_state.reset(token)
+
+        if state.wrote or request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=self.sticky_seconds,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+        if (
+            getattr(view_class, 'read_from_replica', False)
+            and request.method in ('GET', 'HEAD')
+            and PIN_COOKIE not in request.COOKIES
+        ):
+            state = routing_state.get()
+            if state is not None:
+                state.use_replica = True
@@ -0,0 +1,17 @@
+from django.db import migrations
+
+from core_ecommerce.pgindexes import trigram_index
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('core_ecommerce', '0001_initial'),
+    ]
+
+    # Order admin searches by contact email (see core_ecommerce/admin.py)
+    operations = [
+        trigram_index('core_ecommerce_order_email_trgm', 'core_ecommerce_order', 'UPPER("email")'),
+    ]
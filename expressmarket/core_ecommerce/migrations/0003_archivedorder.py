@@ -0,0 +1,106 @@
+# Generated by Django 6.0 on 2026-10-19 10:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_archive_table(apps, schema_editor):
+    """
+    Create the archive table. On PostgreSQL it is range-partitioned by month
+    on created_at, so the primary key has to include the partition key;
+    monthly partitions are added by the archive_orders command.
+    """
+    ArchivedOrder = apps.get_model('core_ecommerce', 'ArchivedOrder')
+    if schema_editor.connection.vendor != 'postgresql':
+        schema_editor.create_model(ArchivedOrder)
+        return
+
+    user_table = apps.get_model(settings.AUTH_USER_MODEL)._meta.db_table
+    schema_editor.execute(f'''
+        CREATE TABLE "core_ecommerce_archivedorder" (
+            "id" bigint NOT NULL,
+            "order_number" varchar(20) NOT NULL,
+            "status" varchar(20) NOT NULL,
+            "first_name" varchar(100) NOT NULL,
+            "last_name" varchar(100) NOT NULL,
+            "email" varchar(254) NOT NULL,
+            "phone" varchar(20) NOT NULL,
+            "shipping_address" text NOT NULL,
+            "billing_address" text NULL,
+            "city" varchar(100) NOT NULL,
+            "region" varchar(100) NOT NULL,
+            "postal_code" varchar(20) NOT NULL,
+            "country" varchar(100) NOT NULL,
+            "subtotal" numeric(10, 2) NOT NULL,
+            "shipping_cost" numeric(10, 2) NOT NULL,
+            "total" numeric(10, 2) NOT NULL,
+            "items" jsonb NOT NULL,
+            "created_at" timestamp with time zone NOT NULL,
+            "updated_at" timestamp with time zone NOT NULL,
+            "archived_at" timestamp with time zone NOT NULL,
+            "customer_id" bigint NOT NULL
+                REFERENCES "{user_table}" ("id") DEFERRABLE INITIALLY DEFERRED,
+            PRIMARY KEY ("id", "created_at")
+        ) PARTITION BY RANGE ("created_at")
+    ''')
+    schema_editor.execute(
+        'CREATE TABLE "core_ecommerce_archivedorder_default" '
+        'PARTITION OF "core_ecommerce_archivedorder" DEFAULT'
+    )
+    for sql in schema_editor._model_indexes_sql(ArchivedOrder):
+        schema_editor.execute(sql)
+
+
+def drop_archive_table(apps, schema_editor):
+    schema_editor.delete_model(apps.get_model('core_ecommerce', 'ArchivedOrder'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_ecommerce', '0002_order_search_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='ArchivedOrder',
+                    fields=[
+                        ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                        ('order_number', models.CharField(db_index=True, max_length=20)),
+                        ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('shipped', 'Shipped'), ('delivered', 'Delivered'), ('cancelled', 'Cancelled')], max_length=20)),
+                        ('first_name', models.CharField(max_length=100)),
+                        ('last_name', models.CharField(max_length=100)),
+                        ('email', models.EmailField(max_length=254)),
+                        ('phone', models.CharField(max_length=20)),
+                        ('shipping_address', models.TextField()),
+                        ('billing_address', models.TextField(blank=True, null=True)),
+                        ('city', models.CharField(max_length=100)),
+                        ('region', models.CharField(blank=True, max_length=100)),
+                        ('postal_code', models.CharField(blank=True, max_length=20)),
+                        ('country', models.CharField(max_length=100)),
+                        ('subtotal', models.DecimalField(decimal_places=2, max_digits=10)),
+                        ('shipping_cost', models.DecimalField(decimal_places=2, max_digits=10)),
+                        ('total', models.DecimalField(decimal_places=2, max_digits=10)),
+                        ('items', models.JSONField(default=list)),
+                        ('created_at', models.DateTimeField()),
+                        ('updated_at', models.DateTimeField()),
+                        ('archived_at', models.DateTimeField(auto_now_add=True)),
+                        ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_orders', to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'ordering': ['-created_at'],
+                        'indexes': [models.Index(fields=['customer', '-created_at'], name='archivedorder_customer_idx')],
+                    },
+                ),
+            ],
+        ),
+        migrations.RunPython(create_archive_table, drop_archive_table),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 6.0 on 2026-10-19 16:05
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Max, Min, OuterRef, Subquery, Sum
+
+
+def split_orders(apps, schema_editor):
+    Order = apps.get_model('core_ecommerce', 'Order')
+    OrderItem = apps.get_model('core_ecommerce', 'OrderItem')
+    VendorOrder = apps.get_model('core_ecommerce', 'VendorOrder')
+    Product = apps.get_model('product', 'Product')
+    db = schema_editor.connection.alias
+
+    # Walk the orders in id ranges so each step touches a bounded number of rows
+    bounds = Order.objects.using(db).aggregate(first=Min('id'), last=Max('id'))
+    if bounds['first'] is None:
+        return
+    batch = 1000
+    for start in range(bounds['first'], bounds['last'] + 1, batch):
+        in_range = {'order_id__gte': start, 'order_id__lt': start + batch}
+        groups = (
+            OrderItem.objects.using(db).filter(**in_range)
+            .values('order_id', 'order__status', 'order__created_at', 'product__vendor_id')
+            .annotate(quantity=Sum('quantity'), subtotal=Sum('subtotal'))
+            .order_by()
+        )
+        VendorOrder.objects.using(db).bulk_create([
+            VendorOrder(
+                order_id=group['order_id'],
+                vendor_id=group['product__vendor_id'],
+                status=group['order__status'],
+                quantity=group['quantity'],
+                subtotal=group['subtotal'],
+                created_at=group['order__created_at'],
+            )
+            for group in groups
+        ])
+        vendor = Product.objects.using(db).filter(pk=OuterRef(OuterRef('product_id'))).values('vendor_id')
+        OrderItem.objects.using(db).filter(**in_range).update(vendor_order=Subquery(
+            VendorOrder.objects.using(db).filter(order_id=OuterRef('order_id'), vendor_id=Subquery(vendor)).values('id')
+        ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_ecommerce', '0005_cart'),
+        ('product', '0008_product_updated_index'),
+        ('vendor', '0004_remove_store_vendor_store_address_store_city_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VendorOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('shipped', 'Shipped'), ('delivered', 'Delivered'), ('cancelled', 'Cancelled')], default='pending', max_length=20)),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('subtotal', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vendor_orders', to='core_ecommerce.order')),
+                ('vendor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='vendor.vendor')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='vendor_order',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='items', to='core_ecommerce.vendororder'),
+        ),
+        migrations.AddIndex(
+            model_name='vendororder',
+            index=models.Index(fields=['vendor', '-created_at'], name='vendororder_vendor_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vendororder',
+            index=models.Index(fields=['vendor', 'status', 'created_at'], name='vendororder_vendor_status_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='vendororder',
+            constraint=models.UniqueConstraint(fields=('order', 'vendor'), name='vendororder_order_vendor_uniq'),
+        ),
+        migrations.RunPython(split_orders, migrations.RunPython.noop),
+    ]
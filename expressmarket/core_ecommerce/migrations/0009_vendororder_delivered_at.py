@@ -0,0 +1,39 @@
+# Generated by Django 6.0 on 2026-10-19 20:10
+
+from django.db import migrations, models
+from django.db.models import F, Max, Min
+
+
+def backfill_delivered_at(apps, schema_editor):
+    VendorOrder = apps.get_model('core_ecommerce', 'VendorOrder')
+    db = schema_editor.connection.alias
+
+    # Delivery was not timed before; the last update is the closest there is
+    bounds = VendorOrder.objects.using(db).aggregate(first=Min('id'), last=Max('id'))
+    if bounds['first'] is None:
+        return
+    batch = 5000
+    for start in range(bounds['first'], bounds['last'] + 1, batch):
+        VendorOrder.objects.using(db).filter(
+            id__gte=start, id__lt=start + batch, status='delivered', delivered_at__isnull=True,
+        ).update(delivered_at=F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_ecommerce', '0008_change_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vendororder',
+            name='delivered_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='vendororder',
+            index=models.Index(fields=['status', 'delivered_at'], name='vendororder_delivered_idx'),
+        ),
+        migrations.RunPython(backfill_delivered_at, migrations.RunPython.noop),
+    ]
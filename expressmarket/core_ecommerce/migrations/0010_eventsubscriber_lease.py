@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-19 21:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_ecommerce', '0009_vendororder_delivered_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventsubscriber',
+            name='locked_by',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='eventsubscriber',
+            name='locked_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
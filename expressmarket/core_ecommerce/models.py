@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
+from django.db.models import F, Sum
 from django.conf import settings
 from product.models import Product
 from decimal import Decimal
@@ -15,6 +17,9 @@ class Order(models.Model):
         ('cancelled', 'Cancelled'),
     ]
     
+    # Fulfilment order of the statuses other than cancelled
+    STATUS_PROGRESS = ['pending', 'processing', 'shipped', 'delivered']
+    
     customer = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -48,23 +53,145 @@ class Order(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+            models.Index(fields=['created_at'], name='order_created_idx'),
+        ]
     
     def __str__(self):
         return f"Order {self.order_number} - {self.customer.username}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Compared on save to tell status changes apart (see core_ecommerce.events)
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+    
     def save(self, *args, **kwargs):
         if not self.order_number:
             # Generate unique order number
             import random
             import string
             self.order_number = ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
-        super().save(*args, **kwargs)
+        # The change event written by post_save commits or rolls back with the
+        # row; no savepoint, as a failure here fails the caller's transaction too
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+    
+    def add_items(self, items):
+        """
+        Save `items` (unsaved OrderItems whose products are loaded) and split
+        them into one VendorOrder per vendor, in two INSERTs
+        """
+        vendor_orders = {}
+        for item in items:
+            vendor_order = vendor_orders.get(item.product.vendor_id)
+            if vendor_order is None:
+                vendor_order = vendor_orders[item.product.vendor_id] = VendorOrder(
+                    order=self,
+                    vendor_id=item.product.vendor_id,
+                    status=self.status,
+                    created_at=self.created_at,
+                    delivered_at=timezone.now() if self.status == 'delivered' else None,
+                )
+            vendor_order.quantity += item.quantity
+            vendor_order.subtotal += item.subtotal
+        VendorOrder.objects.bulk_create(vendor_orders.values())
+        for item in items:
+            item.order = self
+            item.vendor_order = vendor_orders[item.product.vendor_id]
+        return OrderItem.objects.bulk_create(items)
+    
+    def sync_status(self):
+        """
+        Derive the order's status from its vendor orders: the least advanced
+        of those not cancelled, or cancelled if they all are
+        """
+        statuses = set(self.vendor_orders.values_list('status', flat=True))
+        if not statuses:
+            return
+        live = statuses - {'cancelled'}
+        status = min(live, key=self.STATUS_PROGRESS.index) if live else 'cancelled'
+        if status != self.status:
+            self.status = status
+            self.save(update_fields=['status', 'updated_at'])
+
+
+class VendorOrder(models.Model):
+    """
+    The part of an order one vendor fulfils: its items, totals and status.
+    Vendors work from this table rather than from OrderItem.
+    """
+    
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='vendor_orders')
+    vendor = models.ForeignKey('vendor.Vendor', on_delete=models.CASCADE, related_name='orders')
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, default='pending')
+    quantity = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    
+    # Copied from the order, so a vendor's orders are listed from this table alone
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+    # When it was marked delivered; vendors are settled by this (see vendor/settlements.py)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'vendor'], name='vendororder_order_vendor_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['vendor', '-created_at'], name='vendororder_vendor_created_idx'),
+            models.Index(fields=['vendor', 'status', 'created_at'], name='vendororder_vendor_status_idx'),
+            models.Index(fields=['status', 'delivered_at'], name='vendororder_delivered_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Order {self.order.order_number} - vendor {self.vendor_id}"
+    
+    @staticmethod
+    def next_statuses(status):
+        """
+        The statuses a vendor order in `status` may move to: forward along
+        STATUS_PROGRESS, or cancelled until it is delivered
+        """
+        if status not in Order.STATUS_PROGRESS or status == 'delivered':
+            return []
+        position = Order.STATUS_PROGRESS.index(status)
+        return Order.STATUS_PROGRESS[position + 1:] + ['cancelled']
+    
+    def set_status(self, status):
+        """
+        Change this vendor's status and roll it up to the order. Raises
+        ValueError for a move that is not forward (see next_statuses).
+        """
+        with transaction.atomic():
+            # The order is locked with this row, so vendors of the same order
+            # roll up one at a time and the last to commit sees every other's status
+            locked = VendorOrder.objects.select_for_update(of=('self', 'order')).select_related('order').get(pk=self.pk)
+            if status == locked.status:
+                return
+            if status not in self.next_statuses(locked.status):
+                raise ValueError(f'A {locked.status} order cannot be marked {status}.')
+            self.status = status
+            self.delivered_at = timezone.now() if status == 'delivered' else locked.delivered_at
+            self.save(update_fields=['status', 'delivered_at', 'updated_at'])
+            self.order = locked.order
+            self.order.sync_status()
 
 
 class OrderItem(models.Model):
     """Individual items in an order"""
     
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+    vendor_order = models.ForeignKey(
+        VendorOrder,
+        on_delete=models.CASCADE,
+        related_name='items',
+        null=True,
+        blank=True
+    )
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)  # Price at time of purchase
@@ -76,3 +203,298 @@ class OrderItem(models.Model):
     
     def __str__(self):
         return f"{self.quantity}x {self.product.name} - Order {self.order.order_number}"
+
+
+
+# Most of one product a cart line can hold
+MAX_CART_QUANTITY = 999
+
+
+class Cart(models.Model):
+    """
+    Server-side shopping cart. Anonymous carts are found through the
+    session (see core_ecommerce.cart), a customer's cart through `user`.
+    item_count and subtotal are kept up to date by the methods below, so
+    the cart badge needs a single-column read.
+    """
+    
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='cart'
+    )
+    item_count = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    
+    def __str__(self):
+        return f"Cart {self.pk} ({self.item_count} items)"
+    
+    def add_quantities(self, quantities):
+        """Add {product_id: quantity} to the cart, merging with existing lines"""
+        self.apply_changes(added={product_id: qty for product_id, qty in quantities.items() if qty > 0})
+    
+    def apply_changes(self, quantities=None, added=None):
+        """
+        Set lines to {product_id: quantity} (zero removes the line), then add
+        {product_id: quantity} on top, in one transaction with a single totals
+        refresh. Returns {product_id: new quantity} for every product touched.
+        """
+        quantities = quantities or {}
+        added = added or {}
+        if not set(quantities) | set(added):
+            return {}
+        try:
+            return self._apply_changes(quantities, added)
+        except IntegrityError:
+            # A concurrent request created one of the new lines first. Its
+            # transaction has committed, so the retry finds and updates it.
+            return self._apply_changes(quantities, added)
+    
+    def _apply_changes(self, quantities, added):
+        product_ids = set(quantities) | set(added)
+        with transaction.atomic():
+            existing = {
+                line.product_id: line
+                for line in self.lines.select_for_update().filter(product_id__in=product_ids)
+            }
+            result = {}
+            changed, created, removed = [], [], []
+            for product_id in product_ids:
+                line = existing.get(product_id)
+                current = line.quantity if line is not None else 0
+                quantity = min(max(quantities.get(product_id, current) + added.get(product_id, 0), 0), MAX_CART_QUANTITY)
+                result[product_id] = quantity
+                if line is None:
+                    if quantity:
+                        created.append(CartLine(cart=self, product_id=product_id, quantity=quantity))
+                elif not quantity:
+                    removed.append(line.pk)
+                elif quantity != current:
+                    line.quantity = quantity
+                    changed.append(line)
+            if changed:
+                CartLine.objects.bulk_update(changed, ['quantity'])
+            if created:
+                CartLine.objects.bulk_create(created)
+            if removed:
+                CartLine.objects.filter(pk__in=removed).delete()
+            self.refresh_totals()
+        return result
+    
+    def add(self, product, quantity=1):
+        self.add_quantities({product.pk: quantity})
+    
+    def set_quantity(self, product, quantity):
+        """Set a line's quantity, at most MAX_CART_QUANTITY; zero or less removes the line"""
+        if quantity < 1:
+            return self.remove(product)
+        quantity = min(quantity, MAX_CART_QUANTITY)
+        with transaction.atomic():
+            updated = self.lines.filter(product=product).update(quantity=quantity)
+            if not updated:
+                try:
+                    with transaction.atomic():
+                        CartLine.objects.create(cart=self, product=product, quantity=quantity)
+                except IntegrityError:
+                    # Created by a concurrent request since the update
+                    self.lines.filter(product=product).update(quantity=quantity)
+            self.refresh_totals()
+        return True
+    
+    def remove(self, product):
+        """Remove a product's line; returns False if it was not in the cart"""
+        with transaction.atomic():
+            deleted, _ = self.lines.filter(product=product).delete()
+            if deleted:
+                self.refresh_totals()
+        return bool(deleted)
+    
+    def clear(self, products=None):
+        """Empty the cart, or only the lines for `products` if given"""
+        with transaction.atomic():
+            lines = self.lines.all() if products is None else self.lines.filter(product__in=products)
+            lines.delete()
+            self.refresh_totals()
+    
+    def available_lines(self):
+        """
+        Lines for products still on sale. Lines for archived products are
+        kept, not deleted, and come back if the product is restored.
+        """
+        return self.lines.filter(product__is_active=True)
+    
+    def refresh_totals(self):
+        """Recompute the cached item count and subtotal from the available lines"""
+        totals = self.available_lines().aggregate(
+            item_count=Sum('quantity'),
+            subtotal=Sum(F('quantity') * F('product__price')),
+        )
+        self.item_count = totals['item_count'] or 0
+        self.subtotal = totals['subtotal'] or Decimal('0.00')
+        self.save(update_fields=['item_count', 'subtotal', 'updated_at'])
+
+
+class CartLine(models.Model):
+    """One product in a cart"""
+    
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='lines')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=1)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='cartline_cart_product_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.quantity}x {self.product_id} in cart {self.cart_id}"
+
+
+class ArchivedOrder(models.Model):
+    """
+    Compact, read-only copy of an old order moved out of the live tables by
+    the archive_orders command. Line items are stored inline as JSON.
+    On PostgreSQL the table is range-partitioned by month on created_at.
+    """
+    
+    # Primary key of the original Order
+    id = models.BigIntegerField(primary_key=True)
+    customer = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='archived_orders'
+    )
+    order_number = models.CharField(max_length=20, db_index=True)
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    
+    # Customer information
+    first_name = models.CharField(max_length=100)
+    last_name = models.CharField(max_length=100)
+    email = models.EmailField()
+    phone = models.CharField(max_length=20)
+    
+    # Address information
+    shipping_address = models.TextField()
+    billing_address = models.TextField(blank=True, null=True)
+    city = models.CharField(max_length=100)
+    region = models.CharField(max_length=100, blank=True)
+    postal_code = models.CharField(max_length=20, blank=True)
+    country = models.CharField(max_length=100)
+    
+    # Order totals
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2)
+    shipping_cost = models.DecimalField(max_digits=10, decimal_places=2)
+    total = models.DecimalField(max_digits=10, decimal_places=2)
+    
+    # [{product_id, product_name, product_slug, quantity, price, subtotal}, ...]
+    items = models.JSONField(default=list)
+    
+    # Timestamps (copied from the original order)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['customer', '-created_at'], name='archivedorder_customer_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Archived order {self.order_number}"
+
+
+class Task(models.Model):
+    """
+    A unit of background work in the database-backed queue (see
+    core_ecommerce.taskqueue). Rows are deleted when they succeed; failed
+    ones stay for inspection.
+    """
+    
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (FAILED, 'Failed'),
+    ]
+    
+    name = models.CharField(max_length=100)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    # At most one queued or running task per key
+    key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    priority = models.SmallIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField()
+    
+    # Lease held by the worker running it; an expired lease can be claimed again
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_after'], name='task_claim_idx'),
+            models.Index(fields=['status', 'locked_until'], name='task_lease_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+
+class ChangeEvent(models.Model):
+    """
+    Append-only log of catalog and order changes for partners, written in
+    the same transaction as the change (see core_ecommerce.events).
+    """
+    
+    topic = models.CharField(max_length=50)
+    object_id = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"{self.topic} {self.object_id}"
+
+
+class EventSubscriber(models.Model):
+    """
+    A partner endpoint that change events are POSTed to in batches.
+    last_event_id is how far it has been sent.
+    """
+    
+    name = models.CharField(max_length=100, unique=True)
+    url = models.URLField()
+    # Topics such as 'order.status_changed', 'product.*', or '*' for all
+    topics = models.JSONField(default=list)
+    # Signs each request body (X-Signature: sha256=<HMAC>)
+    secret = models.CharField(max_length=100)
+    batch_size = models.PositiveIntegerField(default=100)
+    is_active = models.BooleanField(default=True)
+    
+    last_event_id = models.BigIntegerField(default=0)
+    # The dispatcher delivering to it, until locked_until (see core_ecommerce.webhooks)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    failures = models.PositiveIntegerField(default=0)
+    retry_after = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    last_delivered_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return self.name
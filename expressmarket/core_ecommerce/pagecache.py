@@ -0,0 +1,158 @@
+"""
+Full-page cache for anonymous visitors.
+
+Logged-out visitors all see the same home and product pages, so views
+using AnonymousPageCacheMixin keep the rendered page in the shared cache
+for PAGE_CACHE_TIMEOUT seconds, keyed by path and (normalised) query
+string. Signed-in users always get a freshly rendered page.
+
+Each stored page records the tags it depends on ('path:/',
+'product:<id>', 'category:<id>', ...) and the version of each tag at the
+time. purge() gives tags a new version, which makes every page carrying
+them a miss, so a product change only drops the pages that show it. A
+version starts with the time it was made, so a tag's version also serves
+as a cheap conditional GET validator (see HomeView).
+
+A page is never stored if rendering it used a CSRF token, set a cookie or
+showed flash messages, so nothing specific to one visitor is shared.
+Like the other caches, pages rendered shortly after a purge read from
+the primary.
+"""
+import hashlib
+import time
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from core_ecommerce.caching import CACHE_KEY_PREFIX, metrics, note_purge, rebuild_reads
+
+
+# Name the page cache's metrics (see cache_stats) and purges are recorded under
+PAGE_CACHE_METRICS = 'page_cache'
+
+CACHE_HEADER = 'X-Page-Cache'
+
+
+def new_version():
+    # When the tag changed, then a random part so two versions never match
+    return f'{time.time():.6f}:{uuid.uuid4().hex}'
+
+
+class PageCache:
+    def __init__(self, alias='default'):
+        self.alias = alias
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'PAGE_CACHE_TIMEOUT', 600)
+
+    def page_key(self, request):
+        query = urlencode(sorted(request.GET.lists()), doseq=True)
+        digest = hashlib.md5(f'{request.path}?{query}'.encode(), usedforsecurity=False).hexdigest()
+        return f'{CACHE_KEY_PREFIX}:page:{digest}'
+
+    def tag_key(self, tag):
+        return f'{CACHE_KEY_PREFIX}:pagetag:{tag}'
+
+    def _versions(self, tags):
+        keys = {self.tag_key(tag): tag for tag in tags}
+        found = self.shared.get_many(list(keys))
+        return {tag: found.get(key) for key, tag in keys.items()}
+
+    def get(self, request):
+        """The cached page for `request`, or None if it is missing or purged"""
+        entry = self.shared.get(self.page_key(request))
+        if entry is None or self._versions(entry['tags']) != entry['tags']:
+            metrics.incr(PAGE_CACHE_METRICS, 'misses')
+            return None
+        metrics.incr(PAGE_CACHE_METRICS, 'shared_hits')
+        response = HttpResponse(entry['content'], content_type=entry['content_type'])
+        response[CACHE_HEADER] = 'hit'
+        return response
+
+    def set(self, request, response, tags):
+        tags = {f'path:{request.path}', *tags}
+        for tag in tags:
+            self.shared.add(self.tag_key(tag), new_version(), timeout=None)
+        entry = {
+            'content': response.content,
+            'content_type': response['Content-Type'],
+            'tags': self._versions(tags),
+        }
+        self.shared.set(self.page_key(request), entry, timeout=self.timeout)
+
+    def purge(self, *tags):
+        """Drop every cached page that carries any of `tags`"""
+        self.shared.set_many({self.tag_key(tag): new_version() for tag in tags}, timeout=None)
+        note_purge(self.shared, PAGE_CACHE_METRICS)
+
+    def tag_version(self, tag):
+        """The tag's current version, starting one if it has none"""
+        key = self.tag_key(tag)
+        version = self.shared.get(key)
+        if version is None:
+            self.shared.add(key, new_version(), timeout=None)
+            version = self.shared.get(key)
+        return version
+
+    @staticmethod
+    def changed_at(version):
+        """The datetime `version` was made, or None if it does not say"""
+        stamp, _, _ = (version or '').partition(':')
+        try:
+            return datetime.fromtimestamp(float(stamp), tz=dt_timezone.utc)
+        except ValueError:
+            return None
+
+
+page_cache = PageCache()
+
+
+class AnonymousPageCacheMixin:
+    """
+    Serve GET and HEAD requests from logged-out visitors from the page
+    cache. A view can add tags for the data it shows to `self.cache_tags`
+    while handling the request; the request path is always a tag.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self._cacheable_request(request):
+            return super().dispatch(request, *args, **kwargs)
+
+        response = page_cache.get(request)
+        if response is not None:
+            return response
+
+        self.cache_tags = []
+        with rebuild_reads(page_cache.shared, PAGE_CACHE_METRICS):
+            response = super().dispatch(request, *args, **kwargs)
+        if self._cacheable_response(request, response):
+            page_cache.set(request, response, self.cache_tags)
+            response[CACHE_HEADER] = 'miss'
+        return response
+
+    def _cacheable_request(self, request):
+        return (
+            request.method in ('GET', 'HEAD')
+            and page_cache.timeout > 0
+            and not request.user.is_authenticated
+            and not len(get_messages(request))
+        )
+
+    def _cacheable_response(self, request, response):
+        return (
+            response.status_code == 200
+            and not response.streaming
+            and not response.cookies
+            and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+            and not response.has_header('Cache-Control')
+        )
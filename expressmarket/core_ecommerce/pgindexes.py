@@ -0,0 +1,36 @@
+"""
+Trigram indexes for migrations, on PostgreSQL only.
+
+GIN trigram indexes let PostgreSQL answer LIKE/ILIKE and similarity
+searches anywhere in a string from an index. They need the pg_trgm
+extension, which trigram_index() enables first; on other databases the
+operation does nothing.
+
+Django renders istartswith and icontains as UPPER(column::text) LIKE
+UPPER(%s), so indexes for those lookups are on UPPER(column).
+"""
+from django.db import migrations
+
+
+def trigram_index(name, table, expression, concurrently=True):
+    """
+    A migration operation adding a GIN trigram index on `expression`
+    (SQL, e.g. '"name"' or 'UPPER("name")'). Built CONCURRENTLY, so
+    writes carry on meanwhile, unless the table was just created; a
+    migration with concurrent indexes must set atomic = False.
+    """
+    concurrent = ' CONCURRENTLY' if concurrently else ''
+
+    def create(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        schema_editor.execute(
+            f'CREATE INDEX{concurrent} IF NOT EXISTS "{name}" ON "{table}" USING gin ({expression} gin_trgm_ops)'
+        )
+
+    def drop(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.execute(f'DROP INDEX{concurrent} IF EXISTS "{name}"')
+
+    return migrations.RunPython(create, drop)
@@ -0,0 +1,80 @@
+"""
+Primary/replica database routing.
+
+Writes always go to the primary ('default'). Reads go to the 'replica'
+alias only while a view that opted in with `read_from_replica = True` is
+handling a GET or HEAD request (see middleware.ReplicaRoutingMiddleware).
+A client that has just written is pinned to the primary for
+REPLICA_STICKY_SECONDS so it always reads its own writes, whatever the
+replication lag.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+REPLICA_DB_ALIAS = 'replica'
+
+# Cookie marking a client that wrote recently and must read from the primary
+PIN_COOKIE = 'db_pin_primary'
+
+# Per-visitor state that is read straight after being written
+PRIMARY_ONLY_MODELS = {'sessions.session', 'core_ecommerce.cart', 'core_ecommerce.cartline'}
+
+
+class RoutingState:
+    def __init__(self):
+        self.use_replica = False
+        self.wrote = False
+
+
+# Per-request routing state, set by ReplicaRoutingMiddleware; None outside requests
+routing_state = ContextVar('routing_state', default=None)
+
+
+def replica_configured():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+@contextmanager
+def primary_reads():
+    """Send this request's reads to the primary inside the block"""
+    state = routing_state.get()
+    if state is None or not state.use_replica:
+        yield
+        return
+    state.use_replica = False
+    try:
+        yield
+    finally:
+        state.use_replica = True
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = routing_state.get()
+        if (
+            state is not None
+            and state.use_replica
+            and not state.wrote
+            and model._meta.label_lower not in PRIMARY_ONLY_MODELS
+            and replica_configured()
+        ):
+            return REPLICA_DB_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = routing_state.get()
+        if state is not None and model._meta.label_lower not in PRIMARY_ONLY_MODELS:
+            # Read-your-writes: the rest of this request reads from the primary
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        aliases = {DEFAULT_DB_ALIAS, REPLICA_DB_ALIAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
@@ -1,94 +1,181 @@
-from django.db.models.signals import post_save
-from django.dispatch import receiver
+from django.contrib.auth.signals import user_logged_in
 from django.db import transaction
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 from datetime import timedelta
+import threading
+from product.fuzzy import add_search_terms
+from product.models import Category, Product, ProductReview, products_archived
+from vendor.models import Vendor
+from .cart import merge_carts_on_login
+from .caching import category_list_cache, product_detail_cache, search_cache, vendor_dashboard_cache
+from . import events
 from .models import Order, OrderItem
-
-
-# In-memory tracking to prevent duplicate emails (simple approach)
-_invoice_sent_orders = set()
+from .pagecache import page_cache
+from .tasks import send_order_invoice
 
 
 @receiver(post_save, sender=OrderItem)
 def send_order_invoice_on_item_created(sender, instance, created, **kwargs):
     """
     Send invoice email when an order item is created for a new order.
-    This ensures all order items exist before sending the email.
-    Only sends email once per order, even if multiple items are created.
+    Only one email is queued per order, however many items are created.
     """
     if created:
-        order = instance.order
-        order_id = order.id
-        
-        # Check if we've already queued/sent invoice for this order
-        if order_id in _invoice_sent_orders:
-            return
-        
-        # Only send email for orders created recently (within last 5 minutes)
-        # This prevents sending emails for old orders when items are added later
-        time_diff = timezone.now() - order.created_at
-        if time_diff > timedelta(minutes=5):
-            return
-        
-        # Mark that we're processing this order
-        _invoice_sent_orders.add(order_id)
-        
-        # Use on_commit to ensure all items in the transaction are saved
-        def send_email():
-            try:
-                # Refresh order from DB to get latest data
-                order.refresh_from_db()
-                
-                # Get all order items
-                order_items = order.items.all()
-                
-                # Skip if no items (shouldn't happen, but safety check)
-                if not order_items.exists():
-                    import logging
-                    logger = logging.getLogger(__name__)
-                    logger.warning(f'Order {order.order_number} has no items, skipping invoice email')
-                    # Remove from tracking so we can retry if needed
-                    _invoice_sent_orders.discard(order_id)
-                    return
-                
-                # Prepare email context
-                context = {
-                    'order': order,
-                    'order_items': order_items,
-                    'site_name': getattr(settings, 'SITE_NAME', 'ExpressMarket'),
-                    'site_domain': getattr(settings, 'SITE_DOMAIN', 'localhost:8000'),
-                }
-                
-                # Render email template
-                subject = f'Order Confirmation - {order.order_number}'
-                html_message = render_to_string('emails/order_invoice.html', context)
-                plain_message = render_to_string('emails/order_invoice.txt', context)
-                
-                # Send email
-                send_mail(
-                    subject=subject,
-                    message=plain_message,
-                    from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@expressmarket.com'),
-                    recipient_list=[order.email],
-                    html_message=html_message,
-                    fail_silently=False,
-                )
-                
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.info(f'Invoice email sent successfully for order {order.order_number}')
-            except Exception as e:
-                # Log the error but don't break the order creation
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.error(f'Failed to send invoice email for order {order.order_number}: {str(e)}')
-                # Remove from tracking on error so we can retry if needed
-                _invoice_sent_orders.discard(order_id)
-        
-        # Use on_commit to ensure all database operations are complete
-        transaction.on_commit(send_email)
+        queue_order_invoice(instance.order)
+
+
+def queue_order_invoice(order):
+    """
+    Queue the invoice email for a new order. Call this directly when order
+    items are created with bulk_create, which does not send post_save.
+    The task is a row written in the current transaction, so it only
+    exists, and a worker only sends it, once the order is committed.
+    """
+    # Only send email for orders created recently (within last 5 minutes)
+    # This prevents sending emails for old orders when items are added later
+    time_diff = timezone.now() - order.created_at
+    if time_diff > timedelta(minutes=5):
+        return
+    
+    # The key keeps it to one queued email per order
+    send_order_invoice.enqueue(order.id, key=f'invoice:{order.id}')
+
+
+@receiver(post_save, sender=Product)
+def record_product_change(sender, instance, created, **kwargs):
+    events.product_saved(instance, created)
+
+
+@receiver(products_archived, sender=Product)
+def record_product_archival(sender, products, active, **kwargs):
+    events.products_archived(products, active)
+
+
+@receiver(post_delete, sender=Product)
+def record_product_deletion(sender, instance, **kwargs):
+    events.product_deleted(instance)
+
+
+@receiver(post_save, sender=Order)
+def record_order_change(sender, instance, created, **kwargs):
+    events.order_saved(instance, created)
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_caches(sender, instance, **kwargs):
+    slug, vendor_id = instance.slug, instance.vendor_id
+    # Its own page, the home page and the pages listing it as related
+    tags = ('path:/', f'product:{instance.pk}', f'category:{instance.category_id}')
+
+    def invalidate():
+        product_detail_cache.delete(slug)
+        vendor_dashboard_cache.delete(vendor_id)
+        search_cache.clear()
+        page_cache.purge(*tags)
+
+    # Once the change commits, or a request could cache the old row again
+    transaction.on_commit(invalidate)
+
+
+@receiver(products_archived, sender=Product)
+def invalidate_archived_product_caches(sender, products, **kwargs):
+    # As invalidate_product_caches, once for the whole batch
+    slugs = [product.slug for product in products]
+    vendor_ids = {product.vendor_id for product in products}
+    tags = {
+        'path:/',
+        *{f'product:{product.pk}' for product in products},
+        *{f'category:{product.category_id}' for product in products},
+    }
+
+    def invalidate():
+        for slug in slugs:
+            product_detail_cache.delete(slug)
+        for vendor_id in vendor_ids:
+            vendor_dashboard_cache.delete(vendor_id)
+        search_cache.clear()
+        page_cache.purge(*tags)
+
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=Product)
+def add_product_search_terms(sender, instance, **kwargs):
+    # New words in the name become candidates for "did you mean"
+    add_search_terms(instance.name)
+
+
+class CommitBatch:
+    """
+    Keys collected during a transaction and handed to `flush` together
+    once it commits, each once however often it was added. Keys added in
+    a transaction that rolls back go out with the next commit, so `flush`
+    must be safe to repeat.
+    """
+
+    def __init__(self, flush):
+        self.flush = flush
+        self._local = threading.local()
+
+    def add(self, key):
+        self._local.__dict__.setdefault('keys', set()).add(key)
+        transaction.on_commit(self._run)
+
+    def _run(self):
+        keys, self._local.keys = getattr(self._local, 'keys', set()), set()
+        if keys:
+            self.flush(keys)
+
+
+def refresh_reviewed_products(product_ids):
+    products = Product.all_objects.filter(pk__in=product_ids)
+    products.update_ratings()
+    # Rating stats are part of the product detail payload
+    for slug in products.values_list('slug', flat=True):
+        product_detail_cache.delete(slug)
+    # The home page can be sorted by rating
+    page_cache.purge('path:/', *(f'product:{product_id}' for product_id in product_ids))
+
+
+reviewed_products = CommitBatch(refresh_reviewed_products)
+
+
+@receiver([post_save, post_delete], sender=ProductReview)
+def invalidate_review_caches(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Product) or getattr(origin, 'model', None) is Product:
+        # Deleted along with its product, which purges the product's pages itself
+        return
+    # Once for all the reviews of a product the transaction changes
+    reviewed_products.add(instance.product_id)
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_caches(sender, instance, **kwargs):
+    tags = ('path:/', f'category:{instance.pk}')
+
+    def invalidate():
+        # clear() rather than delete('all'): its generation is the category pages' ETag version
+        category_list_cache.clear()
+        # Product pages show their category's name
+        product_detail_cache.clear()
+        # Searches can be filtered by category slug
+        search_cache.clear()
+        page_cache.purge(*tags)
+
+    transaction.on_commit(invalidate)
+
+
+@receiver([post_save, post_delete], sender=Vendor)
+def invalidate_vendor_pages(sender, instance, **kwargs):
+    # Product cards and pages show the vendor's business name
+    tags = ('path:/', f'vendor:{instance.pk}')
+    transaction.on_commit(lambda: page_cache.purge(*tags))
+
 
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    """Carry the cart a visitor filled before logging in over to their account"""
+    if request is not None and hasattr(request, 'session'):
+        merge_carts_on_login(request, user)
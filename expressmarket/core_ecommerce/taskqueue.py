@@ -0,0 +1,200 @@
+"""
+A small task queue kept in the database, for work that should not hold up
+a request: emails, image processing, rollups.
+
+Functions become tasks with the @task decorator, in an app's tasks.py
+(workers import every app's tasks module on start). Enqueueing inserts a
+Task row, so a task enqueued inside a transaction only exists if the
+transaction commits, and needs no broker:
+
+    @task(priority=10)
+    def send_order_invoice(order_id):
+        ...
+
+    send_order_invoice.enqueue(order.id, key=f'invoice:{order.id}')
+
+Workers (`manage.py run_workers`) claim the highest priority tasks that
+are due with SELECT ... FOR UPDATE SKIP LOCKED, so workers never wait on
+each other, and take a lease on them. A task whose worker dies is
+claimed again once its lease runs out, so tasks run at least once and
+should be safe to repeat. A task that raises is retried after an
+exponentially growing delay until it has run max_attempts times, then
+left as failed.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from core_ecommerce.models import Task
+
+
+logger = logging.getLogger(__name__)
+
+# Longest wait between two attempts of a task
+MAX_RETRY_DELAY = 3600
+
+registry = {}
+
+
+class TaskDefinition:
+    """A function registered with @task; call it to run inline, or enqueue() it"""
+
+    def __init__(self, func, name, priority, max_attempts, retry_delay):
+        self.func = func
+        self.name = name
+        self.priority = priority
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.__doc__ = func.__doc__
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def enqueue(self, *args, key=None, priority=None, delay=0, **kwargs):
+        """
+        Queue a run with JSON-serialisable arguments. With a `key`, nothing
+        is added while a task with that key is queued or running.
+        """
+        Task.objects.bulk_create(
+            [Task(
+                name=self.name,
+                args=list(args),
+                kwargs=kwargs,
+                key=key,
+                priority=self.priority if priority is None else priority,
+                max_attempts=self.max_attempts,
+                run_after=timezone.now() + timedelta(seconds=delay),
+            )],
+            ignore_conflicts=key is not None,
+        )
+
+
+def task(name=None, priority=0, max_attempts=5, retry_delay=30):
+    """Register a function as a task. Higher priorities run first; retries wait retry_delay seconds, doubling"""
+    def register(func):
+        definition = TaskDefinition(
+            func,
+            name or f'{func.__module__}.{func.__qualname__}',
+            priority,
+            max_attempts,
+            retry_delay,
+        )
+        registry[definition.name] = definition
+        return definition
+    return register
+
+
+def load_tasks():
+    """Import the tasks module of every installed app, registering its tasks"""
+    autodiscover_modules('tasks')
+
+
+def retry_delay(base, attempts):
+    """Seconds before retrying a task that has failed `attempts` times: doubling, capped, half of it random"""
+    delay = min(base * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def claimable(now):
+    return Q(status=Task.QUEUED, run_after__lte=now) | Q(status=Task.RUNNING, locked_until__lt=now)
+
+
+def claim(worker, limit=1, lease=None):
+    """Lease up to `limit` due tasks to `worker`, highest priority first"""
+    now = timezone.now()
+    lease = settings.TASK_LEASE_SECONDS if lease is None else lease
+    token = f'{worker}:{uuid.uuid4().hex[:8]}'
+    with transaction.atomic():
+        ids = list(
+            Task.objects.filter(claimable(now))
+            .order_by('-priority', 'run_after', 'id')
+            .select_for_update(skip_locked=True)
+            .values_list('id', flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        # Re-checked in the UPDATE, for databases without row locks (SQLite)
+        Task.objects.filter(claimable(now), id__in=ids).update(
+            status=Task.RUNNING,
+            locked_by=token,
+            locked_until=now + timedelta(seconds=lease),
+            attempts=F('attempts') + 1,
+        )
+    return list(Task.objects.filter(locked_by=token, status=Task.RUNNING).order_by('-priority', 'run_after', 'id'))
+
+
+def execute(claimed):
+    """Run a claimed task, then delete it, schedule a retry or mark it failed"""
+    held = Task.objects.filter(pk=claimed.pk, locked_by=claimed.locked_by)
+    definition = registry.get(claimed.name)
+    try:
+        if definition is None:
+            raise LookupError(f'Unknown task {claimed.name!r}')
+        definition.func(*claimed.args, **claimed.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning('Task %s (%s) failed on attempt %s', claimed.name, claimed.pk, claimed.attempts)
+        if claimed.attempts >= claimed.max_attempts or definition is None:
+            # Frees the key, so the work can be queued again
+            held.update(status=Task.FAILED, key=None, locked_by='', locked_until=None, last_error=error)
+            return False
+        delay = retry_delay(definition.retry_delay, claimed.attempts)
+        held.update(
+            status=Task.QUEUED,
+            run_after=timezone.now() + timedelta(seconds=delay),
+            locked_by='',
+            locked_until=None,
+            last_error=error,
+        )
+        return False
+    held.delete()
+    return True
+
+
+def worker_name():
+    return f'{socket.gethostname()[:50]}:{os.getpid()}:{threading.get_ident()}'
+
+
+def work(stop=None, batch_size=1, lease=None, poll_interval=None, burst=False):
+    """
+    Claim and run tasks until `stop` is set, or, with `burst`, until none
+    are due. Returns the number of tasks run.
+    """
+    stop = stop or threading.Event()
+    poll_interval = settings.TASK_POLL_INTERVAL if poll_interval is None else poll_interval
+    name = worker_name()
+    done = 0
+    while not stop.is_set():
+        if not connection.in_atomic_block:
+            # As between requests: drop connections that broke or reached CONN_MAX_AGE
+            close_old_connections()
+        try:
+            claimed = claim(name, batch_size, lease)
+        except DatabaseError:
+            # Lost connection, lock timeout...: keep the worker alive and try again
+            logger.exception('Claiming tasks failed')
+            stop.wait(poll_interval)
+            continue
+        if not claimed:
+            if burst:
+                break
+            stop.wait(poll_interval)
+            continue
+        for item in claimed:
+            try:
+                execute(item)
+            except DatabaseError:
+                logger.exception('Recording the outcome of task %s failed; it runs again once its lease ends', item.pk)
+            done += 1
+    return done
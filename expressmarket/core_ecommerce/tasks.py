@@ -0,0 +1,39 @@
+import logging
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.template.loader import render_to_string
+
+from .models import Order
+from .taskqueue import task
+
+
+logger = logging.getLogger(__name__)
+
+
+@task(priority=10, retry_delay=60)
+def send_order_invoice(order_id):
+    """Email the invoice for an order; raises on failure so the email is retried"""
+    order = Order.objects.filter(pk=order_id).first()
+    if order is None:
+        return
+    order_items = list(order.items.select_related('product'))
+    if not order_items:
+        logger.warning(f'Order {order.order_number} has no items, skipping invoice email')
+        return
+    
+    context = {
+        'order': order,
+        'order_items': order_items,
+        'site_name': getattr(settings, 'SITE_NAME', 'ExpressMarket'),
+        'site_domain': getattr(settings, 'SITE_DOMAIN', 'localhost:8000'),
+    }
+    send_mail(
+        subject=f'Order Confirmation - {order.order_number}',
+        message=render_to_string('emails/order_invoice.txt', context),
+        from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@expressmarket.com'),
+        recipient_list=[order.email],
+        html_message=render_to_string('emails/order_invoice.html', context),
+        fail_silently=False,
+    )
+    logger.info(f'Invoice email sent successfully for order {order.order_number}')
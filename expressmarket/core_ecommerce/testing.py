@@ -0,0 +1,237 @@
+"""
+Query-budget helpers shared by the apps' test suites.
+
+Every named URL gets a ceiling on the number of SQL queries one request
+may run (QUERY_BUDGETS). Views that render lists are also checked at two
+data sizes: the count has to stay the same, which is what catches N+1s
+that a fixed ceiling would only notice once the list is long enough.
+"""
+from contextlib import contextmanager
+from decimal import Decimal
+import itertools
+
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver
+
+from accounts.models import User
+from core_ecommerce.caching import ALL_CACHES
+from core_ecommerce.cart import CART_SESSION_KEY
+from core_ecommerce.models import Cart, Order, OrderItem
+from core_ecommerce.routers import PIN_COOKIE
+from product.cards import local_cards
+from product.models import Category, Product, ProductReview
+from vendor.models import Vendor
+
+
+# Maximum queries per request, keyed by URL name. Session and auth lookups
+# are included, so an authenticated request starts at two.
+QUERY_BUDGETS = {
+    'core_ecommerce:home': 7,
+    'core_ecommerce:cart': 5,
+    'core_ecommerce:add_to_cart': 10,
+    'core_ecommerce:update_cart': 10,
+    'core_ecommerce:remove_from_cart': 10,
+    'core_ecommerce:clear_cart': 10,
+    'core_ecommerce:cart_api': 11,
+    'core_ecommerce:checkout': 18,
+    'core_ecommerce:order_success': 5,
+    'core_ecommerce:my_orders': 5,
+    'core_ecommerce:order_detail': 5,
+    'product:product_detail': 9,
+    'product:category_list': 4,
+    'product:category_create': 6,
+    'product:category_edit': 6,
+    'product:category_delete': 8,
+    'product:add_review': 8,
+    'product:edit_review': 7,
+    'product:delete_review': 7,
+    'product:catalog_feed': 3,
+    'product:sitemap_index': 0,
+    'product:sitemap_shard': 0,
+    'vendor:vendor_dashboard': 10,
+    'vendor:store_create': 4,
+    'vendor:product_list': 6,
+    'vendor:product_create': 4,
+    'vendor:product_edit': 9,
+    'vendor:product_archive': 7,
+    'vendor:product_unarchive': 7,
+    'vendor:order_status': 11,
+    'vendor:order_export': 4,
+    'accounts:user_type': 1,
+    'accounts:login': 10,
+    'accounts:logout': 4,
+    'accounts:register': 1,
+    'accounts:password_reset': 4,
+    'accounts:password_reset_done': 1,
+    'accounts:password_reset_confirm': 5,
+    'accounts:password_reset_complete': 1,
+}
+
+BUDGETED_APPS = ('core_ecommerce', 'product', 'vendor', 'accounts')
+
+
+def reset_caches():
+    """
+    Empty the whole shared cache, page cache and card fragments included,
+    and every cache's memory tier. Only for tests: it wipes every key in
+    the default cache, not just this project's.
+    """
+    caches['default'].clear()
+    for cache in ALL_CACHES:
+        cache.local.clear()
+    local_cards.clear()
+
+
+def url_names(namespaces=BUDGETED_APPS):
+    """All 'namespace:name' URL names registered under the given namespaces"""
+    names = set()
+    resolver = get_resolver()
+    for namespace in namespaces:
+        _, sub_resolver = resolver.namespace_dict[namespace]
+        names.update(
+            f'{namespace}:{name}' for name in sub_resolver.reverse_dict
+            if isinstance(name, str)
+        )
+    return names
+
+
+_sequence = itertools.count()
+
+
+def make_customer(**kwargs):
+    n = next(_sequence)
+    kwargs.setdefault('username', f'customer{n}')
+    kwargs.setdefault('email', f'customer{n}@example.com')
+    return User.objects.create_user(user_type='customer', **kwargs)
+
+
+def make_vendor(**kwargs):
+    n = next(_sequence)
+    user = User.objects.create_user(
+        username=f'vendor{n}', email=f'vendor{n}@example.com',
+        user_type='vendor',
+    )
+    kwargs.setdefault('logo', 'vendor/logs/seed.png')
+    kwargs.setdefault('business_name', f'Vendor {n}')
+    kwargs.setdefault('tin', str(n))
+    kwargs.setdefault('rating', 4)
+    return Vendor.objects.create(user=user, **kwargs)
+
+
+def make_category(**kwargs):
+    kwargs.setdefault('name', f'Category {next(_sequence)}')
+    return Category.objects.create(**kwargs)
+
+
+def make_products(count, vendor=None, category=None, price=Decimal('10.00')):
+    """Create `count` products; each gets its own vendor unless one is given"""
+    category = category or make_category()
+    products = []
+    for _ in range(count):
+        n = next(_sequence)
+        products.append(Product.objects.create(
+            name=f'Product {n}',
+            description='Test product',
+            price=price,
+            image='products/seed.png',
+            category=category,
+            vendor=vendor or make_vendor(),
+        ))
+    return products
+
+
+def make_order(customer, products, status='pending', quantity=1):
+    subtotal = sum((product.price * quantity for product in products), Decimal('0.00'))
+    order = Order.objects.create(
+        customer=customer, status=status,
+        first_name='Test', last_name='Customer', email=customer.email,
+        phone='0911000000', shipping_address='Bole Road', city='Addis Ababa',
+        subtotal=subtotal, total=subtotal,
+    )
+    order.add_items([
+        OrderItem(product=product, quantity=quantity,
+                  price=product.price, subtotal=product.price * quantity)
+        for product in products
+    ])
+    return order
+
+
+def make_reviews(product, count):
+    users = [make_customer() for _ in range(count)]
+    ProductReview.objects.bulk_create([
+        ProductReview(product=product, user=user, rating=4, comment='Good')
+        for user in users
+    ])
+
+
+def set_cart(client, products, quantity=1):
+    """Replace the cart of the client's session with one line per product"""
+    session = client.session
+    user_id = session.get(SESSION_KEY)
+    cart = (
+        Cart.objects.filter(pk=session.get(CART_SESSION_KEY)).first()
+        or Cart.objects.filter(user_id=user_id).first()
+        or Cart.objects.create(user_id=user_id)
+    )
+    cart.clear()
+    cart.add_quantities({product.pk: quantity for product in products})
+    session[CART_SESSION_KEY] = cart.pk
+    session.save()
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin for asserting per-view query budgets. Budgets are for
+    the worst case: caches are emptied before every counted request, and
+    requests are pinned to the primary database so the same queries are
+    counted whether or not a read replica is configured.
+    """
+
+    @contextmanager
+    def assertMaxQueries(self, budget, using=DEFAULT_DB_ALIAS):
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+        executed = len(context)
+        if executed > budget:
+            queries = '\n'.join(
+                f'{i}. {query["sql"]}' for i, query in enumerate(context.captured_queries, start=1)
+            )
+            self.fail(f'{executed} queries executed, budget is {budget}:\n{queries}')
+
+    def count_queries(self, request, using=DEFAULT_DB_ALIAS):
+        """Run `request()` (including any streamed body) and return the query count"""
+        reset_caches()
+        self.client.cookies[PIN_COOKIE] = '1'
+        with CaptureQueriesContext(connections[using]) as context:
+            response = request()
+            if response.streaming:
+                b''.join(response.streaming_content)
+        return len(context)
+
+    def assertWithinBudget(self, url_name, request):
+        """Run `request()` and check it against the budget for `url_name`"""
+        budget = QUERY_BUDGETS[url_name]
+        reset_caches()
+        self.client.cookies[PIN_COOKIE] = '1'
+        with self.assertMaxQueries(budget):
+            response = request()
+            if response.streaming:
+                b''.join(response.streaming_content)
+        return response
+
+    def assertConstantQueries(self, url_name, request, grow):
+        """
+        Check `request()` against its budget, call `grow()` to add data,
+        and check that the second request runs exactly as many queries.
+        """
+        small = self.count_queries(request)
+        grow()
+        large = self.count_queries(request)
+        self.assertEqual(
+            small, large,
+            f'{url_name}: {small} queries with little data, {large} with more (N+1?)',
+        )
+        self.assertLessEqual(large, QUERY_BUDGETS[url_name], f'{url_name} is over its query budget')
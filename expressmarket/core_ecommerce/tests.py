@@ -1,3 +1,1030 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import json
+import threading
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib import admin
+from django.core import mail
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.views import View
+
+from accounts.models import User
+from core_ecommerce.admin import ScalableAdminMixin
+from core_ecommerce.caching import ALL_CACHES, CacheAside, Entry, metrics, purged_key
+from core_ecommerce.middleware import ReplicaRoutingMiddleware
+from core_ecommerce.cart import CART_SESSION_KEY
+from core_ecommerce.conditional import ConditionalGetMixin
+from core_ecommerce.context_processors import cart_context
+from core_ecommerce.pagecache import PAGE_CACHE_METRICS
+from core_ecommerce.models import MAX_CART_QUANTITY, Cart, CartLine, ChangeEvent, EventSubscriber, Order, Task
+from core_ecommerce.routers import PIN_COOKIE, REPLICA_DB_ALIAS, PrimaryReplicaRouter
+from core_ecommerce.taskqueue import claim, execute, task, work
+from core_ecommerce.webhooks import SIGNATURE_HEADER, deliver_next, dispatch, new_pool
+from core_ecommerce.views import CheckoutView, HomeView
+from django.contrib.sessions.models import Session
+from product.models import Product, ProductReview
+from core_ecommerce.testing import (
+    QUERY_BUDGETS, QueryBudgetMixin, make_category, make_customer, make_order, make_products,
+    reset_caches, set_cart, url_names,
+)
+
+
+class QueryBudgetCoverageTests(TestCase):
+    def test_every_url_has_a_budget(self):
+        missing = sorted(url_names() - set(QUERY_BUDGETS))
+        self.assertEqual(missing, [], 'Add these URL names to QUERY_BUDGETS in core_ecommerce/testing.py')
+
+    def test_no_stale_budgets(self):
+        stale = sorted(set(QUERY_BUDGETS) - url_names())
+        self.assertEqual(stale, [])
+
+
+class StorefrontQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.customer = make_customer()
+        self.products = make_products(1)
+
+    def test_home(self):
+        url = reverse('core_ecommerce:home')
+        self.assertConstantQueries(
+            'core_ecommerce:home',
+            lambda: self.client.get(url),
+            lambda: make_products(30, category=self.products[0].category),
+        )
+
+    def test_home_deep_pages(self):
+        make_products(60, category=self.products[0].category)
+        # Signed in, so every request renders instead of hitting the page cache
+        self.client.force_login(self.customer)
+        url = reverse('core_ecommerce:home')
+        slug = self.products[0].category.slug
+        first = self.count_queries(lambda: self.client.get(url))
+        page = self.client.get(url).context['category_rows'][0]['products']
+        while page.has_next():
+            params = {f'page_{slug}': page.next_cursor}
+            self.assertEqual(self.count_queries(lambda: self.client.get(url, params)), first)
+            page = self.client.get(url, params).context['category_rows'][0]['products']
+        self.assertEqual(len(page), 1)
+
+    def test_cart(self):
+        self.client.force_login(self.customer)
+        set_cart(self.client, self.products)
+        url = reverse('core_ecommerce:cart')
+
+        def grow():
+            set_cart(self.client, self.products + make_products(100))
+
+        self.assertConstantQueries('core_ecommerce:cart', lambda: self.client.get(url), grow)
+
+    def test_cart_actions(self):
+        self.client.force_login(self.customer)
+        set_cart(self.client, self.products + make_products(20))
+        product = self.products[0]
+        self.assertWithinBudget(
+            'core_ecommerce:add_to_cart',
+            lambda: self.client.post(reverse('core_ecommerce:add_to_cart', args=[product.id]), {'quantity': 1}),
+        )
+        self.assertWithinBudget(
+            'core_ecommerce:update_cart',
+            lambda: self.client.post(reverse('core_ecommerce:update_cart', args=[product.id]), {'quantity': 3}),
+        )
+        self.assertWithinBudget(
+            'core_ecommerce:remove_from_cart',
+            lambda: self.client.post(reverse('core_ecommerce:remove_from_cart', args=[product.id])),
+        )
+        self.assertWithinBudget(
+            'core_ecommerce:clear_cart',
+            lambda: self.client.post(reverse('core_ecommerce:clear_cart')),
+        )
+
+    def test_cart_api(self):
+        self.client.force_login(self.customer)
+        set_cart(self.client, self.products)
+        url = reverse('core_ecommerce:cart_api')
+
+        def grow():
+            set_cart(self.client, self.products + make_products(100))
+
+        self.assertConstantQueries('core_ecommerce:cart_api', lambda: self.client.get(url), grow)
+
+        batch = [{'product_id': product.id, 'add': 1} for product in make_products(20)]
+        batch.append({'product_id': self.products[0].id, 'quantity': 0})
+        self.assertWithinBudget(
+            'core_ecommerce:cart_api',
+            lambda: self.client.post(url, json.dumps({'lines': batch}), content_type='application/json'),
+        )
+
+
+class CheckoutQueryBudgetTests(QueryBudgetMixin, TestCase):
+    checkout_data = {
+        'first_name': 'Abebe',
+        'last_name': 'Kebede',
+        'email': 'abebe@example.com',
+        'phone': '0911000000',
+        'shipping_address': 'Bole Road',
+        'city': 'Addis Ababa',
+        'country': 'Ethiopia',
+    }
+
+    def setUp(self):
+        self.customer = make_customer()
+        self.client.force_login(self.customer)
+        self.url = reverse('core_ecommerce:checkout')
+
+    def test_checkout_page(self):
+        products = make_products(1)
+        set_cart(self.client, products)
+
+        def grow():
+            set_cart(self.client, products + make_products(100))
+
+        self.assertConstantQueries('core_ecommerce:checkout', lambda: self.client.get(self.url), grow)
+
+    def test_place_order(self):
+        set_cart(self.client, make_products(1))
+
+        def grow():
+            set_cart(self.client, make_products(100))
+
+        self.assertConstantQueries(
+            'core_ecommerce:checkout',
+            lambda: self.client.post(self.url, self.checkout_data),
+            grow,
+        )
+        order = Order.objects.latest('id')
+        self.assertEqual(order.items.count(), 100)
+        # Every product has its own vendor
+        self.assertEqual(order.vendor_orders.count(), 100)
+
+
+class OrderQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.customer = make_customer()
+        self.client.force_login(self.customer)
+        self.order = make_order(self.customer, make_products(1))
+
+    def test_my_orders(self):
+        url = reverse('core_ecommerce:my_orders')
+
+        def grow():
+            for _ in range(9):
+                make_order(self.customer, make_products(3))
+
+        self.assertConstantQueries('core_ecommerce:my_orders', lambda: self.client.get(url), grow)
+
+    def test_order_success(self):
+        url = reverse('core_ecommerce:order_success', args=[self.order.id])
+        order = self.order
+        self.assertConstantQueries(
+            'core_ecommerce:order_success',
+            lambda: self.client.get(url),
+            lambda: order.items.bulk_create([
+                order.items.model(order=order, product=product, quantity=1,
+                                  price=product.price, subtotal=product.price)
+                for product in make_products(50)
+            ]),
+        )
+
+    def test_order_detail(self):
+        url = reverse('core_ecommerce:order_detail', args=[self.order.id])
+        order = self.order
+        self.assertConstantQueries(
+            'core_ecommerce:order_detail',
+            lambda: self.client.get(url),
+            lambda: order.items.bulk_create([
+                order.items.model(order=order, product=product, quantity=1,
+                                  price=product.price, subtotal=product.price)
+                for product in make_products(50)
+            ]),
+        )
+
+
+@mock.patch.dict(settings.DATABASES, {REPLICA_DB_ALIAS: settings.DATABASES.get(REPLICA_DB_ALIAS, {})})
+class ReplicaRoutingTests(SimpleTestCase):
+    router = PrimaryReplicaRouter()
+
+    def route(self, method='get', view=HomeView, cookies=None, write=False, model=Product):
+        """Return (alias a read of `model` is routed to, response) for one request"""
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        routed = {}
+
+        def get_response(request):
+            middleware.process_view(request, view.as_view(), (), {})
+            if write:
+                self.router.db_for_write(Order)
+            routed['alias'] = self.router.db_for_read(model)
+            return HttpResponse()
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        response = middleware(request)
+        return routed['alias'], response
+
+    def test_read_only_view_reads_from_replica(self):
+        alias, response = self.route()
+        self.assertEqual(alias, REPLICA_DB_ALIAS)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_other_views_read_from_primary(self):
+        alias, _ = self.route(view=CheckoutView)
+        self.assertIsNone(alias)
+
+    def test_sessions_always_read_from_primary(self):
+        alias, _ = self.route(model=Session)
+        self.assertIsNone(alias)
+
+    def test_post_pins_client_to_primary(self):
+        alias, response = self.route(method='post')
+        self.assertIsNone(alias)
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], settings.REPLICA_STICKY_SECONDS)
+
+    def test_pinned_client_reads_from_primary(self):
+        alias, _ = self.route(cookies={PIN_COOKIE: '1'})
+        self.assertIsNone(alias)
+
+    def test_reads_after_a_write_go_to_primary(self):
+        alias, response = self.route(write=True)
+        self.assertIsNone(alias)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_outside_requests_read_from_primary(self):
+        self.assertIsNone(self.router.db_for_read(Product))
+
+    def serve(self, respond):
+        """Run `respond()` inside a read-only request that is routed to the replica"""
+        def get_response(request):
+            middleware.process_view(request, HomeView.as_view(), (), {})
+            return respond()
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        return middleware(RequestFactory().get('/'))
+
+    def test_streamed_bodies_are_routed_like_the_view(self):
+        def rows():
+            yield str(self.router.db_for_read(Product))
+
+        response = self.serve(lambda: StreamingHttpResponse(rows()))
+        self.assertEqual(b''.join(response.streaming_content), REPLICA_DB_ALIAS.encode())
+
+    def test_cache_rebuilds_read_from_primary_after_a_purge(self):
+        cache = CacheAside('routing_test', ttl=60, local_timeout=0)
+        cache.shared.delete(purged_key(cache.name))
+
+        def rebuild():
+            alias = cache.get(uuid.uuid4().hex, compute=lambda: self.router.db_for_read(Product))
+            return HttpResponse(str(alias))
+
+        self.assertEqual(self.serve(rebuild).content, REPLICA_DB_ALIAS.encode())
+        cache.clear()
+        self.assertEqual(self.serve(rebuild).content, b'None')
+
+
+UNMIRRORED_REPLICA = (
+    REPLICA_DB_ALIAS in settings.DATABASES
+    and not settings.DATABASES[REPLICA_DB_ALIAS].get('TEST', {}).get('MIRROR')
+)
+
+
+@skipUnless(UNMIRRORED_REPLICA, 'needs an unmirrored replica database, e.g. a second SQLite file')
+class ReplicaStickinessTests(TestCase):
+    """
+    With a separate replica test database nothing written to the primary is
+    ever replicated, so any read that reaches the replica comes back stale.
+    """
+    databases = {'default', REPLICA_DB_ALIAS} if UNMIRRORED_REPLICA else {'default'}
+
+    def setUp(self):
+        self.product = make_products(1)[0]
+        # As if the purges were long enough ago that rebuilds read the replica again
+        caches['default'].delete_many(
+            [purged_key(cache.name) for cache in ALL_CACHES] + [purged_key(PAGE_CACHE_METRICS)]
+        )
+
+    def test_home_is_stale_until_client_writes(self):
+        home = reverse('core_ecommerce:home')
+        self.assertNotContains(self.client.get(home), self.product.name)
+
+        self.client.post(reverse('core_ecommerce:add_to_cart', args=[self.product.id]), {'quantity': 1})
+        self.assertContains(self.client.get(home), self.product.name)
+
+    def test_order_success_sees_its_own_order(self):
+        customer = make_customer()
+        User.objects.using(REPLICA_DB_ALIAS).bulk_create([customer])
+        self.client.force_login(customer)
+        set_cart(self.client, [self.product])
+
+        response = self.client.post(reverse('core_ecommerce:checkout'), CheckoutQueryBudgetTests.checkout_data)
+        success = self.client.get(response['Location'])
+        self.assertContains(success, Order.objects.get().order_number)
+
+        del self.client.cookies[PIN_COOKIE]
+        self.assertEqual(self.client.get(response['Location']).status_code, 404)
+
+
+class CacheAsideTests(SimpleTestCase):
+    def setUp(self):
+        self.name = f'test-{uuid.uuid4().hex[:8]}'
+        self.cache = CacheAside(self.name, ttl=60)
+        self.calls = 0
+        self.calls_lock = threading.Lock()
+
+    def slow_compute(self):
+        with self.calls_lock:
+            self.calls += 1
+        time.sleep(0.2)
+        return 'fresh'
+
+    def run_concurrently(self, functions):
+        """Start all functions at the same moment and return their results"""
+        barrier = threading.Barrier(len(functions))
+        results = [None] * len(functions)
+
+        def run(i, function):
+            barrier.wait()
+            results[i] = function()
+
+        threads = [threading.Thread(target=run, args=(i, f)) for i, f in enumerate(functions)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def store(self, value, expires_in, delta=0.1):
+        key = self.cache.key('k')
+        self.cache.shared.set(key, Entry(value, time.time() + expires_in, delta), 120)
+        self.cache.local.delete(key)
+
+    def test_concurrent_misses_in_one_process_compute_once(self):
+        get = lambda: self.cache.get('k', compute=self.slow_compute)
+        results = self.run_concurrently([get] * 10)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, ['fresh'] * 10)
+
+    def test_concurrent_misses_across_workers_compute_once(self):
+        # Separate instances share nothing but the shared tier, like workers
+        workers = [CacheAside(self.name, ttl=60) for _ in range(6)]
+        results = self.run_concurrently([
+            lambda worker=worker: worker.get('k', compute=self.slow_compute) for worker in workers
+        ])
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, ['fresh'] * 6)
+        self.assertEqual(metrics.totals([self.name])[self.name]['rebuilds'], 1)
+
+    def test_stale_value_is_served_while_one_caller_rebuilds(self):
+        self.store('stale', expires_in=-1)
+        results = self.run_concurrently([lambda: self.cache.get('k', compute=self.slow_compute)] * 8)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(sorted(results), ['fresh'] + ['stale'] * 7)
+        self.assertEqual(self.cache.get('k', compute=self.slow_compute), 'fresh')
+
+    def test_probabilistic_early_expiry(self):
+        self.store('cached', expires_in=1, delta=1)
+        with mock.patch('core_ecommerce.caching.random.random', return_value=0.0):
+            self.assertEqual(self.cache.get('k', compute=self.slow_compute), 'cached')
+        with mock.patch('core_ecommerce.caching.random.random', return_value=0.99):
+            self.assertEqual(self.cache.get('k', compute=self.slow_compute), 'fresh')
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(metrics.totals([self.name])[self.name]['early_rebuilds'], 1)
+
+    def test_hits_come_from_the_local_tier(self):
+        self.cache.get('k', compute=self.slow_compute)
+        with mock.patch.object(self.cache.shared, 'get', side_effect=AssertionError('shared tier read')):
+            self.assertEqual(self.cache.get('k', compute=self.slow_compute), 'fresh')
+        counts = metrics.totals([self.name])[self.name]
+        self.assertEqual((counts['misses'], counts['local_hits']), (1, 1))
+
+    def test_delete_and_clear(self):
+        self.cache.get('k', compute=self.slow_compute)
+        self.cache.delete('k')
+        self.cache.get('k', compute=self.slow_compute)
+        self.assertEqual(self.calls, 2)
+
+        other_key = self.cache.key('other')
+        self.cache.clear()
+        self.assertNotEqual(self.cache.key('other'), other_key)
+        self.cache.get('k', compute=self.slow_compute)
+        self.assertEqual(self.calls, 3)
+
+
+class CartStoreTests(TestCase):
+    def setUp(self):
+        self.products = make_products(3)
+        self.customer = make_customer()
+
+    def add(self, product, quantity=1):
+        self.client.post(reverse('core_ecommerce:add_to_cart', args=[product.id]), {'quantity': quantity})
+
+    def test_lines_and_cached_totals(self):
+        self.add(self.products[0], 2)
+        self.add(self.products[0], 1)
+        self.add(self.products[1])
+        cart = Cart.objects.get()
+        self.assertIsNone(cart.user)
+        self.assertEqual(dict(cart.lines.values_list('product_id', 'quantity')), {
+            self.products[0].id: 3, self.products[1].id: 1,
+        })
+        self.assertEqual((cart.item_count, cart.subtotal), (4, 40))
+        self.assertEqual(self.client.get(reverse('core_ecommerce:home')).context['cart_count'], 4)
+
+    def test_login_merges_anonymous_cart_into_user_cart(self):
+        user_cart = Cart.objects.create(user=self.customer)
+        user_cart.add_quantities({self.products[0].id: 1, self.products[2].id: 5})
+        self.add(self.products[0], 2)
+        self.add(self.products[1])
+
+        self.client.force_login(self.customer)
+
+        self.assertEqual(Cart.objects.count(), 1)
+        user_cart.refresh_from_db()
+        self.assertEqual(dict(user_cart.lines.values_list('product_id', 'quantity')), {
+            self.products[0].id: 3, self.products[1].id: 1, self.products[2].id: 5,
+        })
+        self.assertEqual(user_cart.item_count, 9)
+        self.assertEqual(self.client.session[CART_SESSION_KEY], user_cart.pk)
+
+    def test_login_adopts_anonymous_cart(self):
+        self.add(self.products[0])
+        self.client.force_login(self.customer)
+        self.assertEqual(Cart.objects.get().user, self.customer)
+
+    def test_login_finds_saved_cart(self):
+        Cart.objects.create(user=self.customer).add(self.products[0], 2)
+        self.client.force_login(self.customer)
+        request = RequestFactory().get('/')
+        request.session, request.user = self.client.session, self.customer
+        self.assertEqual(cart_context(request), {'cart_count': 2})
+
+    def test_session_cart_from_before_the_store_is_imported(self):
+        session = self.client.session
+        session['cart'] = {str(self.products[0].id): 2, '999999': 1}
+        session.save()
+        response = self.client.get(reverse('core_ecommerce:cart'))
+        self.assertEqual(response.context['cart_count'], 2)
+        self.assertNotIn('cart', self.client.session)
+        self.assertEqual(Cart.objects.get().item_count, 2)
+
+    def test_checkout_empties_the_cart(self):
+        self.client.force_login(self.customer)
+        self.add(self.products[0])
+        self.client.post(reverse('core_ecommerce:checkout'), CheckoutQueryBudgetTests.checkout_data)
+        cart = Cart.objects.get(user=self.customer)
+        self.assertEqual((cart.item_count, cart.lines.count()), (0, 0))
+
+    def test_concurrently_created_lines_are_added_to(self):
+        cart = Cart.objects.create()
+        product = self.products[0]
+        apply_changes = Cart._apply_changes
+
+        def race(*args):
+            # Another request inserts the same line first, so ours fails
+            if not CartLine.objects.exists():
+                CartLine.objects.create(cart=cart, product=product, quantity=2)
+                raise IntegrityError('cartline_cart_product_uniq')
+            return apply_changes(*args)
+
+        with mock.patch.object(Cart, '_apply_changes', autospec=True, side_effect=race):
+            self.assertEqual(cart.apply_changes(added={product.id: 1}), {product.id: 3})
+        self.assertEqual(cart.lines.get().quantity, 3)
+        self.assertEqual(cart.item_count, 3)
+
+    def test_checkout_keeps_lines_for_archived_products(self):
+        self.client.force_login(self.customer)
+        self.add(self.products[0])
+        self.add(self.products[1])
+        Product.objects.filter(pk=self.products[1].pk).archive()
+        self.client.post(reverse('core_ecommerce:checkout'), CheckoutQueryBudgetTests.checkout_data)
+        self.assertEqual(list(Order.objects.get().items.values_list('product_id', flat=True)), [self.products[0].id])
+        cart = Cart.objects.get(user=self.customer)
+        self.assertEqual(list(cart.lines.values_list('product_id', flat=True)), [self.products[1].id])
+        self.assertEqual(cart.item_count, 0)
+
+
+class CartAPITests(TestCase):
+    def setUp(self):
+        self.products = make_products(3)
+        self.url = reverse('core_ecommerce:cart_api')
+
+    def post(self, data):
+        return self.client.post(self.url, json.dumps(data), content_type='application/json')
+
+    def test_single_add_returns_changed_line_and_totals(self):
+        response = self.post({'product_id': self.products[0].id, 'add': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'lines': [{
+                'product_id': self.products[0].id,
+                'name': self.products[0].name,
+                'price': '10.00',
+                'quantity': 2,
+                'line_total': '20.00',
+            }],
+            'cart_count': 2,
+            'subtotal': '20.00',
+        })
+
+    def test_batch_changes_only_return_touched_lines(self):
+        self.post({'lines': [
+            {'product_id': self.products[0].id, 'add': 1},
+            {'product_id': self.products[1].id, 'add': 4},
+        ]})
+        response = self.post({'lines': [
+            {'product_id': self.products[0].id, 'add': 2},
+            {'product_id': self.products[1].id, 'quantity': 0},
+            {'product_id': self.products[2].id, 'quantity': 5},
+        ]})
+        data = response.json()
+        self.assertEqual(
+            {line['product_id']: line['quantity'] for line in data['lines']},
+            {self.products[0].id: 3, self.products[1].id: 0, self.products[2].id: 5},
+        )
+        self.assertEqual((data['cart_count'], data['subtotal']), (8, '80.00'))
+        cart = Cart.objects.get()
+        self.assertEqual(dict(cart.lines.values_list('product_id', 'quantity')), {
+            self.products[0].id: 3, self.products[2].id: 5,
+        })
+
+        full = self.client.get(self.url).json()
+        self.assertEqual([line['product_id'] for line in full['lines']], [self.products[0].id, self.products[2].id])
+        self.assertEqual(full['cart_count'], 8)
+
+    def test_removing_from_an_empty_cart_creates_nothing(self):
+        response = self.post({'product_id': self.products[0].id, 'quantity': 0})
+        self.assertEqual(response.json()['cart_count'], 0)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_invalid_changes_are_rejected(self):
+        for data in [
+            [],
+            {'lines': []},
+            {'product_id': 'x', 'add': 1},
+            {'product_id': self.products[0].id},
+            {'product_id': self.products[0].id, 'add': 1, 'quantity': 1},
+            {'product_id': self.products[0].id, 'add': 0},
+            {'product_id': self.products[0].id, 'quantity': -1},
+            {'product_id': self.products[0].id, 'quantity': MAX_CART_QUANTITY + 1},
+            {'product_id': self.products[0].id, 'add': 10 ** 20},
+            {'product_id': 0, 'add': 1},
+            {'product_id': 2 ** 63, 'add': 1},
+        ]:
+            with self.subTest(data=data):
+                self.assertEqual(self.post(data).status_code, 400)
+        unknown = self.products[-1].id + 1000
+        response = self.post({'lines': [{'product_id': self.products[0].id, 'add': 1}, {'product_id': unknown, 'add': 1}]})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['product_ids'], [unknown])
+        self.assertFalse(Cart.objects.exists())
+
+    def test_quantities_are_capped(self):
+        product_id = self.products[0].id
+        self.post({'lines': [{'product_id': product_id, 'add': MAX_CART_QUANTITY}] * 2})
+        response = self.post({'product_id': product_id, 'add': 1})
+        self.assertEqual(response.json()['lines'][0]['quantity'], MAX_CART_QUANTITY)
+
+
+class HomeConditionalGetTests(TestCase):
+    def setUp(self):
+        self.products = make_products(2)
+        self.url = reverse('core_ecommerce:home')
+        # Validators read whatever database the page reads; keep that the primary
+        self.client.cookies[PIN_COOKIE] = '1'
+
+    def revalidate(self, response):
+        return self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_current_copy_is_not_modified(self):
+        first = self.client.get(self.url)
+        self.assertIn('Last-Modified', first)
+        # The validator is a cache read, not a catalog query
+        with self.assertNumQueries(0):
+            self.assertEqual(self.revalidate(first).status_code, 304)
+
+    def test_catalog_changes_make_the_page_modified(self):
+        changes = [
+            lambda: self.products[0].save(),
+            lambda: self.products[1].delete(),
+            lambda: make_products(1),
+            lambda: make_category(),
+        ]
+        for change in changes:
+            first = self.client.get(self.url)
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            self.assertEqual(self.revalidate(first).status_code, 200)
+
+    def test_etag_depends_on_the_visitor(self):
+        first = self.client.get(self.url)
+        self.client.force_login(make_customer())
+        second = self.client.get(self.url)
+        self.assertNotEqual(first['ETag'], second['ETag'])
+        self.assertNotIn('Last-Modified', second)
+
+        # Adding to the cart changes the badge
+        self.client.post(reverse('core_ecommerce:add_to_cart', args=[self.products[0].id]))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=second['ETag']).status_code, 200)
+
+    def test_pending_messages_are_rendered(self):
+        first = self.client.get(self.url)
+        self.client.post(reverse('core_ecommerce:clear_cart'))
+        self.assertEqual(self.revalidate(first).status_code, 200)
+
+
+class ConditionalGetDefaultTests(SimpleTestCase):
+    def test_views_without_validators_always_render(self):
+        class PlainView(ConditionalGetMixin, View):
+            def get(self, request):
+                return HttpResponse('page')
+
+        response = PlainView.as_view()(RequestFactory().get('/', HTTP_IF_NONE_MATCH='*'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+
+
+class AdminSearchTests(TestCase):
+    def test_admin_without_search_filter_uses_django_search(self):
+        class EmailSearchAdmin(ScalableAdminMixin, admin.ModelAdmin):
+            search_fields = ('email',)
+
+        products = make_products(1)
+        match = make_order(make_customer(email='match@example.com'), products)
+        make_order(make_customer(email='other@example.com'), products)
+
+        model_admin = EmailSearchAdmin(Order, admin.site)
+        request = RequestFactory().get('/')
+        queryset, may_have_duplicates = model_admin.get_search_results(
+            request, Order.objects.all(), 'match@'
+        )
+        self.assertEqual(list(queryset), [match])
+        self.assertFalse(may_have_duplicates)
+
+
+class AnonymousPageCacheTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.client.cookies[PIN_COOKIE] = '1'
+        self.products = make_products(2)
+        self.other = make_products(1)[0]
+
+    def cache_status(self, url, **params):
+        return self.client.get(url, params).headers.get('X-Page-Cache')
+
+    def product_url(self, product):
+        return reverse('product:product_detail', args=[product.slug])
+
+    def test_pages_are_served_from_cache(self):
+        home = reverse('core_ecommerce:home')
+        self.assertEqual(self.cache_status(home), 'miss')
+        with self.assertNumQueries(0):
+            response = self.client.get(home)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, self.products[0].name)
+
+    def test_query_string_is_part_of_the_key(self):
+        home = reverse('core_ecommerce:home')
+        self.assertEqual(self.cache_status(home, q='Product', category='x'), 'miss')
+        self.assertEqual(self.cache_status(home, category='x', q='Product'), 'hit')
+        self.assertEqual(self.cache_status(home, q='Other'), 'miss')
+
+    def test_changes_purge_only_affected_pages(self):
+        product, sibling, other = self.products[0], self.products[1], self.other
+        urls = [reverse('core_ecommerce:home')] + [self.product_url(p) for p in (product, sibling, other)]
+
+        def statuses():
+            return [self.cache_status(url) for url in urls]
+
+        statuses()
+        # The home page can be sorted by rating
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductReview.objects.create(product=product, user=make_customer(), rating=5, comment='Great')
+        self.assertEqual(statuses(), ['miss', 'miss', 'hit', 'hit'])
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        # Home and every page of its category (related products)
+        self.assertEqual(statuses(), ['miss', 'miss', 'miss', 'hit'])
+        with self.captureOnCommitCallbacks(execute=True):
+            other.category.save()
+        self.assertEqual(statuses(), ['miss', 'hit', 'hit', 'miss'])
+        with self.captureOnCommitCallbacks(execute=True):
+            other.vendor.save()
+        self.assertEqual(statuses(), ['miss', 'hit', 'hit', 'miss'])
+
+    def test_pages_are_purged_once_the_change_commits(self):
+        url = self.product_url(self.products[0])
+        self.cache_status(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[0].save()
+            self.assertEqual(self.cache_status(url), 'hit')
+        self.assertEqual(self.cache_status(url), 'miss')
+
+    def test_signed_in_users_are_not_cached(self):
+        self.client.force_login(make_customer())
+        self.assertIsNone(self.cache_status(reverse('core_ecommerce:home')))
+        self.assertIsNone(self.cache_status(self.product_url(self.products[0])))
+
+    def test_pages_with_messages_are_rendered_fresh(self):
+        home = reverse('core_ecommerce:home')
+        self.cache_status(home)
+        self.client.post(reverse('core_ecommerce:clear_cart'))
+        response = self.client.get(home)
+        self.assertIsNone(response.headers.get('X-Page-Cache'))
+        self.assertContains(response, 'Cart cleared.')
+
+
+calls = []
+
+
+@task(name='tests.record', retry_delay=10, max_attempts=3)
+def record(value):
+    calls.append(value)
+
+
+@task(name='tests.fail', retry_delay=10, max_attempts=3)
+def fail():
+    raise RuntimeError('broken')
+
+
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_runs_by_priority(self):
+        record.enqueue('low', priority=-1)
+        record.enqueue('normal')
+        record.enqueue('high', priority=5)
+        self.assertEqual(work(burst=True), 3)
+        self.assertEqual(calls, ['high', 'normal', 'low'])
+        self.assertFalse(Task.objects.exists())
+
+    def test_key_allows_one_pending_task(self):
+        record.enqueue('first', key='record')
+        record.enqueue('second', key='record')
+        work(burst=True)
+        self.assertEqual(calls, ['first'])
+        record.enqueue('third', key='record')
+        work(burst=True)
+        self.assertEqual(calls, ['first', 'third'])
+
+    def test_delayed_task_waits(self):
+        record.enqueue('later', delay=60)
+        self.assertEqual(work(burst=True), 0)
+
+    def test_retries_with_backoff_then_fails(self):
+        fail.enqueue(key='fail')
+        before = timezone.now()
+        with self.assertLogs('core_ecommerce.taskqueue', 'WARNING'):
+            work(burst=True)
+        queued = Task.objects.get()
+        self.assertEqual((queued.status, queued.attempts), (Task.QUEUED, 1))
+        self.assertIn('RuntimeError: broken', queued.last_error)
+        # Half of the delay is random: 5 to 10 seconds after the first attempt
+        self.assertGreaterEqual(queued.run_after, before + timedelta(seconds=5))
+        self.assertLessEqual(queued.run_after, timezone.now() + timedelta(seconds=10))
+
+        for _ in range(2):
+            Task.objects.update(run_after=timezone.now())
+            with self.assertLogs('core_ecommerce.taskqueue', 'WARNING'):
+                work(burst=True)
+        failed = Task.objects.get()
+        self.assertEqual((failed.status, failed.attempts, failed.key), (Task.FAILED, 3, None))
+        self.assertEqual(work(burst=True), 0)
+
+    def test_unknown_task_fails_at_once(self):
+        Task.objects.create(name='tests.missing', run_after=timezone.now())
+        with self.assertLogs('core_ecommerce.taskqueue', 'WARNING'):
+            work(burst=True)
+        self.assertEqual(Task.objects.get().status, Task.FAILED)
+
+    def test_lease(self):
+        record.enqueue('leased')
+        [first] = claim('worker-a', lease=60)
+        self.assertEqual(claim('worker-b'), [])
+
+        # The lease runs out, as if worker-a had died
+        Task.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        [second] = claim('worker-b')
+        self.assertEqual(second.attempts, 2)
+
+        # worker-a no longer holds it, so finishing late does not remove worker-b's claim
+        execute(first)
+        self.assertEqual(Task.objects.get().locked_by, second.locked_by)
+        execute(second)
+        self.assertEqual(calls, ['leased', 'leased'])
+        self.assertFalse(Task.objects.exists())
+
+    def test_checkout_queues_one_invoice(self):
+        customer = make_customer()
+        self.client.force_login(customer)
+        set_cart(self.client, make_products(3))
+        self.client.post(reverse('core_ecommerce:checkout'), CheckoutQueryBudgetTests.checkout_data)
+        order = Order.objects.get()
+        self.assertEqual(list(Task.objects.values_list('key', flat=True)), [f'invoice:{order.id}'])
+        self.assertEqual(mail.outbox, [])
+
+        out = StringIO()
+        call_command('run_workers', '--workers', '1', '--burst', stdout=out)
+        self.assertIn('Successfully ran 1 tasks!', out.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [order.email])
+
+
+class PartnerHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.received.append({
+            'path': self.path,
+            'port': self.client_address[1],
+            'signature': self.headers[SIGNATURE_HEADER],
+            'body': body,
+        })
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        self.send_response(status)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, format, *args):
+        pass
+
+
+@override_settings(EVENT_SETTLE_SECONDS=0)
+class ChangeEventTests(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), PartnerHandler)
+        self.server.received = []
+        self.server.statuses = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.pool = new_pool()
+        self.addCleanup(self.pool.close)
+
+    def subscribe(self, topics=('*',), **kwargs):
+        return EventSubscriber.objects.create(
+            name=kwargs.pop('name', 'partner'),
+            url=f'http://127.0.0.1:{self.server.server_port}/hooks',
+            topics=list(topics),
+            secret='s3cret',
+            **kwargs,
+        )
+
+    def sent_events(self):
+        return [
+            (event['topic'], event['object_id'])
+            for request in self.server.received
+            for event in json.loads(request['body'])['events']
+        ]
+
+    def test_changes_record_events(self):
+        [product] = make_products(1)
+        product.name = 'Renamed'
+        product.save()
+        product.price = Decimal('12.50')
+        product.save()
+        order = make_order(make_customer(), [product])
+        order.status = 'shipped'
+        order.save()
+        order.save()
+        product_id = product.pk
+        product.delete()
+        self.assertEqual(
+            list(ChangeEvent.objects.values_list('topic', 'object_id')),
+            [
+                ('product.created', str(product_id)),
+                ('product.updated', str(product_id)),
+                ('product.price_changed', str(product_id)),
+                ('order.created', order.order_number),
+                ('order.status_changed', order.order_number),
+                ('product.deleted', str(product_id)),
+            ],
+        )
+        self.assertNotIn('email', ChangeEvent.objects.get(topic='order.created').payload)
+
+    def test_failed_save_records_nothing(self):
+        [product] = make_products(1)
+        ChangeEvent.objects.all().delete()
+        product.price = Decimal('11.00')
+        with mock.patch('core_ecommerce.events.record', side_effect=RuntimeError('no events')):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                product.save()
+        product.refresh_from_db()
+        self.assertEqual(product.price, Decimal('10.00'))
+
+    def test_batches_are_coalesced_signed_and_advance_the_cursor(self):
+        subscriber = self.subscribe()
+        [product] = make_products(1)
+        for price in ('11.00', '12.00', '13.00'):
+            product.price = Decimal(price)
+            product.save()
+
+        self.assertEqual(deliver_next(subscriber.pk, self.pool), 2)
+        self.assertEqual(
+            self.sent_events(),
+            [('product.created', str(product.pk)), ('product.price_changed', str(product.pk))],
+        )
+        request = self.server.received[0]
+        self.assertEqual(request['path'], '/hooks')
+        expected = 'sha256=' + hmac.new(b's3cret', request['body'], hashlib.sha256).hexdigest()
+        self.assertEqual(request['signature'], expected)
+        self.assertEqual(json.loads(request['body'])['events'][-1]['payload']['price'], '13.00')
+
+        subscriber.refresh_from_db()
+        self.assertEqual(subscriber.last_event_id, ChangeEvent.objects.latest('id').id)
+        self.assertEqual(deliver_next(subscriber.pk, self.pool), 0)
+        self.assertEqual(len(self.server.received), 1)
+
+    def test_topics_filter_events(self):
+        self.subscribe(topics=['order.*'])
+        customer = make_customer()
+        order = make_order(customer, make_products(2))
+        self.assertEqual(dispatch(self.pool), 1)
+        self.assertEqual(self.sent_events(), [('order.created', order.order_number)])
+
+    def test_failures_back_off_without_moving_the_cursor(self):
+        subscriber = self.subscribe()
+        make_products(1)
+        self.server.statuses = [503]
+        with self.assertLogs('core_ecommerce.webhooks', 'WARNING'):
+            self.assertEqual(dispatch(self.pool), 0)
+        subscriber.refresh_from_db()
+        self.assertEqual((subscriber.last_event_id, subscriber.failures), (0, 1))
+        self.assertIn('HTTP 503', subscriber.last_error)
+        self.assertGreater(subscriber.retry_after, timezone.now())
+
+        # Not due yet, so nothing is sent until the backoff runs out
+        self.assertEqual(dispatch(self.pool), 0)
+        self.assertEqual(len(self.server.received), 1)
+        EventSubscriber.objects.update(retry_after=timezone.now())
+        self.assertEqual(dispatch(self.pool), 1)
+        subscriber.refresh_from_db()
+        self.assertEqual((subscriber.failures, subscriber.retry_after, subscriber.last_error), (0, None, ''))
+
+    def test_batches_reuse_connections(self):
+        self.subscribe(batch_size=1)
+        make_products(3)
+        self.assertEqual(dispatch(self.pool), 3)
+        self.assertEqual(len(self.server.received), 3)
+        self.assertEqual(len({request['port'] for request in self.server.received}), 1)
+
+    def test_leased_subscribers_are_skipped_until_the_lease_ends(self):
+        subscriber = self.subscribe()
+        make_products(1)
+        EventSubscriber.objects.update(locked_by='other', locked_until=timezone.now() + timedelta(minutes=1))
+        self.assertEqual(dispatch(self.pool), 0)
+
+        # The other dispatcher died; its lease runs out and the batch is sent
+        EventSubscriber.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(dispatch(self.pool), 1)
+        subscriber.refresh_from_db()
+        self.assertEqual((subscriber.locked_by, subscriber.locked_until), ('', None))
+        self.assertEqual(subscriber.last_event_id, ChangeEvent.objects.latest('id').id)
+
+    def test_cursor_stays_if_the_lease_was_lost(self):
+        subscriber = self.subscribe()
+        make_products(1)
+
+        def take_over(*args, **kwargs):
+            EventSubscriber.objects.update(locked_by='other')
+            return 200, b''
+
+        with mock.patch.object(self.pool, 'request', side_effect=take_over):
+            with self.assertLogs('core_ecommerce.webhooks', 'WARNING'):
+                self.assertEqual(deliver_next(subscriber.pk, self.pool), 0)
+        subscriber.refresh_from_db()
+        self.assertEqual((subscriber.last_event_id, subscriber.locked_by), (0, 'other'))
+
+    def test_young_events_wait_to_settle(self):
+        self.subscribe()
+        make_products(1)
+        with self.settings(EVENT_SETTLE_SECONDS=60):
+            self.assertEqual(dispatch(self.pool), 0)
+        self.assertEqual(dispatch(self.pool), 1)
+
+    def test_command_sends_and_prunes(self):
+        subscriber = self.subscribe()
+        make_products(2)
+        out = StringIO()
+        call_command('dispatch_events', '--once', '--workers', '1', stdout=out)
+        self.assertIn('Successfully sent 2 events!', out.getvalue())
+
+        ChangeEvent.objects.update(created_at=timezone.now() - timedelta(days=31))
+        make_products(1)
+        call_command('dispatch_events', '--once', '--workers', '1', '--prune-days', '30', stdout=out)
+        self.assertIn('Deleted 2 old events.', out.getvalue())
+        subscriber.refresh_from_db()
+        self.assertEqual(list(ChangeEvent.objects.values_list('id', flat=True)), [subscriber.last_event_id])
@@ -6,6 +6,7 @@ from .views import (
     UpdateCartView, 
     RemoveFromCartView, 
     ClearCartView,
+    CartAPIView,
     CheckoutView,
     OrderSuccessView,
     MyOrdersView,
@@ -20,6 +21,7 @@ urlpatterns = [
     path('cart/update/<int:product_id>/', UpdateCartView.as_view(), name='update_cart'),
     path('cart/remove/<int:product_id>/', RemoveFromCartView.as_view(), name='remove_from_cart'),
     path('cart/clear/', ClearCartView.as_view(), name='clear_cart'),
+    path('cart/api/', CartAPIView.as_view(), name='cart_api'),
     path('checkout/', CheckoutView.as_view(), name='checkout'),
     path('order-success/<int:order_id>/', OrderSuccessView.as_view(), name='order_success'),
     path('orders/', MyOrdersView.as_view(), name='my_orders'),
@@ -1,78 +1,94 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views import View
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.core.paginator import Paginator
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 from django.http import JsonResponse
-from product.models import Product, Category
-from core_ecommerce.models import Order, OrderItem
+from django.db import transaction
+from product import listing
+from product.cards import prefetch_cards
+from product.models import CategoryRanking, Product
+from product.rankings import RANKING_SORTS
+from product.search import search_products, suggest_correction
+from core_ecommerce.models import MAX_CART_QUANTITY, Order, OrderItem, ArchivedOrder
+from core_ecommerce.caching import category_list_cache, get_categories
+from core_ecommerce.cart import get_cart
+from core_ecommerce.conditional import ConditionalGetMixin
+from core_ecommerce.pagecache import AnonymousPageCacheMixin, page_cache
 from core_ecommerce.forms import CheckoutForm
-from collections import defaultdict
+from core_ecommerce.signals import queue_order_invoice
+import json
 from decimal import Decimal
 
 
-class HomeView(View):
+class HomeView(ConditionalGetMixin, AnonymousPageCacheMixin, View):
     template_name = 'home/index.html'
+    read_from_replica = True
     products_per_page = 12
 
+    def get_validators(self, request):
+        # Every change the page shows purges its page-cache tag (product,
+        # review, category and vendor signals, compute_rankings), so the
+        # tag's version stands in for the catalog without a database query
+        version = page_cache.tag_version('path:/')
+        return (version, category_list_cache.generation()), page_cache.changed_at(version)
+
     def get(self, request):
-        categories = Category.objects.all()
+        categories = get_categories()
         search_query = request.GET.get('q', '')
         selected_category_slug = request.GET.get('category', '')
+        sort = request.GET.get('sort', '')
+        if sort not in listing.SORTS:
+            sort = listing.DEFAULT_SORT
         
-        # Get all products or filter by search/category
-        products = Product.objects.select_related('category', 'vendor').all()
-        
-        if search_query:
-            products = products.filter(name__icontains=search_query)
+        products = Product.objects.select_related('category', 'vendor__user')
         
+        row_categories = categories
         if selected_category_slug:
-            products = products.filter(category__slug=selected_category_slug)
+            row_categories = [category for category in categories if category.slug == selected_category_slug]
         
-        # Group products by category
-        products_by_category = defaultdict(list)
-        for product in products:
-            if product.category:
-                category_key = (product.category.name, product.category.slug)
-            else:
-                category_key = ('Uncategorized', 'uncategorized')
-            products_by_category[category_key].append(product)
+        if sort in RANKING_SORTS:
+            # Most popular categories first; ties stay in name order
+            category_scores = dict(CategoryRanking.objects.values_list('category_id', RANKING_SORTS[sort]))
+            row_categories = sorted(row_categories, key=lambda category: -category_scores.get(category.pk, 0))
         
-        # Convert to list of tuples for template
-        category_rows = []
-        for (category_name, category_slug), category_products in sorted(products_by_category.items()):
-            # Paginate products for each category
-            paginator = Paginator(category_products, self.products_per_page)
-            page = request.GET.get(f'page_{category_slug}', 1)
-            
-            try:
-                paginated_products = paginator.page(page)
-            except PageNotAnInteger:
-                paginated_products = paginator.page(1)
-            except EmptyPage:
-                paginated_products = paginator.page(paginator.num_pages)
-            
-            category_rows.append({
-                'category_name': category_name,
-                'category_slug': category_slug,
-                'products': paginated_products,
-                'paginator': paginator,
-            })
+        category_rows = self.get_rows(request, products, row_categories, sort, search_query, selected_category_slug)
+        suggestion = None
+        if search_query and not category_rows:
+            # Nothing matched; show what the query probably meant
+            suggestion = suggest_correction(search_query)
+            if suggestion:
+                category_rows = self.get_rows(request, products, row_categories, sort, suggestion, selected_category_slug)
+        
+        # One cache round trip for every card on the page
+        prefetch_cards([product for row in category_rows for product in row['products']])
         
         context = {
             'categories': categories,
             'category_rows': category_rows,
             'search_query': search_query,
+            'suggestion': suggestion,
             'selected_category': selected_category_slug,
+            'sort': '' if sort == listing.DEFAULT_SORT else sort,
         }
         return render(request, self.template_name, context)
 
-
-def get_cart(request):
-    """Helper function to get cart from session"""
-    cart = request.session.get('cart', {})
-    return cart
+    def get_rows(self, request, products, categories, sort, search_query, category_slug):
+        """One row per category with matching products, each paged on its own cursor"""
+        if search_query:
+            products = search_products(products, search_query, category_slug)
+        cursors = {category.pk: request.GET.get(f'page_{category.slug}') for category in categories}
+        pages = listing.category_pages(products, categories, sort, cursors, self.products_per_page)
+        return [
+            {
+                'category_name': category.name,
+                'category_slug': category.slug,
+                'products': pages[category.pk],
+            }
+            for category in categories
+            if pages[category.pk]
+        ]
 
 
 def get_cart_items(request):
@@ -80,32 +96,28 @@ def get_cart_items(request):
     cart = get_cart(request)
     cart_items = []
     total = Decimal('0.00')
+    if cart is None:
+        return cart_items, total
     
-    for product_id, quantity in cart.items():
-        try:
-            product = Product.objects.select_related('category', 'vendor').get(id=int(product_id))
-            item_total = product.price * Decimal(str(quantity))
-            total += item_total
-            cart_items.append({
-                'product': product,
-                'quantity': quantity,
-                'item_total': item_total,
-            })
-        except Product.DoesNotExist:
-            # Remove invalid product from cart
-            cart.pop(product_id, None)
-            request.session['cart'] = cart
-            request.session.modified = True
+    lines = cart.available_lines().select_related('product__category', 'product__vendor__user').order_by('id')
+    count = 0
+    for line in lines:
+        item_total = line.product.price * line.quantity
+        total += item_total
+        count += line.quantity
+        cart_items.append({
+            'product': line.product,
+            'quantity': line.quantity,
+            'item_total': item_total,
+        })
+    
+    # Prices may have changed, or products been archived, since the totals were cached
+    if (count, total) != (cart.item_count, cart.subtotal):
+        cart.refresh_totals()
     
     return cart_items, total
 
 
-def get_cart_count(request):
-    """Helper function to get total number of items in cart"""
-    cart = get_cart(request)
-    return sum(cart.values())
-
-
 class AddToCartView(View):
     """Add product to cart"""
     
@@ -116,16 +128,7 @@ class AddToCartView(View):
         if quantity < 1:
             quantity = 1
         
-        cart = get_cart(request)
-        product_id_str = str(product_id)
-        
-        if product_id_str in cart:
-            cart[product_id_str] += quantity
-        else:
-            cart[product_id_str] = quantity
-        
-        request.session['cart'] = cart
-        request.session.modified = True
+        get_cart(request, create=True).add(product, quantity)
         
         messages.success(request, f'{product.name} added to cart!')
         
@@ -144,7 +147,7 @@ class CartView(View):
         context = {
             'cart_items': cart_items,
             'total': total,
-            'cart_count': get_cart_count(request),
+            'cart_count': sum(item['quantity'] for item in cart_items),
         }
         return render(request, self.template_name, context)
 
@@ -156,20 +159,17 @@ class UpdateCartView(View):
         product = get_object_or_404(Product, id=product_id)
         quantity = int(request.POST.get('quantity', 1))
         
-        cart = get_cart(request)
-        product_id_str = str(product_id)
+        cart = get_cart(request, create=quantity >= 1)
         
         if quantity < 1:
             # Remove item if quantity is 0 or less
-            cart.pop(product_id_str, None)
+            if cart is not None:
+                cart.remove(product)
             messages.info(request, f'{product.name} removed from cart.')
         else:
-            cart[product_id_str] = quantity
+            cart.set_quantity(product, quantity)
             messages.success(request, f'{product.name} quantity updated.')
         
-        request.session['cart'] = cart
-        request.session.modified = True
-        
         return redirect('core_ecommerce:cart')
 
 
@@ -179,12 +179,8 @@ class RemoveFromCartView(View):
     def post(self, request, product_id):
         product = get_object_or_404(Product, id=product_id)
         cart = get_cart(request)
-        product_id_str = str(product_id)
         
-        if product_id_str in cart:
-            cart.pop(product_id_str, None)
-            request.session['cart'] = cart
-            request.session.modified = True
+        if cart is not None and cart.remove(product):
             messages.success(request, f'{product.name} removed from cart.')
         
         return redirect('core_ecommerce:cart')
@@ -194,12 +190,120 @@ class ClearCartView(View):
     """Clear entire cart"""
     
     def post(self, request):
-        request.session['cart'] = {}
-        request.session.modified = True
+        cart = get_cart(request)
+        if cart is not None:
+            cart.clear()
         messages.info(request, 'Cart cleared.')
         return redirect('core_ecommerce:cart')
 
 
+# Most line changes accepted in one cart API request
+MAX_CART_API_LINES = 50
+
+# Product ids are positive and fit a 64-bit primary key
+MAX_PRODUCT_ID = 2 ** 63 - 1
+
+
+def cart_line_payload(product, quantity):
+    return {
+        'product_id': product.pk,
+        'name': product.name,
+        'price': f'{product.price:.2f}',
+        'quantity': quantity,
+        'line_total': f'{product.price * quantity:.2f}',
+    }
+
+
+def cart_totals_payload(cart):
+    if cart is None:
+        return {'cart_count': 0, 'subtotal': '0.00'}
+    return {'cart_count': cart.item_count, 'subtotal': f'{cart.subtotal:.2f}'}
+
+
+def parse_cart_changes(body):
+    """
+    Turn a JSON cart update into ({product_id: quantity}, {product_id: quantity}):
+    lines to set and lines to add to. Accepts one change or {"lines": [...]},
+    each change being {"product_id": 1, "quantity": 2} or {"product_id": 1, "add": 1}.
+    Raises ValueError with a message for the client on bad input.
+    """
+    try:
+        data = json.loads(body or b'{}')
+    except (TypeError, ValueError):
+        raise ValueError('Request body must be JSON.')
+    if not isinstance(data, dict):
+        raise ValueError('Request body must be a JSON object.')
+    changes = data['lines'] if 'lines' in data else [data]
+    if not isinstance(changes, list) or not changes:
+        raise ValueError('"lines" must be a non-empty list.')
+    if len(changes) > MAX_CART_API_LINES:
+        raise ValueError(f'At most {MAX_CART_API_LINES} lines can be changed at once.')
+    
+    quantities, added = {}, {}
+    for change in changes:
+        if not isinstance(change, dict):
+            raise ValueError('Each line must be a JSON object.')
+        product_id, quantity, add = change.get('product_id'), change.get('quantity'), change.get('add')
+        if not _is_int(product_id) or not 1 <= product_id <= MAX_PRODUCT_ID:
+            raise ValueError('Each line needs a positive integer "product_id".')
+        if (quantity is None) == (add is None):
+            raise ValueError('Each line needs exactly one of "quantity" or "add".')
+        if quantity is not None:
+            if not _is_int(quantity) or not 0 <= quantity <= MAX_CART_QUANTITY:
+                raise ValueError(f'"quantity" must be an integer from 0 to {MAX_CART_QUANTITY}.')
+            quantities[product_id] = quantity
+            added.pop(product_id, None)
+        else:
+            if not _is_int(add) or not 1 <= add <= MAX_CART_QUANTITY:
+                raise ValueError(f'"add" must be an integer from 1 to {MAX_CART_QUANTITY}.')
+            # Lines are capped at MAX_CART_QUANTITY when the change is applied
+            added[product_id] = min(added.get(product_id, 0) + add, MAX_CART_QUANTITY)
+    return quantities, added
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+class CartAPIView(View):
+    """
+    JSON cart endpoint for scripts. GET returns every line; POST applies a
+    batch of line changes and returns only the changed lines, plus the cart
+    count and subtotal, without rendering a page.
+    """
+    def get(self, request):
+        cart = get_cart(request)
+        lines = []
+        if cart is not None:
+            lines = [
+                cart_line_payload(line.product, line.quantity)
+                for line in cart.available_lines().select_related('product').order_by('id')
+            ]
+        return JsonResponse({'lines': lines, **cart_totals_payload(cart)})
+    
+    def post(self, request):
+        try:
+            quantities, added = parse_cart_changes(request.body)
+        except ValueError as exc:
+            return JsonResponse({'error': str(exc)}, status=400)
+        
+        product_ids = set(quantities) | set(added)
+        products = Product.objects.only('id', 'name', 'price').in_bulk(product_ids)
+        missing = sorted(product_ids - set(products))
+        if missing:
+            return JsonResponse({'error': 'Unknown products.', 'product_ids': missing}, status=404)
+        
+        cart = get_cart(request, create=bool(added) or any(quantities.values()))
+        if cart is None:
+            # Only removals against an empty cart: nothing to change
+            changed = dict.fromkeys(product_ids, 0)
+        else:
+            changed = cart.apply_changes(quantities=quantities, added=added)
+        
+        lines = [cart_line_payload(products[product_id], changed[product_id]) for product_id in sorted(changed)]
+        return JsonResponse({'lines': lines, **cart_totals_payload(cart)})
+
+
 @method_decorator(login_required, name='dispatch')
 class CheckoutView(View):
     """Checkout view to process orders"""
@@ -220,7 +324,7 @@ class CheckoutView(View):
             'subtotal': total,
             'shipping_cost': Decimal('0.00'),  # Can be calculated based on location
             'total': total,
-            'cart_count': get_cart_count(request),
+            'cart_count': sum(item['quantity'] for item in cart_items),
         }
         return render(request, self.template_name, context)
     
@@ -238,37 +342,41 @@ class CheckoutView(View):
             shipping_cost = Decimal('0.00')
             total = subtotal + shipping_cost
             
-            # Create order
-            order = Order.objects.create(
-                customer=request.user,
-                first_name=form.cleaned_data['first_name'],
-                last_name=form.cleaned_data['last_name'],
-                email=form.cleaned_data['email'],
-                phone=form.cleaned_data['phone'],
-                shipping_address=form.cleaned_data['shipping_address'],
-                billing_address=form.cleaned_data.get('billing_address') or form.cleaned_data['shipping_address'],
-                city=form.cleaned_data['city'],
-                region=form.cleaned_data.get('region', ''),
-                postal_code=form.cleaned_data.get('postal_code', ''),
-                country=form.cleaned_data.get('country', 'Ethiopia'),
-                subtotal=subtotal,
-                shipping_cost=shipping_cost,
-                total=total,
-            )
-            
-            # Create order items
-            for item in cart_items:
-                OrderItem.objects.create(
-                    order=order,
-                    product=item['product'],
-                    quantity=item['quantity'],
-                    price=item['product'].price,
-                    subtotal=item['item_total'],
+            with transaction.atomic():
+                # Create order
+                order = Order.objects.create(
+                    customer=request.user,
+                    first_name=form.cleaned_data['first_name'],
+                    last_name=form.cleaned_data['last_name'],
+                    email=form.cleaned_data['email'],
+                    phone=form.cleaned_data['phone'],
+                    shipping_address=form.cleaned_data['shipping_address'],
+                    billing_address=form.cleaned_data.get('billing_address') or form.cleaned_data['shipping_address'],
+                    city=form.cleaned_data['city'],
+                    region=form.cleaned_data.get('region', ''),
+                    postal_code=form.cleaned_data.get('postal_code', ''),
+                    country=form.cleaned_data.get('country', 'Ethiopia'),
+                    subtotal=subtotal,
+                    shipping_cost=shipping_cost,
+                    total=total,
                 )
             
-            # Clear cart after successful order
-            request.session['cart'] = {}
-            request.session.modified = True
+                # Create the vendor orders and order items in two INSERTs; bulk_create
+                # skips post_save, so the invoice email is queued explicitly
+                order.add_items([
+                    OrderItem(
+                        product=item['product'],
+                        quantity=item['quantity'],
+                        price=item['product'].price,
+                        subtotal=item['item_total'],
+                    )
+                    for item in cart_items
+                ])
+                queue_order_invoice(order)
+                
+                # Remove the ordered lines; those for archived products stay
+                # in the cart in case the product is restored
+                get_cart(request).clear(products=[item['product'] for item in cart_items])
             
             messages.success(request, f'Order placed successfully! Order number: {order.order_number}')
             return redirect('core_ecommerce:order_success', order_id=order.id)
@@ -280,7 +388,7 @@ class CheckoutView(View):
             'subtotal': subtotal,
             'shipping_cost': Decimal('0.00'),
             'total': subtotal,
-            'cart_count': get_cart_count(request),
+            'cart_count': sum(item['quantity'] for item in cart_items),
         }
         return render(request, self.template_name, context)
 
@@ -289,9 +397,14 @@ class CheckoutView(View):
 class OrderSuccessView(View):
     """Order success confirmation page"""
     template_name = 'checkout/order_success.html'
+    read_from_replica = True
     
     def get(self, request, order_id):
-        order = get_object_or_404(Order, id=order_id, customer=request.user)
+        order = get_object_or_404(
+            Order.objects.prefetch_related('items__product'),
+            id=order_id,
+            customer=request.user,
+        )
         context = {
             'order': order,
         }
@@ -302,8 +415,14 @@ class OrderSuccessView(View):
 class MyOrdersView(View):
     """View to display user's order history"""
     template_name = 'orders/my_orders.html'
+    read_from_replica = True
+    archived_template_name = 'orders/archived_orders.html'
     
     def get(self, request):
+        # Older history lives in the order archive and is only read on request
+        if request.GET.get('history') == 'archived':
+            return self.get_archived(request)
+        
         orders = Order.objects.filter(customer=request.user).select_related('customer').prefetch_related('items__product')
         
         # Get filter parameters
@@ -317,16 +436,28 @@ class MyOrdersView(View):
             'status_choices': Order.STATUS_CHOICES,
         }
         return render(request, self.template_name, context)
+    
+    def get_archived(self, request):
+        orders = ArchivedOrder.objects.filter(customer=request.user)
+        
+        paginator = Paginator(orders, 20)
+        page_obj = paginator.get_page(request.GET.get('page'))
+        
+        context = {
+            'orders': page_obj,
+        }
+        return render(request, self.archived_template_name, context)
 
 
 @method_decorator(login_required, name='dispatch')
 class OrderDetailView(View):
     """View to display individual order details"""
     template_name = 'orders/order_detail.html'
+    read_from_replica = True
     
     def get(self, request, order_id):
         order = get_object_or_404(Order, id=order_id, customer=request.user)
-        order_items = order.items.select_related('product', 'product__vendor', 'product__category').all()
+        order_items = order.items.select_related('product', 'product__vendor__user', 'product__category').all()
         
         context = {
             'order': order,
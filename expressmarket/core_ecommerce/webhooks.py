@@ -0,0 +1,227 @@
+"""
+Delivery of change events (core_ecommerce.events) to partner endpoints.
+
+Each EventSubscriber has a cursor, last_event_id. A delivery reads up to
+batch_size of the events after it that match the subscriber's topics,
+coalesces them (only the latest event per topic and object is kept, so
+ten edits to a product in a row go out once), and POSTs them as one JSON
+body signed with the subscriber's secret. The cursor moves only after a
+2xx response. Failures back off exponentially per subscriber, so one slow
+or broken partner does not hold up the others. Delivery is at least once:
+partners should ignore event ids they have already seen.
+
+A dispatcher leases a subscriber for EVENT_LEASE_SECONDS (locked_by and
+locked_until, as the task queue does) and commits the claim before
+POSTing, so no transaction or row lock is held while the partner answers.
+The cursor then moves in its own UPDATE, only if the lease is still held.
+A subscriber whose dispatcher died is taken over when the lease ends.
+
+Events are only read once they are EVENT_SETTLE_SECONDS old. Ids are
+assigned when a transaction inserts its event, not when it commits, so
+a lower id can commit after a higher one was sent. The delay covers
+transactions that commit within it; an event whose transaction stays
+open longer than that after writing it can be skipped.
+
+`manage.py dispatch_events` runs the deliveries over a shared pool of
+keep-alive connections (core_ecommerce.httppool).
+"""
+import hashlib
+import hmac
+import json
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.utils import timezone
+
+from core_ecommerce.httppool import ConnectionPool
+from core_ecommerce.models import ChangeEvent, EventSubscriber
+from core_ecommerce.taskqueue import retry_delay, worker_name
+
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = 'X-Signature'
+
+# First wait after a failed delivery, doubling with each failure after it
+RETRY_DELAY = 10
+
+
+class DeliveryError(Exception):
+    pass
+
+
+def topic_filter(topics):
+    """A Q matching the event topics a subscriber asked for"""
+    match = Q(pk__in=[])
+    for pattern in topics:
+        if pattern == '*':
+            return Q()
+        if pattern.endswith('.*'):
+            match |= Q(topic__startswith=pattern[:-1])
+        else:
+            match |= Q(topic=pattern)
+    return match
+
+
+def coalesce(events):
+    """The latest event for each (topic, object), in event order"""
+    latest = {(event.topic, event.object_id): event for event in events}
+    return sorted(latest.values(), key=lambda event: event.id)
+
+
+def sign(secret, body):
+    return 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def encode_batch(subscriber, events):
+    return json.dumps({
+        'subscriber': subscriber.name,
+        'events': [
+            {
+                'id': event.id,
+                'topic': event.topic,
+                'object_id': event.object_id,
+                'payload': event.payload,
+                'created_at': event.created_at.isoformat(),
+            }
+            for event in events
+        ],
+    }).encode()
+
+
+def post_batch(pool, subscriber, events):
+    body = encode_batch(subscriber, events)
+    headers = {
+        'Content-Type': 'application/json',
+        'User-Agent': 'ExpressMarket-Events',
+        SIGNATURE_HEADER: sign(subscriber.secret, body),
+    }
+    try:
+        status, content = pool.request('POST', subscriber.url, body, headers)
+    except OSError as exc:
+        raise DeliveryError(f'{type(exc).__name__}: {exc}') from exc
+    if not 200 <= status < 300:
+        raise DeliveryError(f'HTTP {status}: {content[:200].decode(errors="replace")}')
+
+
+def deliverable(now):
+    """Due subscribers that no dispatcher holds a lease on"""
+    return (
+        (Q(retry_after__isnull=True) | Q(retry_after__lte=now))
+        & (Q(locked_until__isnull=True) | Q(locked_until__lt=now))
+        & Q(is_active=True)
+    )
+
+
+def claim(subscriber_id):
+    """
+    Lease the subscriber to this dispatcher for EVENT_LEASE_SECONDS, if it
+    is due. Returns it, or None when it is not due or another holds it.
+    """
+    now = timezone.now()
+    token = f'{worker_name()}:{uuid.uuid4().hex[:8]}'
+    # One conditional UPDATE, so of two dispatchers only one gets the row
+    claimed = EventSubscriber.objects.filter(deliverable(now), pk=subscriber_id).update(
+        locked_by=token,
+        locked_until=now + timedelta(seconds=settings.EVENT_LEASE_SECONDS),
+    )
+    if not claimed:
+        return None
+    return EventSubscriber.objects.filter(pk=subscriber_id, locked_by=token).first()
+
+
+def release(subscriber, **fields):
+    """
+    End the subscriber's lease, saving `fields` with it. Returns False if
+    the lease ran out and another dispatcher may have taken it over.
+    """
+    held = EventSubscriber.objects.filter(pk=subscriber.pk, locked_by=subscriber.locked_by)
+    return bool(held.update(locked_by='', locked_until=None, **fields))
+
+
+def deliver_next(subscriber_id, pool):
+    """
+    Send the subscriber's next batch, if it has one. Returns the number of
+    events sent; 0 when there was nothing to send or the delivery failed.
+    """
+    subscriber = claim(subscriber_id)
+    if subscriber is None:
+        return 0
+    now = timezone.now()
+    events = list(
+        ChangeEvent.objects.filter(
+            topic_filter(subscriber.topics),
+            id__gt=subscriber.last_event_id,
+            created_at__lte=now - timedelta(seconds=settings.EVENT_SETTLE_SECONDS),
+        ).order_by('id')[:subscriber.batch_size]
+    )
+    if not events:
+        release(subscriber)
+        return 0
+
+    # No transaction or row lock is held while the partner answers
+    batch = coalesce(events)
+    try:
+        post_batch(pool, subscriber, batch)
+    except DeliveryError as exc:
+        failures = subscriber.failures + 1
+        release(
+            subscriber,
+            failures=failures,
+            retry_after=timezone.now() + timedelta(seconds=retry_delay(RETRY_DELAY, failures)),
+            last_error=str(exc),
+        )
+        logger.warning('Delivering events to %s failed (%s in a row): %s', subscriber, failures, exc)
+        return 0
+
+    moved = release(
+        subscriber,
+        last_event_id=events[-1].id,
+        failures=0,
+        retry_after=None,
+        last_error='',
+        last_delivered_at=timezone.now(),
+    )
+    if not moved:
+        # Another dispatcher took over and will send this batch again
+        logger.warning('Lease on %s ran out while delivering; the batch will be sent again', subscriber)
+        return 0
+    return len(batch)
+
+
+def _deliver_all(subscriber_id, pool):
+    """Deliver batches to one subscriber until it is caught up or failing"""
+    sent = 0
+    while True:
+        count = deliver_next(subscriber_id, pool)
+        if not count:
+            return sent
+        sent += count
+
+
+def _threaded_deliver_all(subscriber_id, pool):
+    try:
+        return _deliver_all(subscriber_id, pool)
+    finally:
+        connections.close_all()
+
+
+def dispatch(pool, workers=1):
+    """
+    Bring every due subscriber up to date, `workers` subscribers at a time.
+    Returns the number of events sent.
+    """
+    due = list(EventSubscriber.objects.filter(deliverable(timezone.now())).values_list('id', flat=True))
+    if workers <= 1:
+        return sum(_deliver_all(subscriber_id, pool) for subscriber_id in due)
+    with ThreadPoolExecutor(workers) as executor:
+        return sum(executor.map(lambda subscriber_id: _threaded_deliver_all(subscriber_id, pool), due))
+
+
+def new_pool():
+    return ConnectionPool(timeout=settings.EVENT_DELIVERY_TIMEOUT)
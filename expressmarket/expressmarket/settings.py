@@ -1,4 +1,5 @@
 from pathlib import Path
+from decimal import Decimal
 from decouple import config, Csv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -39,6 +40,8 @@ AUTH_USER_MODEL = 'accounts.User'
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core_ecommerce.middleware.QueryProfilerMiddleware',
+    'core_ecommerce.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -82,13 +85,62 @@ DATABASES = {
     }
 }
 
+# Optional read replica of the primary. Read-only views read from it; see
+# core_ecommerce/routers.py
+if config('DB_REPLICA_HOST', default=''):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': config('DB_REPLICA_HOST'),
+        'PORT': config('DB_REPLICA_PORT', default=DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['core_ecommerce.routers.PrimaryReplicaRouter']
+
+# How long a client reads from the primary after writing, so it sees its own
+# writes however far the replica lags
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', default=10, cast=int)
+
+# Shared cache tier. Point CACHE_BACKEND/CACHE_LOCATION at memcached or
+# Redis in production so all workers share it; the default only lives in
+# one process.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='expressmarket'),
+    }
+}
+
+# Seconds a worker keeps cached view data in its own memory in front of the
+# shared cache (see core_ecommerce/caching.py); 0 disables the local tier
+CACHE_LOCAL_TIMEOUT = config('CACHE_LOCAL_TIMEOUT', default=5, cast=int)
+
+# Seconds rendered pages are kept for logged-out visitors (see
+# core_ecommerce/pagecache.py); catalog changes purge them sooner. 0 disables.
+PAGE_CACHE_TIMEOUT = config('PAGE_CACHE_TIMEOUT', default=600, cast=int)
+
+# Search results (product ids per normalised query) are kept this many
+# seconds, and each worker holds up to SEARCH_CACHE_LOCAL_ENTRIES queries in
+# memory; `manage.py search_stats` shows how many distinct queries matter.
+SEARCH_CACHE_TIMEOUT = config('SEARCH_CACHE_TIMEOUT', default=300, cast=int)
+SEARCH_CACHE_LOCAL_ENTRIES = config('SEARCH_CACHE_LOCAL_ENTRIES', default=1000, cast=int)
+
+# Without pg_trgm each worker keeps the "did you mean" vocabulary in memory
+# (product/fuzzy.py) and reloads it after new words at most this often, in seconds
+SEARCH_VOCABULARY_RELOAD_SECONDS = config('SEARCH_VOCABULARY_RELOAD_SECONDS', default=60, cast=int)
+
 # Fallback to SQLite if PostgreSQL is not configured
 # Uncomment below and comment above if you want to use SQLite for development
 # DATABASES = {
 #     'default': {
 #         'ENGINE': 'django.db.backends.sqlite3',
 #         'NAME': BASE_DIR / 'db.sqlite3',
-#     }
+#     },
+#     # Optional stand-in replica: copy db.sqlite3 over it to "replicate"
+#     # 'replica': {
+#     #     'ENGINE': 'django.db.backends.sqlite3',
+#     #     'NAME': BASE_DIR / 'db-replica.sqlite3',
+#     # },
 # }
 
 
@@ -136,6 +188,9 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Where `manage.py build_sitemaps` writes sitemap.xml and its shards
+SITEMAP_ROOT = config('SITEMAP_ROOT', default=str(BASE_DIR / 'sitemaps'))
+
 # Email Configuration
 EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
 EMAIL_HOST = config('EMAIL_HOST', default='smtp.gmail.com')
@@ -152,3 +207,59 @@ PASSWORD_RESET_TIMEOUT = 86400  # 24 hours in seconds (token expiration)
 SITE_ID = config('SITE_ID', default=1, cast=int)
 SITE_NAME = config('SITE_NAME', default='ExpressMarket')
 SITE_DOMAIN = config('SITE_DOMAIN', default='localhost:8000')
+
+# Admin changelists for large tables: prefix search, order-number fast path
+# and planner-estimated counts instead of COUNT(*)
+ADMIN_SCALABILITY_MODE = config('ADMIN_SCALABILITY_MODE', default=True, cast=bool)
+
+# Delivered/cancelled orders older than this are moved to the archive by
+# `python manage.py archive_orders`
+ORDER_ARCHIVE_AFTER_DAYS = config('ORDER_ARCHIVE_AFTER_DAYS', default=365, cast=int)
+
+# Archived products older than this, and in no remaining order, are deleted
+# by `python manage.py purge_archived_products`
+PRODUCT_PURGE_AFTER_DAYS = config('PRODUCT_PURGE_AFTER_DAYS', default=90, cast=int)
+
+# Share of each vendor's delivered sales kept as commission by
+# `python manage.py settle_vendors`
+VENDOR_COMMISSION_RATE = config('VENDOR_COMMISSION_RATE', default='0.10', cast=Decimal)
+
+# Background tasks (`python manage.py run_workers`): how long a worker may
+# hold a claimed task before another worker can take it over, and how often
+# idle workers look for new tasks, in seconds
+TASK_LEASE_SECONDS = config('TASK_LEASE_SECONDS', default=300, cast=int)
+TASK_POLL_INTERVAL = config('TASK_POLL_INTERVAL', default=1.0, cast=float)
+
+# Uploaded product images are scaled down in the background to at most
+# this many pixels on their longer side
+PRODUCT_IMAGE_MAX_SIZE = config('PRODUCT_IMAGE_MAX_SIZE', default=1200, cast=int)
+
+# Partner change events (`python manage.py dispatch_events`): how old an
+# event must be before it is sent, the timeout for each delivery, and how
+# long a dispatcher holds a subscriber before another may take it over, in seconds
+EVENT_SETTLE_SECONDS = config('EVENT_SETTLE_SECONDS', default=2, cast=float)
+EVENT_DELIVERY_TIMEOUT = config('EVENT_DELIVERY_TIMEOUT', default=10, cast=float)
+EVENT_LEASE_SECONDS = config('EVENT_LEASE_SECONDS', default=60, cast=int)
+
+# Query profiler: share of requests profiled (0 disables it; off by default
+# in development and tests), and how often one query shape must repeat in a
+# request to be flagged as a suspected N+1
+QUERY_PROFILER_SAMPLE_RATE = config('QUERY_PROFILER_SAMPLE_RATE', default=0.0 if DEBUG else 0.01, cast=float)
+QUERY_PROFILER_NPLUSONE_THRESHOLD = config('QUERY_PROFILER_NPLUSONE_THRESHOLD', default=5, cast=int)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'core_ecommerce.profiler': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
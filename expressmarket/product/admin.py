@@ -1,5 +1,32 @@
 from django.contrib import admin
 from .models import Product, Category, ProductReview
-admin.site.register(Product)
+
+
+@admin.register(Product)
+class ProductAdmin(admin.ModelAdmin):
+    list_display = ('name', 'vendor', 'category', 'price', 'is_active', 'updated_at')
+    list_filter = ('is_active',)
+    list_select_related = ('vendor', 'category')
+    search_fields = ('name', 'slug')
+    readonly_fields = ('is_active', 'archived_at', 'average_rating')
+    actions = ['archive', 'unarchive']
+
+    def get_queryset(self, request):
+        # Archived products too, so they can be found and restored
+        return Product.all_objects.select_related('vendor', 'category')
+
+    def has_delete_permission(self, request, obj=None):
+        # Deleting cascades through order items and reviews; archive instead
+        return False
+
+    @admin.action(description='Archive selected products')
+    def archive(self, request, queryset):
+        self.message_user(request, f'{queryset.archive()} products archived.')
+
+    @admin.action(description='Restore selected products')
+    def unarchive(self, request, queryset):
+        self.message_user(request, f'{queryset.unarchive()} products restored.')
+
+
 admin.site.register(Category)
-admin.site.register(ProductReview)
\ No newline at end of file
+admin.site.register(ProductReview)
@@ -0,0 +1,57 @@
+"""
+Purging archived products.
+
+Archiving (ProductQuerySet.archive) only clears is_active, so taking a
+product off sale never touches its order lines or reviews. Products that
+have been archived for PRODUCT_PURGE_AFTER_DAYS and are in no remaining
+order (archive_orders moves old orders out, with a copy of their lines)
+are deleted later by the purge_archived_products command, a small batch
+per transaction, along with their reviews, rankings and cart lines.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from core_ecommerce.models import OrderItem
+from product.models import Product
+
+
+def purge_cutoff(days=None):
+    """Products archived before the returned datetime may be purged"""
+    if days is None:
+        days = getattr(settings, 'PRODUCT_PURGE_AFTER_DAYS', 90)
+    return timezone.now() - timedelta(days=days)
+
+
+def purgeable_products(cutoff):
+    """Products archived before `cutoff` that no order item refers to"""
+    return Product.all_objects.filter(is_active=False, archived_at__lt=cutoff).exclude(
+        Exists(OrderItem.objects.filter(product=OuterRef('pk')))
+    )
+
+
+def purge_batch(cutoff, batch_size=100):
+    """
+    Delete up to batch_size purgeable products in a single transaction,
+    and their images once it commits. Returns the number deleted.
+    """
+    with transaction.atomic():
+        products = list(
+            purgeable_products(cutoff)
+            .order_by('archived_at', 'id')
+            .select_for_update(skip_locked=True)[:batch_size]
+        )
+        if not products:
+            return 0
+
+        Product.all_objects.filter(id__in=[product.id for product in products]).delete()
+        images = {product.image.name for product in products if product.image}
+        # Keep files another product still uses
+        images -= set(Product.all_objects.filter(image__in=images).values_list('image', flat=True))
+        transaction.on_commit(lambda: [default_storage.delete(name) for name in images])
+
+    return len(products)
@@ -0,0 +1,87 @@
+"""
+Cached product card fragments.
+
+A card's HTML depends only on the product and, for full cards, its
+category and vendor, so it is cached under a key built from their ids and
+timestamps (and the vendor's username, which has none). Any change produces a new key and old fragments simply age
+out; nothing has to be invalidated. Fragments are kept in each worker's
+memory in front of the shared cache, and a listing can fetch all of its
+cards with a single get_many() by calling prefetch_cards() first.
+
+Cards must not depend on the request: per-user parts such as the
+add-to-cart form belong in the page around them. Bump
+CACHE_SCHEMA_VERSION when the card templates change.
+"""
+import hashlib
+
+from django.core.cache import caches
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from core_ecommerce.caching import CACHE_KEY_PREFIX, CACHE_SCHEMA_VERSION, LocalTier
+
+
+CARD_TEMPLATES = {
+    # Image, name, category, price and vendor: storefront listings
+    'card': 'product/card.html',
+    # Thumbnail, name and price: vendor dashboard
+    'row': 'product/card_row.html',
+}
+
+# Variants that show the category and vendor, so their keys track those too
+CARDS_WITH_RELATIONS = {'card'}
+
+CARD_TIMEOUT = 60 * 60 * 24
+
+# Keys never go stale, so fragments can stay in memory longer than view data
+local_cards = LocalTier(timeout=300, max_entries=5000)
+
+
+def card_key(product, variant):
+    parts = [product.pk, product.updated_at.timestamp(), variant]
+    if variant in CARDS_WITH_RELATIONS:
+        parts += [
+            product.category_id, product.category.updated_at.timestamp(),
+            # join_date is auto_now, so it moves whenever the vendor is saved
+            product.vendor_id, product.vendor.join_date.timestamp(),
+            # Shown when the vendor has no business name
+            product.vendor.user.username,
+        ]
+    digest = hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+    return f'{CACHE_KEY_PREFIX}:v{CACHE_SCHEMA_VERSION}:card:{digest}'
+
+
+def render_cards(products, variant='card', alias='default'):
+    """Return {product.pk: card HTML}, rendering and caching the cards nobody has cached yet"""
+    template_name = CARD_TEMPLATES[variant]
+    keys = {card_key(product, variant): product for product in products}
+
+    html = {}
+    missing = []
+    for key, product in keys.items():
+        fragment = local_cards.get(key)
+        if fragment is None:
+            missing.append(key)
+        else:
+            html[product.pk] = fragment
+    if not missing:
+        return html
+
+    shared = caches[alias]
+    rendered = {}
+    found = shared.get_many(missing)
+    for key in missing:
+        fragment = found.get(key)
+        if fragment is None:
+            fragment = rendered[key] = render_to_string(template_name, {'product': keys[key]})
+        fragment = mark_safe(fragment)
+        local_cards.set(key, fragment)
+        html[keys[key].pk] = fragment
+    if rendered:
+        shared.set_many(rendered, timeout=CARD_TIMEOUT)
+    return html
+
+
+def prefetch_cards(products, variant='card'):
+    """Load the cards of a whole listing in one round trip before its template renders them one by one"""
+    render_cards(products, variant)
@@ -0,0 +1,104 @@
+"""
+Catalog feeds for partners: every product with its category, vendor and
+price as CSV, JSON Lines or XML (see core_ecommerce/exports.py).
+
+Rows are read as tuples in primary key order with .iterator(), turned
+into lines and, optionally, gzipped as they are written, so memory use is
+the same for ten products or ten million. An incremental feed only has
+the products whose updated_at is at or after `since`, archived ones
+included with active false so partners can take them down; a full feed
+only lists products on sale. Each feed is stamped with the time it
+started (FEED_STARTED_HEADER); passing that as the next `since` picks up
+everything that changed while it ran.
+
+Partners download the feed with the secret of their event subscription
+(core_ecommerce.models.EventSubscriber) as a bearer token.
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from core_ecommerce.exports import EXPORT_CHUNK_SIZE, export_lines
+from core_ecommerce.models import EventSubscriber
+from product.models import Product
+
+
+FEED_COLUMNS = {
+    'id': 'id',
+    'name': 'name',
+    'description': 'description',
+    'price': 'price',
+    'category': 'category__name',
+    'vendor': 'vendor__business_name',
+    'updated_at': 'updated_at',
+    'active': 'is_active',
+    # These two come last and go out as absolute URLs
+    'slug': 'slug',
+    'image': 'image',
+}
+
+OUTPUT_COLUMNS = list(FEED_COLUMNS)[:-2] + ['link', 'image_link']
+
+FEED_STARTED_HEADER = 'X-Feed-Started-At'
+
+
+def feed_partner(request):
+    """The active subscriber whose secret the request bears (Authorization: Bearer <secret>), or None"""
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        return None
+    return EventSubscriber.objects.filter(secret=token.strip(), is_active=True).first()
+
+
+def feed_started():
+    """
+    The time to stamp a feed with, a little before now: rows the replica has
+    not caught up on, or written by transactions still committing, are then
+    in the next incremental feed rather than in neither
+    """
+    return timezone.now() - timedelta(seconds=settings.REPLICA_STICKY_SECONDS)
+
+
+def parse_since(value):
+    """An aware datetime from an ISO date or datetime, None for blank; raises ValueError"""
+    if not value:
+        return None
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Not an ISO date or datetime: {value!r}')
+        moment = datetime.combine(day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def product_link_prefix(base_url):
+    """Absolute product page URL up to the slug; every product URL has the same shape"""
+    return base_url + reverse('product:product_detail', args=['slug']).rsplit('slug', 1)[0]
+
+
+def feed_rows(base_url, media_url, since=None):
+    """
+    Product rows in OUTPUT_COLUMNS order, changed at or after `since` if
+    given. `base_url` is the site's scheme and host, `media_url` the
+    absolute URL uploaded images are served from.
+    """
+    products = Product.objects.order_by('id')
+    if since is not None:
+        # Archiving bumps updated_at, so archived products show up here once
+        products = Product.all_objects.filter(updated_at__gte=since).order_by('id')
+    link = product_link_prefix(base_url)
+    rows = products.values_list(*FEED_COLUMNS.values()).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    for *values, slug, image in rows:
+        yield (*values, f'{link}{slug}/', f'{media_url}{image}' if image else '')
+
+
+def feed_lines(export_format, base_url, media_url, since=None):
+    """The feed as text lines in one of EXPORT_FORMATS"""
+    rows = feed_rows(base_url, media_url, since)
+    return export_lines(OUTPUT_COLUMNS, rows, export_format, xml_root='products', xml_item='product')
@@ -0,0 +1,230 @@
+"""
+Typo-tolerant search: "did you mean" corrections from character trigrams.
+
+Each word of a query is compared with the vocabulary of words used in
+product names (SearchTerm) by trigram similarity, as PostgreSQL's pg_trgm
+computes it: the words are padded ("  red "), split into overlapping
+three-character pieces, and similarity is shared pieces / all distinct
+pieces. A word missing from the vocabulary is replaced by the most
+similar term (the most used one on ties) if it scores at least
+SIMILARITY_THRESHOLD.
+
+On PostgreSQL the lookup is a pg_trgm query on a GIN trigram index over
+the terms. Elsewhere (SQLite, local runs) each process keeps an inverted
+index from trigram to terms in memory, rebuilt when the vocabulary
+changes (at most every SEARCH_VOCABULARY_RELOAD_SECONDS). Either way the cost depends on the size of the vocabulary, not
+of the catalog.
+"""
+import re
+import threading
+import time
+import uuid
+from array import array
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, router, transaction
+from django.db.models import F, Value
+
+from core_ecommerce.caching import CACHE_KEY_PREFIX
+from product.models import Product, SearchTerm
+
+
+# pg_trgm's default for its % operator
+SIMILARITY_THRESHOLD = 0.3
+
+# Shorter words (and numbers) are too ambiguous to correct and are not kept as terms
+MIN_TERM_LENGTH = 3
+MAX_TERM_LENGTH = 100
+
+VOCABULARY_VERSION_KEY = f'{CACHE_KEY_PREFIX}:searchterms:version'
+
+_WORD = re.compile(r'[^\W_]+')
+
+
+def words(text):
+    """The casefolded words of `text` that can be search terms"""
+    return [
+        word for word in _WORD.findall(text.casefold())
+        if MIN_TERM_LENGTH <= len(word) <= MAX_TERM_LENGTH and not word.isdigit()
+    ]
+
+
+def trigrams(word):
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a, b):
+    a, b = trigrams(a), trigrams(b)
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+
+class TrigramIndex:
+    """In-memory inverted index from trigram to the terms that contain it"""
+
+    def __init__(self, terms):
+        self.words = []
+        self.counts = array('I')
+        self.sizes = array('H')
+        postings = defaultdict(lambda: array('I'))
+        for word, count in terms:
+            index = len(self.words)
+            grams = trigrams(word)
+            self.words.append(word)
+            self.counts.append(count)
+            self.sizes.append(len(grams))
+            for gram in grams:
+                postings[gram].append(index)
+        self.postings = dict(postings)
+        self.vocabulary = dict(zip(self.words, range(len(self.words))))
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return word in self.vocabulary
+
+    def closest(self, word, threshold=SIMILARITY_THRESHOLD):
+        """The most similar term scoring at least `threshold`, or None"""
+        grams = trigrams(word)
+        size = len(grams)
+        shared = Counter()
+        for gram in grams:
+            posting = self.postings.get(gram)
+            if posting is not None:
+                shared.update(posting)
+        # A term sharing k trigrams can at best score k / size, so most are skipped without a division
+        minimum = threshold * size
+        best, best_key = None, None
+        for index, count in shared.items():
+            if count < minimum:
+                continue
+            score = count / (size + self.sizes[index] - count)
+            if score >= threshold and (best_key is None or (score, self.counts[index]) > best_key):
+                best, best_key = index, (score, self.counts[index])
+        return None if best is None else self.words[best]
+
+
+class LocalVocabulary:
+    """
+    This process's TrigramIndex over SearchTerm, reloaded when the vocabulary
+    version moves, but at most once every SEARCH_VOCABULARY_RELOAD_SECONDS.
+    A burst of new product names costs each worker one reload, not one per
+    save, and while one thread reloads the others keep using the old index.
+    """
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+        self._lock = threading.Lock()
+        self._index = None
+        self._version = None
+        self._loaded_at = 0.0
+
+    def index(self):
+        shared = caches[self.alias]
+        version = shared.get(VOCABULARY_VERSION_KEY)
+        if version is None:
+            # Evicted or never set: start a new version so every process reloads
+            shared.add(VOCABULARY_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+            version = shared.get(VOCABULARY_VERSION_KEY)
+        index = self._index
+        if index is not None and (
+            version == self._version
+            or time.monotonic() - self._loaded_at < settings.SEARCH_VOCABULARY_RELOAD_SECONDS
+        ):
+            return index
+        # Only the first load waits for the lock
+        if not self._lock.acquire(blocking=index is None):
+            return index
+        try:
+            if self._index is None or version != self._version:
+                terms = SearchTerm.objects.values_list('word', 'product_count').iterator(chunk_size=5000)
+                self._index, self._version = TrigramIndex(terms), version
+                self._loaded_at = time.monotonic()
+            return self._index
+        finally:
+            self._lock.release()
+
+
+local_vocabulary = LocalVocabulary()
+
+
+def vocabulary_changed():
+    caches['default'].set(VOCABULARY_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def _uses_pg_trgm():
+    return connections[router.db_for_read(SearchTerm)].vendor == 'postgresql'
+
+
+def _closest_pg(word):
+    # Imported here: django.contrib.postgres needs a PostgreSQL driver
+    from django.contrib.postgres.lookups import TrigramSimilar
+    from django.contrib.postgres.search import TrigramSimilarity
+
+    return (
+        SearchTerm.objects
+        .filter(TrigramSimilar(F('word'), Value(word)))
+        .annotate(similarity=TrigramSimilarity('word', word))
+        .order_by('-similarity', '-product_count')
+        .values_list('word', flat=True)
+        .first()
+    )
+
+
+def suggest(query):
+    """
+    `query` (normalised) with each word that no product uses replaced by
+    the closest term, or None if nothing could be corrected
+    """
+    if _uses_pg_trgm():
+        query_words = set(words(query))
+        known = set(SearchTerm.objects.filter(word__in=query_words).values_list('word', flat=True))
+
+        def closest(word):
+            return word if word in known else _closest_pg(word)
+    else:
+        index = local_vocabulary.index()
+
+        def closest(word):
+            return word if word in index else index.closest(word)
+
+    corrected = []
+    changed = False
+    for token in query.split():
+        replacement = closest(token) if words(token) == [token] else None
+        if replacement and replacement != token:
+            corrected.append(replacement)
+            changed = True
+        else:
+            corrected.append(token)
+    return ' '.join(corrected) if changed else None
+
+
+def add_search_terms(name):
+    """Add the words of a product name that are not terms yet"""
+    new = set(words(name))
+    if not new:
+        return
+    new -= set(SearchTerm.objects.filter(word__in=new).values_list('word', flat=True))
+    if new:
+        SearchTerm.objects.bulk_create([SearchTerm(word=word) for word in new], ignore_conflicts=True)
+        transaction.on_commit(vocabulary_changed)
+
+
+def build_search_terms(batch_size=1000):
+    """Rebuild the vocabulary and word counts from every product name in one pass; returns the term count"""
+    counts = Counter()
+    for name in Product.objects.values_list('name', flat=True).order_by().iterator(chunk_size=5000):
+        counts.update(set(words(name)))
+    with transaction.atomic():
+        SearchTerm.objects.all().delete()
+        SearchTerm.objects.bulk_create(
+            (SearchTerm(word=word, product_count=count) for word, count in counts.items()),
+            batch_size=batch_size,
+        )
+        transaction.on_commit(vocabulary_changed)
+    return len(counts)
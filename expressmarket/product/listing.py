@@ -0,0 +1,337 @@
+"""
+Sorted catalog listings with keyset ("cursor") pagination.
+
+Each sort is a column list ending in the primary key, so rows have a total
+order, and each has a matching (category_id, ...) index on Product. A page
+is fetched with WHERE (sort columns) past the previous page's last row,
+ORDER BY the sort, LIMIT page size + 1: an index range scan however deep
+the page, where OFFSET would read and discard every row before it.
+
+The ranking sorts page through ProductRanking on its (category, -score,
+product) index instead, and then through the products without a ranking
+in UNRANKED_SORT order, so their cursors also say which of the two they
+are in.
+
+Cursors are opaque URL-safe strings holding the sort, the direction and
+the boundary row's sort values. A cursor that is malformed or was made
+for another sort gives the first page.
+"""
+import base64
+import binascii
+import json
+from functools import cmp_to_key
+
+from django.core.exceptions import ValidationError
+from django.db import connections, router
+from django.db.models import F, Q, Value
+
+from product.models import Product, ProductRanking
+from product.rankings import RANKING_SORTS
+
+
+# Sort name -> columns, '-' for descending; all end in the product's id.
+# The ranking sorts are columns of ProductRanking (see ranked_pages())
+SORTS = {
+    'newest': ('-created_at', '-id'),
+    'price': ('price', 'id'),
+    'price_desc': ('-price', '-id'),
+    'rating': ('-average_rating', '-id'),
+    'bestsellers': ('-bestseller_score', 'product_id'),
+    'trending': ('-trending_score', 'product_id'),
+}
+DEFAULT_SORT = 'newest'
+
+# Ranking sorts list the ranked products first, then the unranked ones in this order
+UNRANKED_SORT = 'newest'
+RANKED, UNRANKED = 'ranked', 'unranked'
+
+
+class KeysetPage:
+    """One page of a keyset listing; iterate it for the products"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def _columns(sort):
+    """[(column, descending)] for a sort name"""
+    return [(name.lstrip('-'), name.startswith('-')) for name in SORTS[sort]]
+
+
+def _phase_columns(sort, phase):
+    """The columns rows of `sort` are keyed on; unranked rows of a ranking sort use UNRANKED_SORT's"""
+    return _columns(UNRANKED_SORT if phase == UNRANKED else sort)
+
+
+def _key(index):
+    return f'keyset_{index}'
+
+
+def _serialize(value):
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_cursor(sort, direction, values, phase=None):
+    payload = [sort, direction, *([phase] if phase else []), *map(_serialize, values)]
+    payload = json.dumps(payload, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    """
+    (direction, phase, values) from a cursor made for `sort`, or
+    (None, None, None). The phase is None except for ranking sorts.
+    """
+    if not cursor:
+        return None, None, None
+    ranked = sort in RANKING_SORTS
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        cursor_sort, direction, *raw = payload
+        phase = raw.pop(0) if ranked else None
+        if ranked and phase not in (RANKED, UNRANKED):
+            return None, None, None
+        columns = _phase_columns(sort, phase)
+        if cursor_sort != sort or direction not in ('next', 'prev') or len(raw) != len(columns):
+            return None, None, None
+        model = ProductRanking if phase == RANKED else Product
+        values = [
+            model._meta.get_field(column).to_python(value)
+            for (column, _), value in zip(columns, raw)
+        ]
+    except (binascii.Error, ValueError, TypeError, IndexError, ValidationError):
+        return None, None, None
+    if None in values:
+        return None, None, None
+    return direction, phase, values
+
+
+def _past(column, descending, value, forward):
+    """Rows strictly past `value` in one column, going forward or backward through the sort"""
+    lookup = 'lt' if descending == forward else 'gt'
+    return Q(**{f'{column}__{lookup}': value})
+
+
+def keyset_filter(columns, values, forward):
+    """
+    (c1 past v1) OR (c1 = v1 AND c2 past v2) OR ..., which databases
+    answer from an index on (c1, c2, ...)
+    """
+    condition = None
+    equal = Q()
+    for (column, descending), value in zip(columns, values):
+        past = equal & _past(column, descending, value, forward)
+        condition = past if condition is None else condition | past
+        equal &= Q(**{column: value})
+    return condition
+
+
+def _ordering(columns, forward):
+    """ORDER BY for the sort, or its exact reverse when paging backward"""
+    return [
+        F(column).desc() if descending == forward else F(column).asc()
+        for column, descending in columns
+    ]
+
+
+def with_sort_keys(queryset, sort):
+    """Annotate each row with its sort values, so cursors never need extra queries"""
+    return queryset.annotate(**{_key(i): F(column) for i, (column, _) in enumerate(_columns(sort))})
+
+
+def _sort_values(item, sort):
+    phase = getattr(item, 'keyset_phase', None)
+    return [getattr(item, _key(i)) for i in range(len(_phase_columns(sort, phase)))]
+
+
+def _cursor(item, sort, direction):
+    return encode_cursor(sort, direction, _sort_values(item, sort), getattr(item, 'keyset_phase', None))
+
+
+def page_query(queryset, sort, cursor, per_page):
+    """
+    (queryset for one page plus one row, direction), for sorts on Product
+    columns. The extra row tells whether there is another page in the
+    direction of travel.
+    """
+    columns = _columns(sort)
+    direction, _, values = decode_cursor(cursor, sort)
+    forward = direction != 'prev'
+    queryset = with_sort_keys(queryset, sort)
+    if values is not None:
+        queryset = queryset.filter(keyset_filter(columns, values, forward))
+    return queryset.order_by(*_ordering(columns, forward))[:per_page + 1], direction
+
+
+def make_page(rows, sort, direction, per_page):
+    """Turn the rows fetched for one page plus one into a KeysetPage"""
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == 'prev':
+        rows.reverse()
+        has_previous, has_next = more, True
+    else:
+        has_previous, has_next = direction == 'next', more
+    if not rows:
+        return KeysetPage([])
+    return KeysetPage(
+        rows,
+        next_cursor=_cursor(rows[-1], sort, 'next') if has_next else None,
+        previous_cursor=_cursor(rows[0], sort, 'prev') if has_previous else None,
+    )
+
+
+def keyset_page(queryset, sort, cursor, per_page):
+    if sort in RANKING_SORTS:
+        return ranked_pages(queryset, sort, {None: (None, cursor)}, per_page)[None]
+    query, direction = page_query(queryset, sort, cursor, per_page)
+    return make_page(list(query), sort, direction, per_page)
+
+
+def _compare(columns, forward):
+    """Sort key putting lists of sort values in the order of `columns`, or its reverse"""
+    def compare(a, b):
+        for (_, descending), x, y in zip(columns, a, b):
+            if x == y:
+                continue
+            result = (x > y) - (x < y)
+            if descending:
+                result = -result
+            return result if forward else -result
+        return 0
+    return cmp_to_key(compare)
+
+
+def _fetch(queries):
+    """The rows of every query, in one UNION ALL statement where the database allows LIMIT inside it"""
+    connection = connections[router.db_for_read(Product)]
+    if len(queries) > 1 and connection.features.supports_slicing_ordering_in_compound:
+        first, *others = queries
+        return list(first.union(*others, all=True))
+    return [row for query in queries for row in query]
+
+
+def _phase_query(queryset, sort, phase, category, values, forward):
+    """
+    Sort values (the last is the product id) for one phase of a ranking
+    sort: ProductRanking rows in score order, read from its (category,
+    score, product) index, or the unranked products in UNRANKED_SORT order
+    """
+    columns = _phase_columns(sort, phase)
+    if phase == RANKED:
+        rows = ProductRanking.objects.filter(product__in=queryset.values('pk'))
+    else:
+        rows = queryset.filter(ranking__isnull=True)
+    if category is not None:
+        rows = rows.filter(category=category)
+    if values is not None:
+        rows = rows.filter(keyset_filter(columns, values, forward))
+    return rows.order_by(*_ordering(columns, forward)), [column for column, _ in columns]
+
+
+def ranked_pages(queryset, sort, requests, per_page):
+    """
+    {key: KeysetPage} for a ranking sort, with requests {key: (category or
+    None, cursor)}. A page reads the ranked products first and, once they
+    run out, the unranked ones. Each phase is one query per key, or one
+    UNION ALL for all of them where the database allows it, and the
+    products come back in one more.
+    """
+    entries = []
+    for key, (category, cursor) in requests.items():
+        direction, phase, values = decode_cursor(cursor, sort)
+        forward = direction != 'prev'
+        phases = [RANKED, UNRANKED] if forward else [UNRANKED, RANKED]
+        entries.append({
+            'key': key, 'category': category, 'direction': direction, 'forward': forward,
+            'phases': phases[phases.index(phase or RANKED):], 'values': values, 'rows': [],
+        })
+
+    for step in range(2):
+        queries = {RANKED: [], UNRANKED: []}
+        for index, entry in enumerate(entries):
+            if step >= len(entry['phases']) or len(entry['rows']) > per_page:
+                continue
+            phase = entry['phases'][step]
+            query, columns = _phase_query(
+                queryset, sort, phase, entry['category'], entry['values'] if step == 0 else None, entry['forward'],
+            )
+            limit = per_page + 1 - len(entry['rows'])
+            queries[phase].append(query.annotate(keyset_entry=Value(index)).values_list(*columns, 'keyset_entry')[:limit])
+        for phase, phase_queries in queries.items():
+            fetched = {}
+            for *values, index in _fetch(phase_queries):
+                fetched.setdefault(index, []).append(values)
+            for index, rows in fetched.items():
+                entry = entries[index]
+                rows.sort(key=_compare(_phase_columns(sort, phase), entry['forward']))
+                entry['rows'] += [(phase, values) for values in rows]
+
+    products = queryset.in_bulk({values[-1] for entry in entries for _, values in entry['rows']})
+    pages = {}
+    for entry in entries:
+        items = []
+        for phase, values in entry['rows']:
+            product = products.get(values[-1])
+            if product is None:
+                # Archived since its ranking was read
+                continue
+            product.keyset_phase = phase
+            for i, value in enumerate(values):
+                setattr(product, _key(i), value)
+            items.append(product)
+        pages[entry['key']] = make_page(items, sort, entry['direction'], per_page)
+    return pages
+
+
+def category_pages(queryset, categories, sort, cursors, per_page):
+    """
+    {category id: KeysetPage} paging each category separately, with the
+    cursor in cursors[category id]. Where the database allows LIMIT inside
+    UNION ALL (PostgreSQL), all the page queries go in one statement and
+    the products come back in a second; otherwise it is one query per
+    category.
+    """
+    if sort in RANKING_SORTS:
+        return ranked_pages(
+            queryset, sort, {category.pk: (category, cursors.get(category.pk)) for category in categories}, per_page,
+        )
+    queries = {
+        category.pk: page_query(queryset.filter(category=category), sort, cursors.get(category.pk), per_page)
+        for category in categories
+    }
+    connection = connections[router.db_for_read(Product)]
+    if len(queries) > 1 and connection.features.supports_slicing_ordering_in_compound:
+        ids = _fetch([query.values_list('pk', flat=True) for query, _ in queries.values()])
+        products = with_sort_keys(queryset, sort).in_bulk(ids)
+        rows = {category_id: [] for category_id in queries}
+        for product in products.values():
+            rows[product.category_id].append(product)
+        for category_id, (_, direction) in queries.items():
+            order = _compare(_columns(sort), direction != 'prev')
+            rows[category_id].sort(key=lambda product: order(_sort_values(product, sort)))
+    else:
+        rows = {category_id: list(query) for category_id, (query, _) in queries.items()}
+
+    return {
+        category_id: make_page(rows[category_id], sort, direction, per_page)
+        for category_id, (_, direction) in queries.items()
+    }
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from product.fuzzy import build_search_terms
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the vocabulary of product name words that fuzzy search corrects queries against'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of terms inserted per query (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        terms = build_search_terms(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Successfully built {terms} search terms!'))
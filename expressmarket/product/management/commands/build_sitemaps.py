@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from product.sitemaps import build_sitemaps
+
+
+class Command(BaseCommand):
+    help = 'Writes sitemap.xml and its product shards to SITEMAP_ROOT, rewriting only the shards that changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--base-url',
+            default='http://localhost:8000',
+            help='Scheme and host for the URLs in the sitemaps (default: http://localhost:8000)',
+        )
+        parser.add_argument(
+            '--output-dir',
+            help='Directory to write to (default: SITEMAP_ROOT)',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Rewrite every shard, changed or not',
+        )
+
+    def handle(self, *args, **options):
+        written, shards = build_sitemaps(
+            options['base_url'].rstrip('/'),
+            root=options['output_dir'],
+            force=options['force'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Successfully wrote {written} of {shards} sitemap shards!'))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from product.rankings import compute_rankings
+from product.tasks import refresh_rankings
+
+
+class Command(BaseCommand):
+    help = 'Recomputes bestseller and trending scores for products and categories from recent orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=30,
+            help='Only count orders from this many days back (default: 30)',
+        )
+        parser.add_argument(
+            '--half-life',
+            type=float,
+            default=3.0,
+            help='Days after which a sale counts half as much towards trending (default: 3)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of ranking rows inserted per query (default: 1000)',
+        )
+        parser.add_argument(
+            '--enqueue',
+            action='store_true',
+            help='Queue the recompute for run_workers (with the default options) instead of running it here',
+        )
+
+    def handle(self, *args, **options):
+        if options['enqueue']:
+            # Keyed, so schedules that fire faster than workers run it queue it only once
+            refresh_rankings.enqueue(key='rankings')
+            self.stdout.write(self.style.SUCCESS('Successfully queued the rankings recompute!'))
+            return
+
+        products, categories = compute_rankings(
+            days=options['days'],
+            half_life_days=options['half_life'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully ranked {products} products in {categories} categories!'
+        ))
@@ -1,15 +1,12 @@
 from django.core.management.base import BaseCommand
-from django.core.files.uploadedfile import SimpleUploadedFile
-from product.models import Product, Category
+from product.models import Category
+from product.seeding import MarketplaceSeeder, SHARED_VENDOR_LOGO, ensure_shared_file
 from vendor.models import Vendor
 from accounts.models import User
-import random
-import string
-from decimal import Decimal
 
 
 class Command(BaseCommand):
-    help = 'Creates 100 random products with random data'
+    help = 'Creates random products in bulk, sharing a single placeholder image'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -18,6 +15,12 @@ class Command(BaseCommand):
             default=100,
             help='Number of products to create (default: 100)',
         )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed; the same seed generates the same products (default: 42)',
+        )
 
     def handle(self, *args, **options):
         count = options['count']
@@ -36,75 +39,8 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR('No vendors available. Please create vendors first.'))
             return
         
-        # Product name templates
-        product_names = [
-            'Premium', 'Deluxe', 'Standard', 'Professional', 'Advanced',
-            'Classic', 'Modern', 'Elegant', 'Stylish', 'Luxury',
-            'Smart', 'Digital', 'Wireless', 'Portable', 'Compact'
-        ]
-        
-        product_types = [
-            'Laptop', 'Smartphone', 'Headphones', 'Watch', 'Camera',
-            'Tablet', 'Speaker', 'Keyboard', 'Mouse', 'Monitor',
-            'Charger', 'Cable', 'Case', 'Stand', 'Bag',
-            'Shirt', 'Pants', 'Shoes', 'Jacket', 'Hat',
-            'Book', 'Pen', 'Notebook', 'Desk', 'Chair'
-        ]
-        
-        descriptions = [
-            'High quality product with excellent features.',
-            'Perfect for everyday use with modern design.',
-            'Durable and reliable product built to last.',
-            'Stylish and functional design for modern lifestyle.',
-            'Premium quality with outstanding performance.',
-            'Innovative design meets practical functionality.',
-            'Comfortable and ergonomic design for long-term use.',
-            'Elegant and sophisticated product for discerning customers.',
-        ]
-        
-        created_count = 0
-        
-        for i in range(count):
-            # Generate random product name
-            name = f"{random.choice(product_names)} {random.choice(product_types)} {i+1}"
-            
-            # Generate random description
-            description = random.choice(descriptions)
-            if random.choice([True, False]):
-                description += f" Features include {random.choice(['wireless connectivity', 'long battery life', 'premium materials', 'advanced technology', 'eco-friendly design'])}."
-            
-            # Generate random price between 10.00 and 9999.99
-            price = Decimal(str(random.uniform(10.00, 9999.99))).quantize(Decimal('0.01'))
-            
-            # Random category and vendor
-            category = random.choice(categories)
-            vendor = random.choice(vendors)
-            
-            # Create a simple dummy image
-            # Create a minimal 1x1 pixel PNG image
-            image_content = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x06\x00\x00\x00\x1f\x15\xc4\x89\x00\x00\x00\nIDATx\x9cc\x00\x01\x00\x00\x05\x00\x01\r\n-\xdb\x00\x00\x00\x00IEND\xaeB`\x82'
-            image_file = SimpleUploadedFile(
-                name=f"product_{i+1}.png",
-                content=image_content,
-                content_type='image/png'
-            )
-            
-            try:
-                product = Product.objects.create(
-                    name=name,
-                    description=description,
-                    price=price,
-                    image=image_file,
-                    category=category,
-                    vendor=vendor
-                )
-                created_count += 1
-                if (i + 1) % 10 == 0:
-                    self.stdout.write(f'Created {i + 1}/{count} products...')
-            except Exception as e:
-                self.stdout.write(
-                    self.style.WARNING(f'Failed to create product {i+1}: {str(e)}')
-                )
+        seeder = MarketplaceSeeder(seed=options['seed'], log=self.stdout.write)
+        created_count = seeder.seed_products(count)
         
         self.stdout.write(
             self.style.SUCCESS(f'Successfully created {created_count} products!')
@@ -160,13 +96,8 @@ class Command(BaseCommand):
                 user.set_password('testpass123')
                 user.save()
             
-            # Create vendor with a dummy logo
-            logo_content = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x06\x00\x00\x00\x1f\x15\xc4\x89\x00\x00\x00\nIDATx\x9cc\x00\x01\x00\x00\x05\x00\x01\r\n-\xdb\x00\x00\x00\x00IEND\xaeB`\x82'
-            logo_file = SimpleUploadedFile(
-                name='vendor_logo.png',
-                content=logo_content,
-                content_type='image/png'
-            )
+            # All seeded vendors share one placeholder logo
+            logo_file = ensure_shared_file(SHARED_VENDOR_LOGO)
             
             vendor, created = Vendor.objects.get_or_create(
                 user=user,
@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core_ecommerce.exports import EXPORT_FORMATS, gzip_stream
+from product.feeds import feed_lines, feed_started, parse_since
+
+
+class Command(BaseCommand):
+    help = 'Writes the product catalog as a CSV, JSON Lines or XML feed for partners, streaming it to disk'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format',
+            choices=list(EXPORT_FORMATS),
+            default='csv',
+            help='Feed format (default: csv)',
+        )
+        parser.add_argument(
+            '--output',
+            help='File to write (default: catalog.<format>, plus .gz with --gzip)',
+        )
+        parser.add_argument(
+            '--gzip',
+            action='store_true',
+            help='Compress the feed while writing it',
+        )
+        parser.add_argument(
+            '--since',
+            help='Only products changed at or after this ISO date or datetime',
+        )
+        parser.add_argument(
+            '--base-url',
+            default='http://localhost:8000',
+            help='Scheme and host for product and image links (default: http://localhost:8000)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            since = parse_since(options['since'])
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        export_format = options['format']
+        output = options['output'] or f"catalog.{export_format}{'.gz' if options['gzip'] else ''}"
+        base_url = options['base_url'].rstrip('/')
+        media_url = settings.MEDIA_URL if '://' in settings.MEDIA_URL else base_url + settings.MEDIA_URL
+
+        started = feed_started()
+        lines = feed_lines(export_format, base_url, media_url, since)
+        if options['gzip']:
+            with open(output, 'wb') as f:
+                for chunk in gzip_stream(lines):
+                    f.write(chunk)
+        else:
+            with open(output, 'w', encoding='utf-8', newline='') as f:
+                for line in lines:
+                    f.write(line)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully wrote the catalog feed to {output}! '
+            f'Pass --since {started.isoformat()} next time for the changes after this run.'
+        ))
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+
+from product.archival import purge_batch, purge_cutoff
+
+
+class Command(BaseCommand):
+    help = 'Deletes products archived longer than a given age that are in no remaining order'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=getattr(settings, 'PRODUCT_PURGE_AFTER_DAYS', 90),
+            help='Purge products archived more than this many days ago (default: PRODUCT_PURGE_AFTER_DAYS)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Number of products deleted per transaction (default: 100)',
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            default=None,
+            help='Stop after this many batches (default: run until done)',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = purge_cutoff(options['days'])
+        batch_size = options['batch_size']
+        max_batches = options['max_batches']
+
+        self.stdout.write(f'Purging products archived before {cutoff:%Y-%m-%d %H:%M}...')
+
+        total = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            deleted = purge_batch(cutoff, batch_size)
+            if not deleted:
+                break
+            total += deleted
+            batches += 1
+            self.stdout.write(f'Purged {total} products...')
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully purged {total} products!'))
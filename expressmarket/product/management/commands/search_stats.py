@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from product.search import search_log
+
+
+# Shares of all searches to report the number of distinct queries for
+COVERAGE_TARGETS = (0.5, 0.8, 0.9, 0.95)
+
+
+class Command(BaseCommand):
+    help = 'Shows the most frequent search queries and how many distinct queries cover most searches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=20,
+            help='Number of queries to list (default: 20)',
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Clear the query counts after printing them',
+        )
+
+    def handle(self, *args, **options):
+        total, queries = search_log.totals()
+        if not total:
+            self.stdout.write('No searches recorded yet.')
+            return
+
+        self.stdout.write(f'{"count":>10}{"share":>9}  query')
+        for query, count in queries[:options['top']]:
+            self.stdout.write(f'{count:>10}{count / total:>9.1%}  {query}')
+
+        self.stdout.write(f'\n{total} searches, {len(queries)} distinct queries tracked')
+        for target in COVERAGE_TARGETS:
+            covered = 0
+            for needed, (_, count) in enumerate(queries, start=1):
+                covered += count
+                if covered >= target * total:
+                    self.stdout.write(f'{needed:>10} queries cover {target:.0%} of searches')
+                    break
+            else:
+                self.stdout.write(f'{"-":>10} the tracked queries cover less than {target:.0%} of searches')
+
+        if options['reset']:
+            search_log.reset()
+            self.stdout.write(self.style.SUCCESS('Counters reset.'))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from product.seeding import MarketplaceSeeder
+
+
+class Command(BaseCommand):
+    help = 'Seeds vendors, customers, products, orders and reviews in bulk for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=42, help='Random seed; the same seed generates the same data (default: 42)')
+        parser.add_argument('--vendors', type=int, default=50, help='Number of vendors to create (default: 50)')
+        parser.add_argument('--customers', type=int, default=1000, help='Number of customers to create (default: 1000)')
+        parser.add_argument('--products', type=int, default=10000, help='Number of products to create (default: 10000)')
+        parser.add_argument('--orders', type=int, default=5000, help='Number of orders to create (default: 5000)')
+        parser.add_argument('--items-per-order', type=float, default=2.0, help='Average number of lines per order (default: 2.0)')
+        parser.add_argument('--reviews-per-customer', type=float, default=0.5, help='Average number of reviews per customer (default: 0.5)')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows generated per transaction (default: 5000)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per INSERT statement (default: 1000)')
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes; keep at 1 on SQLite (default: 1)')
+
+    def handle(self, *args, **options):
+        seeder = MarketplaceSeeder(
+            seed=options['seed'],
+            chunk_size=options['chunk_size'],
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            log=self.stdout.write,
+        )
+
+        try:
+            self.stdout.write(f'Categories available: {seeder.seed_categories()}')
+            seeder.seed_vendors(options['vendors'])
+            seeder.seed_customers(options['customers'])
+            seeder.seed_products(options['products'])
+            seeder.seed_orders(options['orders'], items_per_order=options['items_per_order'])
+            seeder.seed_reviews(options['reviews_per_customer'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS('Successfully seeded marketplace data!'))
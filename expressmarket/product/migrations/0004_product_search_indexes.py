@@ -0,0 +1,17 @@
+from django.db import migrations
+
+from core_ecommerce.pgindexes import trigram_index
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('product', '0003_productreview'),
+    ]
+
+    # Storefront searches (name__icontains) and order item admin searches by product name
+    operations = [
+        trigram_index('product_product_name_trgm', 'product_product', 'UPPER("name")'),
+    ]
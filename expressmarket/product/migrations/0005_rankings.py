@@ -0,0 +1,36 @@
+# Generated by Django 6.0 on 2026-10-19 13:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0004_product_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryRanking',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='product.category')),
+                ('bestseller_score', models.PositiveIntegerField(default=0)),
+                ('trending_score', models.FloatField(default=0)),
+                ('computed_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProductRanking',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='product.product')),
+                ('bestseller_score', models.PositiveIntegerField(default=0)),
+                ('trending_score', models.FloatField(default=0)),
+                ('computed_at', models.DateTimeField()),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_rankings', to='product.category')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-bestseller_score'], name='ranking_bestseller_idx'), models.Index(fields=['-trending_score'], name='ranking_trending_idx'), models.Index(fields=['category', '-bestseller_score'], name='ranking_cat_bestseller_idx'), models.Index(fields=['category', '-trending_score'], name='ranking_cat_trending_idx')],
+            },
+        ),
+    ]
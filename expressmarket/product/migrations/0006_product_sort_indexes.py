@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-19 13:55
+
+from django.db import migrations, models
+from django.db.models import Avg, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_average_rating(apps, schema_editor):
+    Product = apps.get_model('product', 'Product')
+    ProductReview = apps.get_model('product', 'ProductReview')
+    db = schema_editor.connection.alias
+    average = ProductReview.objects.filter(product=OuterRef('pk')).values('product').annotate(
+        average=Avg('rating'),
+    ).values('average')
+    Product.objects.using(db).update(average_rating=Coalesce(Subquery(average), 0.0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0005_rankings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='average_rating',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(fill_average_rating, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'created_at', 'id'], name='product_cat_newest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'price', 'id'], name='product_cat_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'average_rating', 'id'], name='product_cat_rating_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-19 14:20
+
+import re
+from collections import Counter
+
+from django.db import migrations, models
+
+from core_ecommerce.pgindexes import trigram_index
+
+
+def fill_search_terms(apps, schema_editor):
+    Product = apps.get_model('product', 'Product')
+    SearchTerm = apps.get_model('product', 'SearchTerm')
+    db = schema_editor.connection.alias
+    counts = Counter()
+    for name in Product.objects.using(db).values_list('name', flat=True).order_by().iterator(chunk_size=5000):
+        words = re.findall(r'[^\W_]+', name.casefold())
+        counts.update({word for word in words if 3 <= len(word) <= 100 and not word.isdigit()})
+    SearchTerm.objects.using(db).bulk_create(
+        (SearchTerm(word=word, product_count=count) for word, count in counts.items()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0006_product_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('word', models.CharField(max_length=100, unique=True)),
+                ('product_count', models.PositiveIntegerField(default=1)),
+            ],
+        ),
+        # Other databases search the terms with an in-memory index instead
+        trigram_index('product_searchterm_word_trgm', 'product_searchterm', '"word"', concurrently=False),
+        migrations.RunPython(fill_search_terms, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-19 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0008_product_updated_index'),
+        ('vendor', '0005_settlements'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='is_active',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'archived_at'], name='product_archived_idx'),
+        ),
+    ]
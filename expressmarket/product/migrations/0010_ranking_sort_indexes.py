@@ -0,0 +1,45 @@
+# Generated by Django 6.0 on 2026-10-19 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0009_product_archival'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='productranking',
+            name='ranking_bestseller_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='productranking',
+            name='ranking_trending_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='productranking',
+            name='ranking_cat_bestseller_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='productranking',
+            name='ranking_cat_trending_idx',
+        ),
+        migrations.AddIndex(
+            model_name='productranking',
+            index=models.Index(fields=['-bestseller_score', 'product'], name='ranking_bestseller_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productranking',
+            index=models.Index(fields=['-trending_score', 'product'], name='ranking_trending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productranking',
+            index=models.Index(fields=['category', '-bestseller_score', 'product'], name='ranking_cat_bestseller_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productranking',
+            index=models.Index(fields=['category', '-trending_score', 'product'], name='ranking_cat_trending_idx'),
+        ),
+    ]
@@ -1,4 +1,8 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Avg, OuterRef, Subquery
+from django.dispatch import Signal
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from vendor.models import Vendor
 from django.utils.text import slugify
 from django.core.validators import MinValueValidator, MaxValueValidator
@@ -24,6 +28,58 @@ class Category(models.Model):
         super().save(*args, **kwargs)
 
 
+def average_rating_expression():
+    """The mean review rating of the product being updated, or 0"""
+    average = ProductReview.objects.filter(product=OuterRef('pk')).values('product').annotate(
+        average=Avg('rating'),
+    ).values('average')
+    return Coalesce(Subquery(average), 0.0)
+
+
+# Sent after ProductQuerySet.archive()/unarchive() with `products`, the
+# products whose is_active changed, and `active`, their new value. Those
+# are UPDATEs, so post_save is not sent for them.
+products_archived = Signal()
+
+
+class ProductQuerySet(models.QuerySet):
+    def update_ratings(self):
+        """Recompute average_rating from the reviews in one UPDATE"""
+        return self.update(average_rating=average_rating_expression(), updated_at=timezone.now())
+
+    def archive(self):
+        """Take these products off sale; returns the number archived"""
+        return self._set_active(False)
+
+    def unarchive(self):
+        """Put archived products back on sale; returns the number restored"""
+        return self._set_active(True)
+
+    def _set_active(self, active):
+        now = timezone.now()
+        with transaction.atomic(savepoint=False):
+            products = list(
+                self.filter(is_active=not active).order_by('id').select_for_update()
+                .only('id', 'slug', 'name', 'price', 'category_id', 'vendor_id')
+            )
+            if not products:
+                return 0
+            Product.all_objects.filter(pk__in=[product.pk for product in products]).update(
+                is_active=active, archived_at=None if active else now, updated_at=now,
+            )
+            for product in products:
+                product.is_active, product.archived_at, product.updated_at = active, None if active else now, now
+            products_archived.send(sender=Product, products=products, active=active)
+        return len(products)
+
+
+class ActiveProductManager(models.Manager.from_queryset(ProductQuerySet)):
+    """Products on sale; archived products are only reachable through Product.all_objects"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(is_active=True)
+
+
 class Product(models.Model):
     name = models.CharField(max_length=255)
     slug = models.SlugField(unique=True, blank=True)
@@ -32,19 +88,54 @@ class Product(models.Model):
     image = models.ImageField(upload_to='products/')
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     vendor = models.ForeignKey(Vendor, on_delete=models.CASCADE)
+    # Mean review rating (0 without reviews), kept up to date by update_rating()
+    average_rating = models.FloatField(default=0)
+    # Archived products keep their order history and reviews but are not
+    # listed or sold; purge_archived_products deletes them later
+    is_active = models.BooleanField(default=True)
+    archived_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # The first manager is the default, used by listings, forms and get_object_or_404
+    objects = ActiveProductManager()
+    all_objects = ProductQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
+        # One per catalog sort (see product/listing.py); descending sorts
+        # scan the ascending indexes backwards
+        indexes = [
+            models.Index(fields=['category', 'created_at', 'id'], name='product_cat_newest_idx'),
+            models.Index(fields=['category', 'price', 'id'], name='product_cat_price_idx'),
+            models.Index(fields=['category', 'average_rating', 'id'], name='product_cat_rating_idx'),
+            # Incremental feeds: what changed since a given time
+            models.Index(fields=['updated_at'], name='product_updated_idx'),
+            # Archived products due for purging
+            models.Index(fields=['is_active', 'archived_at'], name='product_archived_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Compared on save to tell price changes apart (see core_ecommerce.events)
+        instance._loaded_price = instance.__dict__.get('price')
+        return instance
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
-        super().save(*args, **kwargs)
+        # The change event written by post_save commits or rolls back with the
+        # row; no savepoint, as a failure here fails the caller's transaction too
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+
+    def update_rating(self):
+        """Recompute average_rating from the reviews in one UPDATE"""
+        Product.all_objects.filter(pk=self.pk).update_ratings()
 
 
 
@@ -60,4 +151,57 @@ class ProductReview(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"{self.user.username} - {self.product.name}"
\ No newline at end of file
+        return f"{self.user.username} - {self.product.name}"
+
+class ProductRanking(models.Model):
+    """
+    Precomputed popularity of a product, rebuilt from recent orders by the
+    compute_rankings command. Products with no recent sales have no row.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='ranking')
+    # Copied from the product so per-category rankings read one index
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='product_rankings')
+    # Units sold in the ranking window
+    bestseller_score = models.PositiveIntegerField(default=0)
+    # Units sold, each weighted down by half for every half-life since the sale
+    trending_score = models.FloatField(default=0)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # In the order the ranking sorts read them (see product/listing.py)
+            models.Index(fields=['-bestseller_score', 'product'], name='ranking_bestseller_idx'),
+            models.Index(fields=['-trending_score', 'product'], name='ranking_trending_idx'),
+            models.Index(fields=['category', '-bestseller_score', 'product'], name='ranking_cat_bestseller_idx'),
+            models.Index(fields=['category', '-trending_score', 'product'], name='ranking_cat_trending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.bestseller_score} sold, trending {self.trending_score:.2f}"
+
+
+class CategoryRanking(models.Model):
+    """Precomputed popularity of a category: the sum of its products' scores"""
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, primary_key=True, related_name='ranking')
+    bestseller_score = models.PositiveIntegerField(default=0)
+    trending_score = models.FloatField(default=0)
+    computed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.category_id}: {self.bestseller_score} sold, trending {self.trending_score:.2f}"
+
+
+class SearchTerm(models.Model):
+    """
+    A word used in product names. Fuzzy search corrects misspelled queries
+    against this vocabulary (see product/fuzzy.py), which stays small
+    however many products there are.
+    """
+    # Declared so it matches migration 0007 whatever DEFAULT_AUTO_FIELD is
+    id = models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')
+    word = models.CharField(max_length=100, unique=True)
+    # Products whose name uses the word, as of the last build_search_terms run
+    product_count = models.PositiveIntegerField(default=1)
+
+    def __str__(self):
+        return self.word
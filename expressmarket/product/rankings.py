@@ -0,0 +1,89 @@
+"""
+Bestseller and trending rankings.
+
+compute_rankings() reads recent order items once, summed per product and
+day in the database, and rewrites the ProductRanking and CategoryRanking
+tables in bulk. Pages sort by the indexed scores instead of aggregating
+OrderItem per request. Run it periodically (`manage.py compute_rankings`);
+between runs the rankings are as old as the last run.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core_ecommerce.models import OrderItem
+from core_ecommerce.pagecache import page_cache
+from product.models import CategoryRanking, ProductRanking
+
+
+# Sort names accepted by the storefront and the ranking field behind each
+RANKING_SORTS = {
+    'bestsellers': 'bestseller_score',
+    'trending': 'trending_score',
+}
+
+
+def daily_sales(since):
+    """(product_id, category_id, day, units) for every product sold on each day since `since`"""
+    return (
+        OrderItem.objects
+        .filter(order__created_at__gte=since)
+        .exclude(order__status='cancelled')
+        .annotate(day=TruncDate('order__created_at'))
+        .values_list('product_id', 'product__category_id', 'day')
+        .annotate(units=Sum('quantity'))
+        .order_by()
+        .iterator(chunk_size=5000)
+    )
+
+
+def compute_rankings(days=30, half_life_days=3.0, batch_size=1000, now=None):
+    """
+    Rebuild both ranking tables from the last `days` days of orders.
+    Trending scores halve for every `half_life_days` since the sale.
+    Returns (products ranked, categories ranked).
+    """
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+
+    products = {}
+    categories = defaultdict(lambda: [0, 0.0])
+    for product_id, category_id, day, units in daily_sales(now - timedelta(days=days)):
+        weight = 0.5 ** ((today - day).days / half_life_days)
+        entry = products.setdefault(product_id, [category_id, 0, 0.0])
+        entry[1] += units
+        entry[2] += units * weight
+        categories[category_id][0] += units
+        categories[category_id][1] += units * weight
+
+    with transaction.atomic():
+        ProductRanking.objects.all().delete()
+        ProductRanking.objects.bulk_create(
+            (
+                ProductRanking(
+                    product_id=product_id, category_id=category_id, computed_at=now,
+                    bestseller_score=units, trending_score=round(trending, 4),
+                )
+                for product_id, (category_id, units, trending) in products.items()
+            ),
+            batch_size=batch_size,
+        )
+        CategoryRanking.objects.all().delete()
+        CategoryRanking.objects.bulk_create(
+            (
+                CategoryRanking(
+                    category_id=category_id, computed_at=now,
+                    bestseller_score=units, trending_score=round(trending, 4),
+                )
+                for category_id, (units, trending) in categories.items()
+            ),
+            batch_size=batch_size,
+        )
+        # The home page can be sorted by these scores
+        transaction.on_commit(lambda: page_cache.purge('path:/'))
+
+    return len(products), len(categories)
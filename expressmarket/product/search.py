@@ -0,0 +1,134 @@
+"""
+Cached product search.
+
+Searches are normalised (casefolded, runs of whitespace collapsed) so
+"Red  Shoes" and "red shoes" are one query, and the ids of the matching
+products are cached per (query, category filter) in search_cache. Any
+product or category change clears the whole cache by moving its
+generation on. Queries matching more than SEARCH_MAX_CACHED_IDS products
+are remembered as "too broad" and filtered in the database as before.
+Spelling corrections for queries that match nothing are cached the same
+way.
+
+Every search the view runs (pages served from the page cache never get
+that far) is also counted in search_log, so `manage.py search_stats` can
+show how many distinct queries make up most of the traffic: that is what
+SEARCH_CACHE_LOCAL_ENTRIES should be.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from django.core.cache import caches
+
+from core_ecommerce.caching import CACHE_KEY_PREFIX, METRICS_FLUSH_SECONDS, search_cache
+from product import fuzzy
+from product.models import Product
+
+
+# Larger result lists are not worth keeping in the cache
+SEARCH_MAX_CACHED_IDS = 2000
+
+# Distinct queries kept in the shared frequency table; rarer ones only count towards the total
+SEARCH_LOG_SIZE = 1000
+
+
+def normalize_query(query):
+    return ' '.join(query.casefold().split())
+
+
+def _matching_ids(query, category_slug):
+    products = Product.objects.filter(name__icontains=query)
+    if category_slug:
+        products = products.filter(category__slug=category_slug)
+    ids = list(products.order_by().values_list('id', flat=True)[:SEARCH_MAX_CACHED_IDS + 1])
+    if len(ids) > SEARCH_MAX_CACHED_IDS:
+        return None
+    return ids
+
+
+def matching_ids(query, category_slug=''):
+    """
+    Ids of the products whose name contains the normalised `query`, or None
+    if there are too many to cache
+    """
+    digest = hashlib.md5(query.encode(), usedforsecurity=False).hexdigest()
+    return search_cache.get(digest, category_slug, compute=lambda: _matching_ids(query, category_slug))
+
+
+def suggest_correction(query):
+    """A spelling-corrected version of `query` (see product/fuzzy.py), or None"""
+    query = normalize_query(query)
+    if not query:
+        return None
+    digest = hashlib.md5(query.encode(), usedforsecurity=False).hexdigest()
+    return search_cache.get('suggest', digest, compute=lambda: fuzzy.suggest(query))
+
+
+def search_products(queryset, query, category_slug=''):
+    """Filter `queryset` down to the products matching `query`, through the cache"""
+    query = normalize_query(query)
+    if not query:
+        return queryset
+    search_log.record(query)
+    ids = matching_ids(query, category_slug)
+    if ids is None:
+        return queryset.filter(name__icontains=query)
+    return queryset.filter(pk__in=ids)
+
+
+class SearchLog:
+    """
+    Per-process counts of normalised queries, merged every
+    METRICS_FLUSH_SECONDS into a table in the shared cache. The table keeps
+    the SEARCH_LOG_SIZE most frequent queries plus the total number of
+    searches, so it stays small however many distinct queries arrive.
+    """
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._last_flush = time.monotonic()
+
+    @property
+    def key(self):
+        return f'{CACHE_KEY_PREFIX}:searchlog'
+
+    def record(self, query):
+        with self._lock:
+            self._counts[query] += 1
+            due = time.monotonic() - self._last_flush >= METRICS_FLUSH_SECONDS
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            self._last_flush = time.monotonic()
+        if not counts:
+            return
+        shared = caches[self.alias]
+        # Read-modify-write: a concurrent flush from another worker can be lost, which is fine for sizing
+        table = shared.get(self.key) or {'total': 0, 'queries': {}}
+        merged = Counter(table['queries'])
+        merged.update(counts)
+        shared.set(self.key, {
+            'total': table['total'] + sum(counts.values()),
+            'queries': dict(merged.most_common(SEARCH_LOG_SIZE)),
+        }, timeout=None)
+
+    def totals(self):
+        """(searches counted, [(query, count)] most frequent first) for all workers"""
+        self.flush()
+        table = caches[self.alias].get(self.key) or {'total': 0, 'queries': {}}
+        return table['total'], Counter(table['queries']).most_common()
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+        caches[self.alias].delete(self.key)
+
+
+search_log = SearchLog()
@@ -0,0 +1,460 @@
+"""
+Bulk data generator for load testing at production scale.
+
+Rows are written with chunked bulk_create, every product shares one image
+file, and each chunk draws from its own random.Random seeded with
+(seed, phase, chunk start), so a given seed always produces the same data
+whether it runs in one process or many. Popularity is Zipf-distributed:
+a few customers, vendors and products account for most orders and reviews.
+"""
+import random
+from array import array
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+from multiprocessing import get_context
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.text import slugify
+
+from accounts.models import User
+from core_ecommerce.models import ArchivedOrder, Order, OrderItem, VendorOrder
+from product.fuzzy import build_search_terms
+from product.models import Category, Product, ProductReview, average_rating_expression
+from vendor.models import Vendor
+
+
+# A minimal 1x1 pixel PNG, written once and shared by every seeded row
+PNG_1X1 = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x06\x00\x00\x00\x1f\x15\xc4\x89\x00\x00\x00\nIDATx\x9cc\x00\x01\x00\x00\x05\x00\x01\r\n-\xdb\x00\x00\x00\x00IEND\xaeB`\x82'
+SHARED_PRODUCT_IMAGE = 'products/seed.png'
+SHARED_VENDOR_LOGO = 'vendor/logs/seed.png'
+
+DEFAULT_CATEGORIES = [
+    'Electronics', 'Clothing', 'Home & Garden', 'Books', 'Sports & Outdoors',
+    'Toys & Games', 'Health & Beauty', 'Automotive', 'Food & Beverages', 'Office Supplies',
+]
+PRODUCT_ADJECTIVES = [
+    'Premium', 'Deluxe', 'Standard', 'Professional', 'Advanced',
+    'Classic', 'Modern', 'Elegant', 'Stylish', 'Luxury',
+    'Smart', 'Digital', 'Wireless', 'Portable', 'Compact',
+]
+PRODUCT_TYPES = [
+    'Laptop', 'Smartphone', 'Headphones', 'Watch', 'Camera',
+    'Tablet', 'Speaker', 'Keyboard', 'Mouse', 'Monitor',
+    'Charger', 'Cable', 'Case', 'Stand', 'Bag',
+    'Shirt', 'Pants', 'Shoes', 'Jacket', 'Hat',
+    'Book', 'Pen', 'Notebook', 'Desk', 'Chair',
+]
+DESCRIPTIONS = [
+    'High quality product with excellent features.',
+    'Perfect for everyday use with modern design.',
+    'Durable and reliable product built to last.',
+    'Stylish and functional design for modern lifestyle.',
+    'Premium quality with outstanding performance.',
+]
+FIRST_NAMES = ['Abebe', 'Sara', 'Dawit', 'Hana', 'Yonas', 'Meron', 'Kebede', 'Liya', 'Samuel', 'Ruth']
+LAST_NAMES = ['Tesfaye', 'Bekele', 'Alemu', 'Girma', 'Haile', 'Tadesse', 'Mekonnen', 'Wolde']
+CITIES = ['Addis Ababa', 'Adama', 'Bahir Dar', 'Hawassa', 'Mekelle', 'Dire Dawa', 'Gondar']
+REVIEW_COMMENTS = [
+    'Great value for money.', 'Works as described.', 'Arrived quickly, well packaged.',
+    'Not what I expected.', 'Would buy again.', 'Decent quality for the price.',
+]
+# Older orders are mostly completed; recent ones are still moving
+STATUS_BY_AGE = [
+    (7, ['pending', 'processing', 'shipped'], [5, 3, 2]),
+    (30, ['processing', 'shipped', 'delivered', 'cancelled'], [1, 3, 5, 1]),
+    (None, ['delivered', 'cancelled'], [9, 1]),
+]
+# Ratings skew positive, as they do in practice
+RATING_WEIGHTS = [5, 5, 10, 30, 50]
+SEED_PASSWORD = 'seedpass123'
+MAX_HISTORY_DAYS = 730
+
+
+def ensure_shared_file(name):
+    """Write the shared placeholder image once and return its storage name"""
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(PNG_1X1))
+    return name
+
+
+def zipf_cum_weights(n, s=1.1):
+    """Cumulative Zipf weights for ranks 1..n, for random.choices(cum_weights=...)"""
+    return list(accumulate(1.0 / (rank ** s) for rank in range(1, n + 1)))
+
+
+def chunk_rng(seed, phase, start):
+    return random.Random(f'{seed}:{phase}:{start}')
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """
+    Temporarily turn off auto_now/auto_now_add on the given models so
+    bulk_create keeps the generated created_at/updated_at values.
+    """
+    saved = []
+    for model in models:
+        for field in model._meta.concrete_fields:
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                saved.append((field, field.auto_now, field.auto_now_add))
+                field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def to_base36(number, width):
+    digits = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    out = ''
+    while number:
+        number, remainder = divmod(number, 36)
+        out = digits[remainder] + out
+    return out.rjust(width, '0')[-width:]
+
+
+# Per-process state for the current phase. Set directly in single-process
+# runs, or through the pool initializer (inherited on fork) in workers.
+_state = {}
+
+
+def _init_worker(state):
+    global _state
+    _state = state
+
+
+def _run_chunk(task):
+    phase, start, stop = task
+    with explicit_timestamps(Product, Order, ProductReview), transaction.atomic():
+        return PHASES[phase](_state, start, stop)
+
+
+def _build_customers(state, start, stop):
+    rng = chunk_rng(state['seed'], 'customers', start)
+    offset = state['offset']
+    users = []
+    for i in range(start, stop):
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        username = f"seed{state['seed']}_customer{offset + i}"
+        users.append(User(
+            username=username,
+            email=f'{username}@example.com',
+            first_name=first_name,
+            last_name=last_name,
+            password=state['password'],
+            user_type='customer',
+        ))
+    User.objects.bulk_create(users, batch_size=state['batch_size'])
+    return len(users)
+
+
+def _build_vendors(state, start, stop):
+    rng = chunk_rng(state['seed'], 'vendors', start)
+    offset = state['offset']
+    users = []
+    for i in range(start, stop):
+        username = f"seed{state['seed']}_vendor{offset + i}"
+        users.append(User(
+            username=username,
+            email=f'{username}@example.com',
+            password=state['password'],
+            user_type='vendor',
+        ))
+    users = User.objects.bulk_create(users, batch_size=state['batch_size'])
+    Vendor.objects.bulk_create(
+        [
+            Vendor(
+                user=user,
+                logo=SHARED_VENDOR_LOGO,
+                business_name=f'{rng.choice(LAST_NAMES)} {rng.choice(PRODUCT_TYPES)} Store',
+                tin=f'TIN{rng.randrange(10 ** 9):09d}',
+                rating=rng.randint(1, 5),
+            )
+            for user in users
+        ],
+        batch_size=state['batch_size'],
+    )
+    return len(users)
+
+
+def _build_products(state, start, stop):
+    rng = chunk_rng(state['seed'], 'products', start)
+    now = state['now']
+    offset = state['offset']
+    vendor_ids = state['vendor_ids']
+    products = []
+    for i in range(start, stop):
+        name = f'{rng.choice(PRODUCT_ADJECTIVES)} {rng.choice(PRODUCT_TYPES)} {offset + i + 1}'
+        price = Decimal(str(min(max(rng.lognormvariate(3.5, 1.2), 1), 99999))).quantize(Decimal('0.01'))
+        created_at = now - timedelta(days=rng.uniform(0, MAX_HISTORY_DAYS))
+        products.append(Product(
+            name=name,
+            slug=f"{slugify(name)}-{state['seed']}",
+            description=rng.choice(DESCRIPTIONS),
+            price=price,
+            image=SHARED_PRODUCT_IMAGE,
+            category_id=rng.choice(state['category_ids']),
+            vendor_id=rng.choices(vendor_ids, cum_weights=state['vendor_weights'])[0],
+            created_at=created_at,
+            updated_at=created_at,
+        ))
+    Product.objects.bulk_create(products, batch_size=state['batch_size'])
+    return len(products)
+
+
+def _order_status(rng, age_days):
+    for max_age, statuses, weights in STATUS_BY_AGE:
+        if max_age is None or age_days <= max_age:
+            return rng.choices(statuses, weights)[0]
+
+
+def _build_orders(state, start, stop):
+    rng = chunk_rng(state['seed'], 'orders', start)
+    now = state['now']
+    product_ids = state['product_ids']
+    product_prices = state['product_prices']
+    product_vendors = state['product_vendors']
+    product_weights = state['product_weights']
+    customer_ids = state['customer_ids']
+    customer_weights = state['customer_weights']
+
+    orders = []
+    lines_per_order = []
+    for i in range(start, stop):
+        # Recent orders are denser than old ones
+        age_days = min(rng.expovariate(1 / 120), MAX_HISTORY_DAYS)
+        created_at = now - timedelta(days=age_days)
+        line_count = min(1 + int(rng.expovariate(1 / state['extra_items'])), 10) if state['extra_items'] else 1
+        picks = rng.choices(range(len(product_ids)), cum_weights=product_weights, k=line_count)
+
+        lines = []
+        subtotal = Decimal('0.00')
+        for index in dict.fromkeys(picks):
+            quantity = rng.choices([1, 2, 3, 4, 5], [60, 20, 10, 5, 5])[0]
+            price = Decimal(product_prices[index]) / 100
+            line_subtotal = price * quantity
+            subtotal += line_subtotal
+            lines.append((product_ids[index], product_vendors[index], quantity, price, line_subtotal))
+
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        orders.append(Order(
+            customer_id=rng.choices(customer_ids, cum_weights=customer_weights)[0],
+            order_number='S' + to_base36(state['seed'] * 10 ** 10 + state['offset'] + i, 9),
+            status=_order_status(rng, age_days),
+            first_name=first_name,
+            last_name=last_name,
+            email=f'{first_name.lower()}.{last_name.lower()}@example.com',
+            phone=f'+2519{rng.randrange(10 ** 8):08d}',
+            shipping_address=f'{rng.randint(1, 999)} Main Street',
+            city=rng.choice(CITIES),
+            subtotal=subtotal,
+            total=subtotal,
+            created_at=created_at,
+            updated_at=created_at,
+        ))
+        lines_per_order.append(lines)
+
+    orders = Order.objects.bulk_create(orders, batch_size=state['batch_size'])
+
+    # One vendor order per (order, vendor), as Order.add_items() splits a checkout
+    vendor_orders = {}
+    for order, lines in zip(orders, lines_per_order):
+        for _, vendor_id, quantity, _, line_subtotal in lines:
+            vendor_order = vendor_orders.get((order.id, vendor_id))
+            if vendor_order is None:
+                vendor_order = vendor_orders[order.id, vendor_id] = VendorOrder(
+                    order=order, vendor_id=vendor_id, status=order.status, created_at=order.created_at,
+                    delivered_at=order.created_at if order.status == 'delivered' else None,
+                )
+            vendor_order.quantity += quantity
+            vendor_order.subtotal += line_subtotal
+    VendorOrder.objects.bulk_create(vendor_orders.values(), batch_size=state['batch_size'])
+
+    OrderItem.objects.bulk_create(
+        [
+            OrderItem(
+                order=order, vendor_order=vendor_orders[order.id, vendor_id], product_id=product_id,
+                quantity=quantity, price=price, subtotal=line_subtotal,
+            )
+            for order, lines in zip(orders, lines_per_order)
+            for product_id, vendor_id, quantity, price, line_subtotal in lines
+        ],
+        batch_size=state['batch_size'],
+    )
+    return len(orders)
+
+
+def _build_reviews(state, start, stop):
+    # Chunks are split by customer, so (user, product) pairs never repeat
+    rng = chunk_rng(state['seed'], 'reviews', start)
+    now = state['now']
+    product_ids = state['product_ids']
+    reviews = []
+    for user_id in state['customer_ids'][start:stop]:
+        count = round(rng.expovariate(1 / state['reviews_per_customer'])) if state['reviews_per_customer'] else 0
+        picks = rng.choices(product_ids, cum_weights=state['product_weights'], k=count) if count else []
+        for product_id in dict.fromkeys(picks):
+            created_at = now - timedelta(days=rng.uniform(0, MAX_HISTORY_DAYS))
+            reviews.append(ProductReview(
+                product_id=product_id,
+                user_id=user_id,
+                rating=rng.choices(range(1, 6), RATING_WEIGHTS)[0],
+                comment=rng.choice(REVIEW_COMMENTS),
+                created_at=created_at,
+                updated_at=created_at,
+            ))
+    ProductReview.objects.bulk_create(reviews, batch_size=state['batch_size'])
+    return len(reviews)
+
+
+PHASES = {
+    'customers': _build_customers,
+    'vendors': _build_vendors,
+    'products': _build_products,
+    'orders': _build_orders,
+    'reviews': _build_reviews,
+}
+
+
+def next_offset(*querysets):
+    """
+    The highest id in `querysets`, to number new seeded rows after. Unlike
+    count(), it does not go back when rows are deleted or archived, so the
+    usernames, product names and order numbers built from it stay unique.
+    """
+    return max(queryset.aggregate(last=Max('id'))['last'] or 0 for queryset in querysets)
+
+
+class MarketplaceSeeder:
+    """
+    Generates marketplace data in phases (vendors, customers, products,
+    orders, reviews). Each phase draws from the rows already in the
+    database, so phases can also be run on their own.
+    """
+
+    def __init__(self, seed=42, chunk_size=5000, batch_size=1000, workers=1, log=None):
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.workers = workers
+        self.log = log or (lambda message: None)
+        self.now = timezone.now()
+
+    def _state(self, **extra):
+        state = {
+            'seed': self.seed,
+            'batch_size': self.batch_size,
+            'now': self.now,
+        }
+        state.update(extra)
+        return state
+
+    def run_phase(self, phase, total, state):
+        """Run one phase in chunks, in-process or across a worker pool"""
+        tasks = [
+            (phase, start, min(start + self.chunk_size, total))
+            for start in range(0, total, self.chunk_size)
+        ]
+        created = 0
+        if self.workers > 1 and len(tasks) > 1:
+            # Children must open their own connections
+            connections.close_all()
+            pool = get_context('fork').Pool(self.workers, initializer=_init_worker, initargs=(state,))
+            with pool:
+                for count in pool.imap_unordered(_run_chunk, tasks):
+                    created += count
+                    self.log(f'{phase}: {created} created...')
+        else:
+            _init_worker(state)
+            for task in tasks:
+                created += _run_chunk(task)
+                self.log(f'{phase}: {created} created...')
+        return created
+
+    def seed_categories(self):
+        for name in DEFAULT_CATEGORIES:
+            Category.objects.get_or_create(name=name)
+        return Category.objects.count()
+
+    def seed_vendors(self, count):
+        ensure_shared_file(SHARED_VENDOR_LOGO)
+        state = self._state(
+            password=make_password(SEED_PASSWORD),
+            offset=next_offset(User.objects.all()),
+        )
+        return self.run_phase('vendors', count, state)
+
+    def seed_customers(self, count):
+        state = self._state(
+            password=make_password(SEED_PASSWORD),
+            offset=next_offset(User.objects.all()),
+        )
+        return self.run_phase('customers', count, state)
+
+    def seed_products(self, count):
+        ensure_shared_file(SHARED_PRODUCT_IMAGE)
+        category_ids = list(Category.objects.values_list('id', flat=True))
+        vendor_ids = array('q', Vendor.objects.order_by('id').values_list('id', flat=True))
+        if not category_ids or not vendor_ids:
+            raise ValueError('Products need at least one category and one vendor.')
+        state = self._state(
+            offset=next_offset(Product.all_objects.all()),
+            category_ids=category_ids,
+            vendor_ids=vendor_ids,
+            vendor_weights=zipf_cum_weights(len(vendor_ids)),
+        )
+        created = self.run_phase('products', count, state)
+        # Bulk inserts skip the signal that adds names to the search vocabulary
+        build_search_terms(batch_size=self.batch_size)
+        return created
+
+    def _catalog_state(self):
+        product_ids = array('q')
+        product_prices = array('q')
+        product_vendors = array('q')
+        rows = Product.objects.order_by('id').values_list('id', 'price', 'vendor_id').iterator(chunk_size=10000)
+        for product_id, price, vendor_id in rows:
+            product_ids.append(product_id)
+            product_prices.append(int(price * 100))
+            product_vendors.append(vendor_id)
+        customer_ids = array('q', User.objects.filter(user_type='customer').order_by('id').values_list('id', flat=True))
+        if not product_ids or not customer_ids:
+            raise ValueError('Orders and reviews need at least one product and one customer.')
+
+        # Shuffle popularity ranks so the bestsellers aren't simply the oldest rows
+        ranks = list(range(len(product_ids)))
+        chunk_rng(self.seed, 'ranks', 0).shuffle(ranks)
+        product_ids = array('q', (product_ids[i] for i in ranks))
+        product_prices = array('q', (product_prices[i] for i in ranks))
+        product_vendors = array('q', (product_vendors[i] for i in ranks))
+        return {
+            'product_ids': product_ids,
+            'product_prices': product_prices,
+            'product_vendors': product_vendors,
+            'product_weights': zipf_cum_weights(len(product_ids)),
+            'customer_ids': customer_ids,
+            'customer_weights': zipf_cum_weights(len(customer_ids), s=0.8),
+        }
+
+    def seed_orders(self, count, items_per_order=2.0):
+        state = self._state(
+            offset=next_offset(Order.objects.all(), ArchivedOrder.objects.all()),
+            extra_items=max(items_per_order - 1, 0),
+            **self._catalog_state(),
+        )
+        return self.run_phase('orders', count, state)
+
+    def seed_reviews(self, reviews_per_customer=0.5):
+        state = self._state(reviews_per_customer=reviews_per_customer, **self._catalog_state())
+        created = self.run_phase('reviews', len(state['customer_ids']), state)
+        # Reviews were bulk inserted without signals, so ratings are refreshed in one pass
+        Product.all_objects.update(average_rating=average_rating_expression())
+        return created
@@ -0,0 +1,131 @@
+"""
+Sitemaps for product pages, written as static files.
+
+Products are split into shards by id: shard n holds ids
+n * SHARD_SIZE + 1 to (n + 1) * SHARD_SIZE, so a shard never exceeds the
+50,000 URLs a sitemap may list and a product always stays in the same
+shard. Each shard is written by walking its id range with keyset queries
+(id > last id seen, LIMIT), and sitemap.xml indexes the shards.
+
+A manifest next to the files records each shard's product count and
+latest updated_at. build_sitemaps() reads the current values for every
+shard in one grouped query and only rewrites the shards where they
+differ: a new, changed or deleted product moves one of them.
+"""
+import json
+import os
+import re
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import Count, F, Max
+from django.urls import reverse
+
+from product.feeds import product_link_prefix
+from product.models import Product
+
+
+SHARD_SIZE = 50_000
+
+# Products fetched per keyset query while writing a shard
+CHUNK_SIZE = 5000
+
+INDEX_NAME = 'sitemap.xml'
+MANIFEST_NAME = 'sitemap-manifest.json'
+SHARD_FILE = re.compile(r'^sitemap-(\d+)\.xml$')
+
+XMLNS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+def shard_name(shard):
+    return f'sitemap-{shard}.xml'
+
+
+def shard_states():
+    """{shard: [product count, latest updated_at as ISO]} for every shard with products"""
+    rows = (
+        Product.objects
+        .annotate(shard=(F('id') - 1) / SHARD_SIZE)
+        .values('shard')
+        .annotate(products=Count('id'), latest=Max('updated_at'))
+        .order_by('shard')
+    )
+    return {row['shard']: [row['products'], row['latest'].isoformat()] for row in rows}
+
+
+def shard_urls(shard, base_url):
+    """(loc, lastmod) for each product in `shard`, read in id order with keyset queries"""
+    link = product_link_prefix(base_url)
+    last_id, end = shard * SHARD_SIZE, (shard + 1) * SHARD_SIZE
+    while True:
+        chunk = list(
+            Product.objects.filter(id__gt=last_id, id__lte=end)
+            .order_by('id')
+            .values_list('id', 'slug', 'updated_at')[:CHUNK_SIZE]
+        )
+        for _, slug, updated_at in chunk:
+            yield f'{link}{slug}/', updated_at.date().isoformat()
+        if len(chunk) < CHUNK_SIZE:
+            return
+        last_id = chunk[-1][0]
+
+
+def _write(path, lines):
+    """Write to a temporary file and move it into place, so readers never see half a file"""
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        f.writelines(lines)
+    os.replace(temporary, path)
+
+
+def _shard_lines(shard, base_url):
+    yield f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{XMLNS}">\n'
+    for loc, lastmod in shard_urls(shard, base_url):
+        yield f'<url><loc>{escape(loc)}</loc><lastmod>{lastmod}</lastmod></url>\n'
+    yield '</urlset>\n'
+
+
+def _index_lines(states, base_url):
+    yield f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{XMLNS}">\n'
+    for shard, (_, latest) in sorted(states.items()):
+        loc = base_url + reverse('product:sitemap_shard', args=[shard])
+        yield f'<sitemap><loc>{escape(loc)}</loc><lastmod>{latest}</lastmod></sitemap>\n'
+    yield '</sitemapindex>\n'
+
+
+def _read_manifest(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def build_sitemaps(base_url, root=None, force=False):
+    """
+    Bring the sitemap files in `root` (SITEMAP_ROOT by default) up to date.
+    Returns (shards written, shards in the index).
+    """
+    root = str(root or settings.SITEMAP_ROOT)
+    os.makedirs(root, exist_ok=True)
+    manifest_path = os.path.join(root, MANIFEST_NAME)
+    manifest = _read_manifest(manifest_path)
+    previous = {}
+    if not force and manifest.get('base_url') == base_url and manifest.get('shard_size') == SHARD_SIZE:
+        previous = {int(shard): state for shard, state in manifest.get('shards', {}).items()}
+
+    states = shard_states()
+    written = 0
+    for shard, state in states.items():
+        if previous.get(shard) != state:
+            _write(os.path.join(root, shard_name(shard)), _shard_lines(shard, base_url))
+            written += 1
+    for name in os.listdir(root):
+        match = SHARD_FILE.match(name)
+        if match and int(match.group(1)) not in states:
+            # Every product in it was deleted
+            os.remove(os.path.join(root, name))
+
+    _write(os.path.join(root, INDEX_NAME), _index_lines(states, base_url))
+    _write(manifest_path, [json.dumps({'base_url': base_url, 'shard_size': SHARD_SIZE, 'shards': states})])
+    return written, len(states)
@@ -0,0 +1,49 @@
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from core_ecommerce.taskqueue import task
+from product.models import Product
+from product.rankings import compute_rankings
+
+
+@task()
+def optimize_product_image(product_id, name):
+    """
+    Scale an uploaded product image down to PRODUCT_IMAGE_MAX_SIZE pixels on
+    its longer side, saved as a new file. Does nothing if the product's
+    image has been replaced since the upload.
+    """
+    if not Product.objects.filter(pk=product_id, image=name).exists():
+        return
+    max_size = settings.PRODUCT_IMAGE_MAX_SIZE
+    with default_storage.open(name) as f:
+        image = Image.open(f)
+        image.load()
+    image_format = image.format
+    if max(image.size) <= max_size or getattr(image, 'is_animated', False):
+        return
+
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_size, max_size))
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, **({'quality': 85, 'optimize': True} if image_format == 'JPEG' else {}))
+    new_name = default_storage.save(name, ContentFile(buffer.getvalue()))
+
+    with transaction.atomic():
+        product = Product.objects.select_for_update().filter(pk=product_id, image=name).first()
+        if product is not None:
+            product.image = new_name
+            # Saved normally, so caches showing the image are invalidated
+            product.save(update_fields=['image', 'updated_at'])
+    default_storage.delete(name if product is not None else new_name)
+
+
+@task(priority=-10)
+def refresh_rankings():
+    """compute_rankings() with its defaults, for a worker"""
+    compute_rankings()
@@ -0,0 +1,12 @@
+from django import template
+
+from product.cards import render_cards
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def product_card(product, variant='card'):
+    """Cached HTML of a product card; variant is 'card' or 'row' (see product/cards.py)"""
+    return render_cards([product], variant)[product.pk]
@@ -1,3 +1,751 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.template.loader import render_to_string
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core_ecommerce.testing import (
+    QueryBudgetMixin, make_category, make_customer, make_order, make_products,
+    make_reviews, make_vendor, reset_caches, set_cart,
+)
+from core_ecommerce.models import Cart, ChangeEvent, EventSubscriber, Order
+from core_ecommerce.routers import PIN_COOKIE
+from product.archival import purge_batch, purge_cutoff
+from product.cards import local_cards, render_cards
+from product.feeds import OUTPUT_COLUMNS
+from product.fuzzy import LocalVocabulary, TrigramIndex, build_search_terms, similarity, suggest, trigrams
+from product.listing import SORTS, encode_cursor, keyset_page
+from product.models import CategoryRanking, Product, ProductRanking, ProductReview, SearchTerm
+from product import search as search_module
+from product.rankings import RANKING_SORTS, compute_rankings
+from product.search import matching_ids, normalize_query, search_log
+from product.sitemaps import XMLNS as SITEMAP_XMLNS, build_sitemaps
+
+
+class ProductDetailQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.product = make_products(1)[0]
+        make_reviews(self.product, 1)
+        self.url = reverse('product:product_detail', args=[self.product.slug])
+
+    def grow(self):
+        make_reviews(self.product, 1000)
+        make_products(10, category=self.product.category)
+
+    def test_anonymous(self):
+        self.assertConstantQueries('product:product_detail', lambda: self.client.get(self.url), self.grow)
+
+    def test_customer(self):
+        customer = make_customer()
+        make_order(customer, [self.product], status='delivered')
+        self.client.force_login(customer)
+        self.assertConstantQueries('product:product_detail', lambda: self.client.get(self.url), self.grow)
+
+
+class CategoryQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.vendor = make_vendor()
+        self.client.force_login(self.vendor.user)
+        self.category = make_category()
+
+    def test_category_list(self):
+        def grow():
+            for _ in range(30):
+                make_category()
+
+        self.assertConstantQueries(
+            'product:category_list',
+            lambda: self.client.get(reverse('product:category_list')),
+            grow,
+        )
+
+    def test_category_forms(self):
+        self.assertWithinBudget(
+            'product:category_create',
+            lambda: self.client.get(reverse('product:category_create')),
+        )
+        self.assertWithinBudget(
+            'product:category_create',
+            lambda: self.client.post(reverse('product:category_create'), {'name': 'Books'}),
+        )
+        edit_url = reverse('product:category_edit', args=[self.category.pk])
+        self.assertWithinBudget('product:category_edit', lambda: self.client.get(edit_url))
+        self.assertWithinBudget('product:category_edit', lambda: self.client.post(edit_url, {'name': 'Music'}))
+
+    def test_category_delete(self):
+        self.assertWithinBudget(
+            'product:category_delete',
+            lambda: self.client.post(reverse('product:category_delete', args=[self.category.pk])),
+        )
+
+
+class ReviewQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.product = make_products(1)[0]
+        self.customer = make_customer()
+        make_order(self.customer, [self.product], status='delivered')
+        self.client.force_login(self.customer)
+
+    def test_add_review(self):
+        self.assertWithinBudget(
+            'product:add_review',
+            lambda: self.client.post(
+                reverse('product:add_review', args=[self.product.id]),
+                {'rating': 5, 'comment': 'Great'},
+            ),
+        )
+        self.assertTrue(ProductReview.objects.filter(user=self.customer).exists())
+
+    def test_edit_and_delete_review(self):
+        review = ProductReview.objects.create(product=self.product, user=self.customer, rating=3, comment='Fine')
+        edit_url = reverse('product:edit_review', args=[review.id])
+        self.assertWithinBudget('product:edit_review', lambda: self.client.get(edit_url))
+        self.assertWithinBudget(
+            'product:edit_review',
+            lambda: self.client.post(edit_url, {'rating': 4, 'comment': 'Better'}),
+        )
+        self.assertWithinBudget(
+            'product:delete_review',
+            lambda: self.client.post(reverse('product:delete_review', args=[review.id])),
+        )
+
+
+class ProductConditionalGetTests(TestCase):
+    def setUp(self):
+        self.product = make_products(2)[0]
+        self.url = reverse('product:product_detail', args=[self.product.slug])
+        # Validators read whatever database the page reads; keep that the primary
+        self.client.cookies[PIN_COOKIE] = '1'
+
+    def revalidate(self, response, **extra):
+        return self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'], **extra)
+
+    def test_current_copy_is_not_modified(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('Last-Modified', first)
+        with self.assertNumQueries(1):
+            response = self.revalidate(first)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_changes_make_the_page_modified(self):
+        changes = [
+            lambda: make_reviews(self.product, 1),
+            lambda: ProductReview.objects.filter(product=self.product).delete(),
+            lambda: self.product.save(),
+            lambda: self.product.category.save(),
+            lambda: make_products(1, category=self.product.category),
+        ]
+        for change in changes:
+            first = self.client.get(self.url)
+            change()
+            self.assertEqual(self.revalidate(first).status_code, 200)
+
+    def test_customers_always_get_the_full_page(self):
+        self.client.force_login(make_customer())
+        first = self.client.get(self.url)
+        self.assertNotIn('ETag', first)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='*').status_code, 200)
+
+    def test_missing_product(self):
+        url = reverse('product:product_detail', args=['no-such-product'])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='*').status_code, 404)
+
+
+class ProductCardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_cards.clear()
+        make_products(3)
+        self.products = list(Product.objects.select_related('category', 'vendor__user').order_by('id'))
+
+    def render(self, products, variant='card'):
+        with mock.patch('product.cards.render_to_string', wraps=render_to_string) as render:
+            html = render_cards(products, variant)
+        return html, render.call_count
+
+    def test_cards_are_rendered_once(self):
+        html, rendered = self.render(self.products)
+        self.assertEqual(rendered, 3)
+        product = self.products[0]
+        self.assertIn(product.name, html[product.pk])
+        self.assertIn(product.category.name, html[product.pk])
+        self.assertIn(product.vendor.business_name, html[product.pk])
+
+        self.assertEqual(self.render(self.products), (html, 0))
+        # Other workers find them in the shared cache
+        local_cards.clear()
+        self.assertEqual(self.render(self.products), (html, 0))
+
+    def test_changes_render_a_new_card(self):
+        self.render(self.products)
+        product = self.products[0]
+        product.category.name = 'Renamed'
+        product.category.save()
+        html, rendered = self.render(self.products)
+        self.assertEqual(rendered, 1)
+        self.assertIn('Renamed', html[product.pk])
+
+        product.vendor.save()
+        self.assertEqual(self.render(self.products)[1], 1)
+        # Shown for vendors without a business name
+        product.vendor.business_name = ''
+        product.vendor.save()
+        self.render(self.products)
+        product.vendor.user.username = 'renamed-vendor'
+        product.vendor.user.save()
+        html, rendered = self.render(self.products)
+        self.assertEqual(rendered, 1)
+        self.assertIn('renamed-vendor', html[product.pk])
+        product.price = 99
+        product.save()
+        html, rendered = self.render(self.products)
+        self.assertEqual(rendered, 1)
+        self.assertIn('$99', html[product.pk])
+
+    def test_variants_are_cached_separately(self):
+        self.render(self.products)
+        html, rendered = self.render(self.products, 'row')
+        self.assertEqual(rendered, 3)
+        self.assertNotIn(self.products[0].category.name, html[self.products[0].pk])
+
+
+class RankingTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.customer = make_customer()
+        self.books, self.games = make_category(), make_category()
+        self.old_hit, self.new_hit = make_products(2, category=self.books)
+        self.game, self.unsold = make_products(2, category=self.games)
+        self.client.cookies[PIN_COOKIE] = '1'
+
+    def sell(self, product, quantity, days_ago, status='delivered'):
+        order = make_order(self.customer, [product], status=status, quantity=quantity)
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+
+    def test_scores(self):
+        self.sell(self.old_hit, 10, days_ago=6)
+        self.sell(self.new_hit, 4, days_ago=0)
+        self.sell(self.game, 3, days_ago=3)
+        self.sell(self.game, 50, days_ago=3, status='cancelled')
+        self.sell(self.game, 50, days_ago=40)
+
+        self.assertEqual(compute_rankings(days=30, half_life_days=3), (3, 2))
+        scores = {
+            ranking.product_id: (ranking.category_id, ranking.bestseller_score, ranking.trending_score)
+            for ranking in ProductRanking.objects.all()
+        }
+        self.assertEqual(scores, {
+            self.old_hit.id: (self.books.id, 10, 2.5),
+            self.new_hit.id: (self.books.id, 4, 4.0),
+            self.game.id: (self.games.id, 3, 1.5),
+        })
+        self.assertEqual(
+            dict(CategoryRanking.objects.values_list('category_id', 'bestseller_score')),
+            {self.books.id: 14, self.games.id: 3},
+        )
+
+        # A rerun drops products that stopped selling
+        Order.objects.filter(items__product=self.new_hit).delete()
+        compute_rankings(days=30, half_life_days=3)
+        self.assertFalse(ProductRanking.objects.filter(product=self.new_hit).exists())
+
+    def test_home_sorts_by_popularity(self):
+        self.sell(self.old_hit, 10, days_ago=6)
+        self.sell(self.new_hit, 4, days_ago=0)
+        self.sell(self.game, 30, days_ago=0)
+        compute_rankings(days=30, half_life_days=3)
+        url = reverse('core_ecommerce:home')
+
+        def order(sort):
+            rows = self.client.get(url, {'sort': sort}).context['category_rows']
+            return [[product.id for product in row['products']] for row in rows]
+
+        self.assertEqual(order('bestsellers'), [
+            [self.game.id, self.unsold.id], [self.old_hit.id, self.new_hit.id],
+        ])
+        self.assertEqual(order('trending')[1], [self.new_hit.id, self.old_hit.id])
+        self.assertWithinBudget('core_ecommerce:home', lambda: self.client.get(url, {'sort': 'trending'}))
+
+
+class KeysetListingTests(TestCase):
+    def setUp(self):
+        self.category = make_category()
+        prices = ['5.00', '9.00', '5.00', '12.00', '9.00', '5.00', '7.00']
+        self.products = [
+            make_products(1, category=self.category, price=Decimal(price))[0] for price in prices
+        ]
+        # Ties in every sort, so the id has to break them
+        Product.objects.filter(pk__in=[p.pk for p in self.products[:3]]).update(
+            created_at=self.products[0].created_at,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            for product, rating in zip(self.products, [4, 2, 4, 5]):
+                ProductReview.objects.create(product=product, user=make_customer(), rating=rating, comment='Ok')
+        customer = make_customer()
+        for product, quantity in zip(self.products[2:5], [3, 3, 8]):
+            make_order(customer, [product], status='delivered', quantity=quantity)
+        compute_rankings()
+
+    def expected(self, sort):
+        products = list(Product.objects.select_related('ranking'))
+
+        def ranked(name):
+            # Highest score first, ties by id; then the unranked products, newest first
+            def key(p):
+                ranking = getattr(p, 'ranking', None)
+                if ranking is None:
+                    return (1, -p.created_at.timestamp(), -p.id)
+                return (0, -getattr(ranking, name), p.id)
+            return key
+
+        keys = {
+            'newest': lambda p: (p.created_at, p.id),
+            'price': lambda p: (p.price, p.id),
+            'price_desc': lambda p: (p.price, p.id),
+            'rating': lambda p: (p.average_rating, p.id),
+        }
+        if sort in RANKING_SORTS:
+            return [p.id for p in sorted(products, key=ranked(RANKING_SORTS[sort]))]
+        return [p.id for p in sorted(products, key=keys[sort], reverse=sort != 'price')]
+
+    def walk(self, sort, per_page=3):
+        pages = [keyset_page(Product.objects.all(), sort, None, per_page)]
+        while pages[-1].has_next():
+            pages.append(keyset_page(Product.objects.all(), sort, pages[-1].next_cursor, per_page))
+        return pages
+
+    def test_every_sort_pages_through_all_products_in_order(self):
+        for sort in SORTS:
+            with self.subTest(sort=sort):
+                pages = self.walk(sort)
+                self.assertEqual([p.id for page in pages for p in page], self.expected(sort))
+                self.assertEqual([len(page) for page in pages], [3, 3, 1])
+                self.assertFalse(pages[0].has_previous())
+
+    def test_previous_cursor_returns_the_same_page(self):
+        for sort in SORTS:
+            with self.subTest(sort=sort):
+                pages = self.walk(sort)
+                for earlier, later in zip(pages, pages[1:]):
+                    back = keyset_page(Product.objects.all(), sort, later.previous_cursor, 3)
+                    self.assertEqual(list(back), list(earlier))
+                    self.assertEqual(back.has_previous(), earlier.has_previous())
+                    self.assertEqual(back.next_cursor, earlier.next_cursor)
+
+    def test_bad_cursors_give_the_first_page(self):
+        first = list(keyset_page(Product.objects.all(), 'price', None, 3))
+        other_sort = self.walk('newest')[0].next_cursor
+        for cursor in ['garbage', 'e30', other_sort, encode_cursor('price', 'next', ['x', 1])]:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(list(keyset_page(Product.objects.all(), 'price', cursor, 3)), first)
+
+    def test_reviews_update_average_rating(self):
+        product = self.products[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            review = ProductReview.objects.create(product=product, user=make_customer(), rating=1, comment='Meh')
+        product.refresh_from_db()
+        self.assertEqual(product.average_rating, 2.5)
+        with self.captureOnCommitCallbacks(execute=True):
+            review.delete()
+        product.refresh_from_db()
+        self.assertEqual(product.average_rating, 4.0)
+
+    def rating_updates(self, change):
+        """How many times `change()` recomputes product ratings once it commits"""
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+        return sum('"average_rating"' in query['sql'] and query['sql'].startswith('UPDATE') for query in queries)
+
+    def test_cascaded_review_deletes_recompute_each_product_once(self):
+        reviewer = make_customer()
+        ProductReview.objects.bulk_create([
+            ProductReview(product=product, user=reviewer, rating=1, comment='No')
+            for product in self.products[:2] for _ in range(3)
+        ])
+        self.assertEqual(self.rating_updates(reviewer.delete), 1)
+        self.assertEqual(self.rating_updates(self.products[0].delete), 0)
+
+    def test_home_sort_and_cursor(self):
+        self.client.cookies[PIN_COOKIE] = '1'
+        url = reverse('core_ecommerce:home')
+        response = self.client.get(url, {'sort': 'price'})
+        page = response.context['category_rows'][0]['products']
+        self.assertEqual([p.id for p in page], self.expected('price')[:12])
+        self.assertContains(response, 'value="price" selected')
+
+
+class SearchCacheTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        search_log.reset()
+        self.category = make_category()
+        self.shoes = make_products(2, category=self.category)
+        for product, name in zip(self.shoes, ['Red Shoes', 'Blue Shoes']):
+            product.name = name
+            product.save()
+        self.client.force_login(make_customer())
+        self.client.cookies[PIN_COOKIE] = '1'
+
+    def search(self, query, **params):
+        response = self.client.get(reverse('core_ecommerce:home'), {'q': query, **params})
+        return sorted(p.id for row in response.context['category_rows'] for p in row['products'])
+
+    def test_normalize_query(self):
+        self.assertEqual(normalize_query('  Red \t SHOES\n'), 'red shoes')
+        self.assertEqual(normalize_query('Straße'), 'strasse')
+
+    def test_equivalent_queries_share_an_entry(self):
+        with mock.patch('product.search._matching_ids', wraps=search_module._matching_ids) as compute:
+            self.assertEqual(self.search('Red  Shoes'), [self.shoes[0].id])
+            self.assertEqual(self.search(' red shoes '), [self.shoes[0].id])
+            self.assertEqual(compute.call_count, 1)
+            # The category filter is part of the key
+            self.assertEqual(self.search('red shoes', category=self.category.slug), [self.shoes[0].id])
+            self.assertEqual(compute.call_count, 2)
+
+    def test_product_changes_clear_the_cache(self):
+        self.assertEqual(self.search('shoes'), [p.id for p in self.shoes])
+        boots = make_products(1, category=self.category)[0]
+        boots.name = 'Snow Shoes'
+        with self.captureOnCommitCallbacks(execute=True):
+            boots.save()
+        self.assertEqual(self.search('shoes'), sorted([boots.id] + [p.id for p in self.shoes]))
+
+    def test_broad_queries_are_not_cached(self):
+        with mock.patch('product.search.SEARCH_MAX_CACHED_IDS', 1):
+            self.assertIsNone(matching_ids('shoes'))
+            self.assertEqual(self.search('shoes'), [p.id for p in self.shoes])
+
+    def test_query_frequency(self):
+        for query in ['Shoes', 'shoes', 'red shoes', 'SHOES']:
+            self.search(query)
+        self.assertEqual(search_log.totals(), (4, [('shoes', 3), ('red shoes', 1)]))
+        out = StringIO()
+        call_command('search_stats', stdout=out)
+        self.assertIn('1 queries cover 50% of searches', out.getvalue())
+        self.assertIn('2 queries cover 95% of searches', out.getvalue())
+
+
+@override_settings(SEARCH_VOCABULARY_RELOAD_SECONDS=0)
+class FuzzySearchTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        names = ['Red Shoes', 'Leather Wallet', 'Red Wallet', 'Wooden Chair']
+        self.products = make_products(len(names))
+        with self.captureOnCommitCallbacks(execute=True):
+            for product, name in zip(self.products, names):
+                product.name = name
+                product.save()
+
+    def test_similarity_matches_pg_trgm(self):
+        self.assertEqual(trigrams('cat'), {'  c', ' ca', 'cat', 'at '})
+        self.assertAlmostEqual(similarity('word', 'words'), 4 / 7)
+        self.assertEqual(similarity('shoes', 'shoes'), 1.0)
+
+    def test_closest_term(self):
+        index = TrigramIndex([('shoes', 5), ('shirt', 50), ('chair', 1)])
+        self.assertEqual(index.closest('shoez'), 'shoes')
+        self.assertEqual(index.closest('chai'), 'chair')
+        self.assertIsNone(index.closest('xylophone'))
+        # Equally similar: the more used term wins
+        self.assertEqual(TrigramIndex([('cart', 1), ('card', 9)]).closest('car'), 'card')
+
+    def test_vocabulary_follows_product_names(self):
+        # Saves only add new words; counts are refreshed by a rebuild
+        self.assertEqual(
+            dict(SearchTerm.objects.values_list('word', 'product_count')),
+            {'product': 1, 'red': 1, 'shoes': 1, 'leather': 1, 'wallet': 1, 'wooden': 1, 'chair': 1},
+        )
+        self.assertEqual(build_search_terms(), 6)
+        self.assertEqual(SearchTerm.objects.get(word='red').product_count, 2)
+        self.assertEqual(SearchTerm.objects.get(word='wallet').product_count, 2)
+
+    def test_suggest(self):
+        self.assertEqual(suggest('red shoez'), 'red shoes')
+        self.assertEqual(suggest('lether walet'), 'leather wallet')
+        self.assertIsNone(suggest('red shoes'))
+        self.assertIsNone(suggest('zz qqqqq'))
+        product = self.products[3]
+        product.name = 'Wooden Bookshelf'
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertEqual(suggest('bookshelv'), 'bookshelf')
+
+    def test_vocabulary_reloads_are_debounced(self):
+        vocabulary = LocalVocabulary()
+        self.assertNotIn('bookshelf', vocabulary.index())
+        product = self.products[3]
+        product.name = 'Wooden Bookshelf'
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        with self.settings(SEARCH_VOCABULARY_RELOAD_SECONDS=60), self.assertNumQueries(0):
+            self.assertNotIn('bookshelf', vocabulary.index())
+        self.assertIn('bookshelf', vocabulary.index())
+
+    def test_home_shows_corrected_results(self):
+        self.client.force_login(make_customer())
+        self.client.cookies[PIN_COOKIE] = '1'
+        response = self.client.get(reverse('core_ecommerce:home'), {'q': 'Leather  Walet'})
+        self.assertEqual(response.context['suggestion'], 'leather wallet')
+        rows = response.context['category_rows']
+        self.assertEqual([p.id for row in rows for p in row['products']], [self.products[1].id])
+        self.assertContains(response, 'Showing results for')
+
+        response = self.client.get(reverse('core_ecommerce:home'), {'q': 'wallet'})
+        self.assertIsNone(response.context['suggestion'])
+
+
+class CatalogFeedTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.products = make_products(3)
+        self.products[0].name = 'Salt & Pepper <Set>'
+        self.products[0].save()
+        self.url = reverse('product:catalog_feed')
+        EventSubscriber.objects.create(name='partner', url='https://partner.example/hooks', secret='s3cret')
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer s3cret'
+        # Check the token against the primary, which has the subscriber
+        self.client.cookies[PIN_COOKIE] = '1'
+
+    def download(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_csv(self):
+        rows = list(csv.DictReader(StringIO(self.download().decode())))
+        self.assertEqual([int(row['id']) for row in rows], [p.id for p in self.products])
+        self.assertEqual(list(rows[0]), OUTPUT_COLUMNS)
+        product = self.products[1]
+        self.assertEqual(rows[1]['link'], f'http://testserver/product/{product.slug}/')
+        self.assertEqual(rows[1]['image_link'], 'http://testserver/media/products/seed.png')
+        self.assertEqual(rows[1]['vendor'], product.vendor.business_name)
+        self.assertEqual(rows[1]['price'], '10.00')
+
+    def test_jsonl_and_xml(self):
+        lines = self.download(format='jsonl').decode().splitlines()
+        self.assertEqual(json.loads(lines[0])['name'], 'Salt & Pepper <Set>')
+        root = ElementTree.fromstring(self.download(format='xml'))
+        self.assertEqual(root.tag, 'products')
+        self.assertEqual([item.findtext('name') for item in root][0], 'Salt & Pepper <Set>')
+        self.assertEqual(len(root), 3)
+
+    def test_gzip(self):
+        response = self.client.get(self.url, {'format': 'jsonl', 'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('catalog.jsonl.gz', response['Content-Disposition'])
+        compressed = b''.join(response.streaming_content)
+        self.assertEqual(gzip.decompress(compressed), self.download(format='jsonl'))
+
+    def test_changed_since(self):
+        Product.objects.exclude(pk=self.products[2].pk).update(updated_at=timezone.now() - timedelta(days=3))
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+        response = self.client.get(self.url, {'since': since})
+        self.assertIn('X-Feed-Started-At', response)
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([int(row['id']) for row in rows], [self.products[2].id])
+        self.assertEqual(self.client.get(self.url, {'since': 'yesterday'}).status_code, 400)
+
+    def test_partner_token_is_required(self):
+        EventSubscriber.objects.filter(is_active=True).update(is_active=False)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        EventSubscriber.objects.update(is_active=True)
+        for authorization in ('', 'Bearer wrong', 's3cret'):
+            with self.subTest(authorization=authorization):
+                response = self.client.get(self.url, headers={'Authorization': authorization})
+                self.assertEqual(response.status_code, 401)
+                self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+
+    def test_queries_do_not_grow_with_the_catalog(self):
+        self.assertConstantQueries('product:catalog_feed', lambda: self.client.get(self.url), lambda: make_products(30))
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'feed.xml.gz')
+            out = StringIO()
+            call_command('export_catalog_feed', format='xml', gzip=True, output=output, stdout=out)
+            with gzip.open(output) as f:
+                root = ElementTree.parse(f).getroot()
+        self.assertEqual(len(root), 3)
+        self.assertIn('Successfully wrote the catalog feed', out.getvalue())
+        self.assertEqual(root[0].findtext('link'), f'http://localhost:8000/product/{self.products[0].slug}/')
+
+
+@mock.patch('product.sitemaps.SHARD_SIZE', 2)
+class SitemapTests(TestCase):
+    def setUp(self):
+        self.products = make_products(5)
+        self.root = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(self.settings(SITEMAP_ROOT=self.root))
+
+    def build(self):
+        return build_sitemaps('https://shop.example')
+
+    def shards(self):
+        return sorted({(product.id - 1) // 2 for product in Product.objects.all()})
+
+    def urls(self, name):
+        root = ElementTree.parse(os.path.join(self.root, name)).getroot()
+        return [element.text for element in root.iter(f'{{{SITEMAP_XMLNS}}}loc')]
+
+    def test_index_and_shards(self):
+        shards = self.shards()
+        self.assertEqual(self.build(), (len(shards), len(shards)))
+        self.assertEqual(
+            self.urls('sitemap.xml'),
+            [f'https://shop.example/sitemap-{shard}.xml' for shard in shards],
+        )
+        listed = [url for shard in shards for url in self.urls(f'sitemap-{shard}.xml')]
+        self.assertEqual(listed, [f'https://shop.example/product/{p.slug}/' for p in self.products])
+
+    def test_only_changed_shards_are_rewritten(self):
+        self.build()
+        self.assertEqual(self.build()[0], 0)
+        product = self.products[2]
+        product.name = 'Renamed'
+        product.save()
+        self.assertEqual(self.build()[0], 1)
+        self.assertEqual(self.build()[0], 0)
+        # A different host changes every URL
+        self.assertEqual(build_sitemaps('https://other.example')[0], len(self.shards()))
+
+    def test_emptied_shards_are_removed(self):
+        self.build()
+        last = self.products[-1]
+        shard = (last.id - 1) // 2
+        Product.objects.filter(id__gt=shard * 2).delete()
+        self.build()
+        self.assertFalse(os.path.exists(os.path.join(self.root, f'sitemap-{shard}.xml')))
+        self.assertNotIn(f'https://shop.example/sitemap-{shard}.xml', self.urls('sitemap.xml'))
+
+    def test_served_from_the_site_root(self):
+        self.assertEqual(self.client.get('/sitemap.xml').status_code, 404)
+        self.build()
+        response = self.client.get(reverse('product:sitemap_index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'<sitemapindex', b''.join(response.streaming_content))
+        shard = self.shards()[0]
+        self.assertEqual(self.client.get(reverse('product:sitemap_shard', args=[shard])).status_code, 200)
+        self.assertEqual(self.client.get(reverse('product:sitemap_shard', args=[shard + 100])).status_code, 404)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('build_sitemaps', base_url='https://shop.example/', stdout=out)
+        self.assertIn(f'Successfully wrote {len(self.shards())} of', out.getvalue())
+
+
+class ProductArchivalTests(TestCase):
+    def setUp(self):
+        self.products = make_products(3)
+        self.archived = self.products[0]
+        # Read listings from the primary, which has the archival
+        self.client.cookies[PIN_COOKIE] = '1'
+
+    def archive(self, product):
+        return Product.objects.filter(pk=product.pk).archive()
+
+    def test_archived_products_are_not_listed_or_sold(self):
+        self.archive(self.archived)
+        self.assertEqual(set(Product.objects.all()), set(self.products[1:]))
+        self.assertEqual(Product.all_objects.count(), 3)
+        response = self.client.get(reverse('core_ecommerce:home'))
+        self.assertNotContains(response, self.archived.name)
+        self.assertEqual(self.client.get(reverse('product:product_detail', args=[self.archived.slug])).status_code, 404)
+        self.assertEqual(
+            self.client.post(reverse('core_ecommerce:add_to_cart', args=[self.archived.id])).status_code, 404,
+        )
+
+    def test_cart_skips_archived_lines_until_restored(self):
+        self.client.force_login(make_customer())
+        set_cart(self.client, self.products[:2])
+        self.archive(self.archived)
+        response = self.client.get(reverse('core_ecommerce:cart'))
+        self.assertEqual([item['product'] for item in response.context['cart_items']], [self.products[1]])
+        self.assertEqual(Cart.objects.get().item_count, 1)
+
+        Product.all_objects.filter(pk=self.archived.pk).unarchive()
+        self.client.get(reverse('core_ecommerce:cart'))
+        self.assertEqual(Cart.objects.get().item_count, 2)
+
+    def test_bulk_archive_records_events(self):
+        self.assertEqual(Product.objects.all().archive(), 3)
+        self.assertEqual(Product.objects.all().archive(), 0)
+        archived = Product.all_objects.get(pk=self.archived.pk)
+        self.assertFalse(archived.is_active)
+        self.assertIsNotNone(archived.archived_at)
+        self.assertEqual(ChangeEvent.objects.filter(topic='product.archived').count(), 3)
+
+        self.assertEqual(Product.all_objects.filter(pk=self.archived.pk).unarchive(), 1)
+        restored = Product.objects.get(pk=self.archived.pk)
+        self.assertIsNone(restored.archived_at)
+        self.assertEqual(ChangeEvent.objects.filter(topic='product.unarchived').get().object_id, str(restored.pk))
+
+    def test_incremental_feed_reports_archived_products(self):
+        EventSubscriber.objects.create(name='partner', url='https://partner.example/hooks', secret='s3cret')
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer s3cret'
+        self.archive(self.archived)
+        rows = list(csv.DictReader(StringIO(b''.join(
+            self.client.get(reverse('product:catalog_feed')).streaming_content
+        ).decode())))
+        self.assertNotIn(str(self.archived.id), [row['id'] for row in rows])
+        since = (timezone.now() - timedelta(minutes=1)).isoformat()
+        rows = list(csv.DictReader(StringIO(b''.join(
+            self.client.get(reverse('product:catalog_feed'), {'since': since}).streaming_content
+        ).decode())))
+        self.assertEqual({row['id']: row['active'] for row in rows}[str(self.archived.id)], 'False')
+
+    def test_purge_keeps_ordered_and_recent_products(self):
+        ordered, recent = self.products[1], self.products[2]
+        make_order(make_customer(), [ordered])
+        make_reviews(self.archived, 2)
+        Product.objects.all().archive()
+        Product.all_objects.exclude(pk=recent.pk).update(archived_at=timezone.now() - timedelta(days=100))
+
+        self.assertEqual(purge_batch(purge_cutoff(90), batch_size=1), 1)
+        self.assertEqual(purge_batch(purge_cutoff(90), batch_size=1), 0)
+        self.assertEqual(set(Product.all_objects.all()), {ordered, recent})
+        self.assertFalse(ProductReview.objects.exists())
+        self.assertEqual(ChangeEvent.objects.filter(topic='product.deleted').get().object_id, str(self.archived.pk))
+
+    def test_purge_keeps_images_other_products_use(self):
+        Product.all_objects.filter(pk=self.products[1].pk).update(image='products/other.png')
+        Product.all_objects.filter(pk__in=[self.archived.pk, self.products[1].pk]).archive()
+        Product.all_objects.update(archived_at=timezone.now() - timedelta(days=100))
+        with mock.patch('product.archival.default_storage.delete') as delete:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(purge_batch(purge_cutoff(90)), 2)
+        # products/seed.png is still the image of the product left on sale
+        delete.assert_called_once_with('products/other.png')
+
+    def test_archiving_purges_cached_pages_once_committed(self):
+        url = reverse('product:product_detail', args=[self.archived.slug])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.archive(self.archived)
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_purge_command(self):
+        Product.objects.all().archive()
+        Product.all_objects.update(archived_at=timezone.now() - timedelta(days=100))
+        out = StringIO()
+        call_command('purge_archived_products', '--batch-size', '2', stdout=out)
+        self.assertIn('Successfully purged 3 products!', out.getvalue())
+        self.assertFalse(Product.all_objects.exists())
@@ -8,6 +8,8 @@ from .views import (
     AddReviewView,
     EditReviewView,
     DeleteReviewView,
+    CatalogFeedView,
+    SitemapView,
 )
 
 app_name = 'product'
@@ -20,5 +22,8 @@ urlpatterns = [
     path('product/<int:product_id>/review/add/', AddReviewView.as_view(), name='add_review'),
     path('review/<int:review_id>/edit/', EditReviewView.as_view(), name='edit_review'),
     path('review/<int:review_id>/delete/', DeleteReviewView.as_view(), name='delete_review'),
+    path('feeds/catalog/', CatalogFeedView.as_view(), name='catalog_feed'),
+    path('sitemap.xml', SitemapView.as_view(), name='sitemap_index'),
+    path('sitemap-<int:shard>.xml', SitemapView.as_view(), name='sitemap_shard'),
 ]
 
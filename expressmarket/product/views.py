@@ -1,39 +1,98 @@
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
+from django.http import Http404, HttpResponse, HttpResponseBadRequest
 from django.views import View
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.db.models import Avg, Count
+from django.db.models import Avg, Count, Max, OuterRef, Subquery
+from django.views.static import serve
 from product.models import Product, Category, ProductReview
 from product.forms import CategoryForm, ReviewForm
 from core_ecommerce.models import Order, OrderItem
+from core_ecommerce.caching import category_list_cache, get_categories, product_detail_cache
+from core_ecommerce.conditional import ConditionalGetMixin
+from core_ecommerce.pagecache import AnonymousPageCacheMixin
+from core_ecommerce.exports import EXPORT_FORMATS, streaming_response
+from product.feeds import FEED_STARTED_HEADER, feed_lines, feed_partner, feed_started, parse_since
+from product.sitemaps import INDEX_NAME, shard_name
 
 
-class ProductDetailView(View):
+def product_detail_payload(slug):
+    """The cacheable part of the product page, or None if there is no such product"""
+    product = Product.objects.select_related('category', 'vendor__user').filter(slug=slug).first()
+    if product is None:
+        return None
+    
+    # Get related products from the same category
+    related_products = list(
+        Product.objects.filter(category=product.category).exclude(id=product.id)
+        .select_related('category', 'vendor__user')[:4]
+    )
+    
+    # Calculate average rating
+    rating_stats = ProductReview.objects.filter(product=product).aggregate(
+        avg_rating=Avg('rating'),
+        total_reviews=Count('id')
+    )
+    # Convert avg_rating to int for star display
+    if rating_stats['avg_rating']:
+        rating_stats['avg_rating_int'] = int(round(rating_stats['avg_rating']))
+    else:
+        rating_stats['avg_rating_int'] = 0
+    
+    return {
+        'product': product,
+        'related_products': related_products,
+        'rating_stats': rating_stats,
+    }
+
+
+def product_page_validators(slug):
+    """
+    (version, last_modified) of everything the product page shows, from one
+    query: the product, its category, its reviews and the category's other
+    products. None if there is no such product.
+    """
+    in_category = Product.objects.filter(category=OuterRef('category_id')).order_by()
+    row = Product.objects.filter(slug=slug).annotate(
+        reviews_updated=Max('productreview__updated_at'),
+        reviews=Count('productreview'),
+        related_updated=Subquery(in_category.order_by('-updated_at').values('updated_at')[:1]),
+        related=Subquery(in_category.values('category_id').annotate(count=Count('id')).values('count')),
+    ).values_list(
+        'updated_at', 'category__updated_at', 'reviews_updated', 'reviews', 'related_updated', 'related',
+    ).first()
+    if row is None:
+        return None
+    return row, max(value for value in row if hasattr(value, 'timestamp'))
+
+
+class ProductDetailView(ConditionalGetMixin, AnonymousPageCacheMixin, View):
     template_name = 'product/detail.html'
+    read_from_replica = True
+
+    def get_validators(self, request, slug):
+        if request.user.is_authenticated and not request.user.is_vendor:
+            # Customers see their own purchase and review state
+            return None
+        return product_page_validators(slug)
 
     def get(self, request, slug):
-        product = get_object_or_404(Product, slug=slug)
-        # Get related products from the same category
-        related_products = Product.objects.filter(
-            category=product.category
-        ).exclude(id=product.id)[:4]
+        payload = product_detail_cache.get(slug, compute=lambda: product_detail_payload(slug))
+        if payload is None:
+            raise Http404('No product matches the given query.')
+        product = payload['product']
+        related_products = payload['related_products']
+        self.cache_tags = [
+            f'product:{product.pk}', f'category:{product.category_id}', f'vendor:{product.vendor_id}',
+        ]
+        rating_stats = payload['rating_stats']
         
         # Get reviews for this product
         reviews = ProductReview.objects.filter(product=product).select_related('user').order_by('-created_at')
         
-        # Calculate average rating
-        rating_stats = reviews.aggregate(
-            avg_rating=Avg('rating'),
-            total_reviews=Count('id')
-        )
-        # Convert avg_rating to int for star display
-        if rating_stats['avg_rating']:
-            rating_stats['avg_rating_int'] = int(round(rating_stats['avg_rating']))
-        else:
-            rating_stats['avg_rating_int'] = 0
-        
         # Check if user has purchased this product (for review eligibility)
         can_review = False
         user_review = None
@@ -74,12 +133,17 @@ class ProductDetailView(View):
 
 
 @method_decorator(login_required, name='dispatch')
-class CategoryListView(View):
+class CategoryListView(ConditionalGetMixin, View):
     """List all categories"""
     template_name = 'product/category_list.html'
+    read_from_replica = True
+    
+    def get_validators(self, request):
+        # The list comes from the category cache, whose generation moves on every change
+        return category_list_cache.generation(), None
     
     def get(self, request):
-        categories = Category.objects.all().order_by('name')
+        categories = get_categories()
         
         # Pagination
         paginator = Paginator(categories, 20)  # Show 20 categories per page
@@ -184,8 +248,8 @@ class CategoryDeleteView(View):
         category = get_object_or_404(Category, pk=pk)
         category_name = category.name
         
-        # Check if category has products
-        product_count = Product.objects.filter(category=category).count()
+        # Check if category has products; archived ones would be deleted with it too
+        product_count = Product.all_objects.filter(category=category).count()
         if product_count > 0:
             messages.error(
                 request, 
@@ -302,3 +366,50 @@ class DeleteReviewView(View):
         review.delete()
         messages.success(request, 'Your review has been deleted successfully!')
         return redirect('product:product_detail', slug=product_slug)
+
+
+class CatalogFeedView(View):
+    """
+    The catalog as a CSV, JSON Lines or XML download for partners:
+    ?format=csv|jsonl|xml, ?gzip=1 to compress it, ?since=<ISO date or
+    datetime> for only the products changed since then. Needs a partner's
+    subscriber secret as a bearer token.
+    """
+    read_from_replica = True
+    
+    def get(self, request):
+        if feed_partner(request) is None:
+            response = HttpResponse('A partner token is required.', status=401, content_type='text/plain')
+            response['WWW-Authenticate'] = 'Bearer'
+            return response
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            export_format = 'csv'
+        try:
+            since = parse_since(request.GET.get('since', ''))
+        except ValueError as error:
+            return HttpResponseBadRequest(str(error))
+        
+        started = feed_started()
+        lines = feed_lines(
+            export_format,
+            request.build_absolute_uri('/').rstrip('/'),
+            request.build_absolute_uri(settings.MEDIA_URL),
+            since,
+        )
+        response = streaming_response(lines, export_format, 'catalog', compress=request.GET.get('gzip') == '1')
+        response[FEED_STARTED_HEADER] = started.isoformat()
+        return response
+
+
+class SitemapView(View):
+    """
+    Serve the sitemap files written by `manage.py build_sitemaps` from the
+    site root, where search engines accept them for every page. A web
+    server in front can serve SITEMAP_ROOT directly instead.
+    """
+    
+    def get(self, request, shard=None):
+        name = INDEX_NAME if shard is None else shard_name(shard)
+        # Handles If-Modified-Since and 404s for missing files
+        return serve(request, name, document_root=settings.SITEMAP_ROOT)